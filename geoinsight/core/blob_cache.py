@@ -0,0 +1,177 @@
+import hashlib
+import os
+from pathlib import Path
+import shutil
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.fields.files import FieldFile
+from filelock import FileLock, Timeout
+
+from geoinsight.core.tile_cache import get_stat, get_stats_cache, increment_stat
+
+BLOB_STAT_KEYS = ['blob_hits', 'blob_misses', 'blob_downloaded_bytes', 'blob_evictions']
+# Object keys are never reused for new content, so ETags may be remembered briefly per process
+BLOB_ETAG_TIMEOUT = 60
+# Blobs used more recently than this are never evicted, since a reader may be about to open them
+BLOB_MIN_AGE = 60
+# Partial downloads untouched for this long were abandoned, e.g. by a killed worker
+BLOB_ABANDONED_AGE = 60 * 60 * 24
+COPY_BUFFER_SIZE = 8 * 1024 * 1024
+
+
+def get_blob_cache_dir() -> Path:
+    return Path(settings.BLOB_CACHE_DIR)
+
+
+def get_blob_etag(field_file: FieldFile) -> str:
+    storage = field_file.storage
+    name = field_file.name
+    key = f'blob_etag:{storage.__class__.__name__}:{name}'
+    etag = cache.get(key)
+    if etag is not None:
+        return etag
+
+    if hasattr(storage, 'client') and hasattr(storage, 'bucket_name'):
+        # django-minio-storage
+        etag = storage.client.stat_object(storage.bucket_name, name).etag
+    elif hasattr(storage, 'bucket'):
+        # django-storages S3Boto3Storage
+        etag = storage.bucket.Object(name).e_tag
+    else:
+        # Other storages, e.g. the file system, are versioned by size and modification time
+        etag = f'{storage.size(name)}-{storage.get_modified_time(name).timestamp()}'
+    etag = etag.strip('"')
+    cache.set(key, etag, timeout=BLOB_ETAG_TIMEOUT)
+    return etag
+
+
+def get_lock_path(blob_dir: Path) -> Path:
+    return blob_dir.with_name(f'{blob_dir.name}.lock')
+
+
+def get_blob_path(field_file: FieldFile) -> Path:
+    """Return a local copy of the field file contents, downloading it on first use."""
+    digest = hashlib.sha256(f'{field_file.name}:{get_blob_etag(field_file)}'.encode()).hexdigest()
+    blob_dir = get_blob_cache_dir() / digest
+    # Keep the original file name, since readers may derive names and formats from it
+    path = blob_dir / Path(field_file.name).name
+
+    if path.exists():
+        try:
+            # Record the read in the file modification time, used for eviction
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted since it was found, so it is downloaded again
+            pass
+        else:
+            increment_stat('blob_hits')
+            return path
+
+    get_blob_cache_dir().mkdir(parents=True, exist_ok=True)
+    # Only one process downloads a blob; the others wait for it and then read the same copy.
+    # The blob directory is only created under the lock, so it cannot be evicted meanwhile.
+    with FileLock(get_lock_path(blob_dir)):
+        blob_dir.mkdir(exist_ok=True)
+        if path.exists():
+            increment_stat('blob_hits')
+            os.utime(path)
+            return path
+
+        # Lock files are removed with evicted blobs, so two processes may rarely download
+        # the same blob at once; each writes its own partial file, so their copies never mix
+        partial_path = blob_dir / f'{path.name}.{uuid.uuid4().hex}.partial'
+        with field_file.open('rb') as source, open(partial_path, 'wb') as destination:
+            shutil.copyfileobj(source, destination, COPY_BUFFER_SIZE)
+        # Readers never see a partially written file
+        os.replace(partial_path, path)
+        increment_stat('blob_misses')
+        increment_stat('blob_downloaded_bytes', path.stat().st_size)
+
+    evict_blobs(keep=blob_dir)
+    return path
+
+
+def get_blob_dir_usage(blob_dir: Path) -> tuple[int, float, bool] | None:
+    """Return the size, last use and whether a blob directory holds a finished download."""
+    try:
+        files = [(f.name, f.stat()) for f in blob_dir.iterdir()]
+        # New directories have no files yet, so their own modification time counts as a use
+        last_used = blob_dir.stat().st_mtime
+    except FileNotFoundError:
+        return None
+    return (
+        sum(stat.st_size for _, stat in files),
+        max([last_used, *[stat.st_mtime for _, stat in files]]),
+        any(not name.endswith('.partial') for name, _ in files),
+    )
+
+
+def get_blob_cache_entries() -> list[tuple[Path, int, float, bool]]:
+    entries = []
+    cache_dir = get_blob_cache_dir()
+    if not cache_dir.exists():
+        return entries
+    for blob_dir in cache_dir.iterdir():
+        if not blob_dir.is_dir():
+            continue
+        usage = get_blob_dir_usage(blob_dir)
+        if usage is not None:
+            entries.append((blob_dir, *usage))
+    return entries
+
+
+def evict_blobs(
+    max_size: int | None = None, keep: Path | None = None, min_age: float = BLOB_MIN_AGE
+) -> int:
+    """Remove the least recently used blobs until the cache fits in max_size bytes."""
+    if max_size is None:
+        max_size = settings.BLOB_CACHE_MAX_SIZE
+    entries = get_blob_cache_entries()
+    total_size = sum(size for _, size, _, _ in entries)
+    evicted = 0
+    for blob_dir, size, last_used, finished in sorted(entries, key=lambda entry: entry[2]):
+        if total_size <= max_size:
+            break
+        # Downloads in progress are never evicted, unless they were abandoned long ago
+        if not finished and time.time() - last_used < BLOB_ABANDONED_AGE:
+            continue
+        if blob_dir == keep or time.time() - last_used < min_age:
+            continue
+        # Skip blobs which are being downloaded by another process
+        lock_path = get_lock_path(blob_dir)
+        try:
+            with FileLock(lock_path, timeout=0):
+                # The blob may have been read since the cache was listed
+                usage = get_blob_dir_usage(blob_dir)
+                if usage is not None and time.time() - usage[1] < min_age:
+                    continue
+                shutil.rmtree(blob_dir, ignore_errors=True)
+                lock_path.unlink(missing_ok=True)
+        except Timeout:
+            continue
+        total_size -= size
+        evicted += 1
+    if evicted:
+        increment_stat('blob_evictions', evicted)
+    return evicted
+
+
+def clear_blob_cache() -> int:
+    return evict_blobs(max_size=-1, min_age=0)
+
+
+def get_blob_stats() -> dict:
+    stats = {stat: get_stat(stat) for stat in BLOB_STAT_KEYS}
+    total = stats['blob_hits'] + stats['blob_misses']
+    stats['blob_hit_rate'] = stats['blob_hits'] / total if total else None
+    entries = get_blob_cache_entries()
+    stats['blob_count'] = len(entries)
+    stats['blob_size'] = sum(size for _, size, _, _ in entries)
+    return stats
+
+
+def reset_blob_stats():
+    get_stats_cache().delete_many([f'stats:{stat}' for stat in BLOB_STAT_KEYS])
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from geoinsight.core.models import VectorData, VectorFeature
+from geoinsight.core.tasks.data import prepare_vector_features
+
+
+class Command(BaseCommand):
+    help = (
+        'Fills the Web Mercator and generalized geometries of vector features '
+        'which do not have them yet.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--vector_data',
+            type=int,
+            nargs='+',
+            help='Only backfill the VectorData objects with these ids',
+        )
+
+    def handle(self, **options):
+        # The generalized geometries are filled with the Web Mercator geometry, so only features
+        # without one need backfilling; generalized geometries may be null for small features
+        unprojected = VectorFeature.objects.filter(geometry_3857__isnull=True)
+        vectors = VectorData.objects.filter(id__in=unprojected.values('vector_data'))
+        if options['vector_data']:
+            vectors = vectors.filter(id__in=options['vector_data'])
+
+        for vector_data in vectors.order_by('id'):
+            updated = prepare_vector_features(vector_data, missing_only=True)
+            vector_data.bump_content_version()
+            self.stdout.write(f'\t{vector_data}: {updated} features projected and generalized.')
+
+        self.stdout.write(self.style.SUCCESS('Backfill complete.'))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from geoinsight.core.models import RasterData
+from geoinsight.core.tasks.raster import get_raster_source, get_raster_statistics
+
+
+class Command(BaseCommand):
+    help = 'Computes value statistics and histograms of raster data which does not have them yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--raster_data',
+            type=int,
+            nargs='+',
+            help='Only backfill the RasterData objects with these ids',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Recompute statistics which already exist',
+        )
+
+    def handle(self, **options):
+        rasters = RasterData.objects.exclude(cloud_optimized_geotiff__isnull=True).exclude(
+            cloud_optimized_geotiff=''
+        )
+        if not options['force']:
+            rasters = rasters.filter(
+                Q(metadata__isnull=True) | Q(metadata__statistics__isnull=True)
+            )
+        if options['raster_data']:
+            rasters = rasters.filter(id__in=options['raster_data'])
+
+        for raster_data in rasters.order_by('id'):
+            statistics = get_raster_statistics(get_raster_source(raster_data))
+            raster_data.metadata = dict(raster_data.metadata or {}, statistics=statistics)
+            raster_data.save(update_fields=['metadata'])
+            self.stdout.write(f'\t{raster_data}: {len(statistics["frames"])} frames summarized.')
+
+        self.stdout.write(self.style.SUCCESS('Backfill complete.'))
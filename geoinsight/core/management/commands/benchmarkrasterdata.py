@@ -0,0 +1,63 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from geoinsight.core.models import RasterData
+from geoinsight.core.rest.renderers import encode_array
+
+BINARY_FORMATS = ['raw', 'npy', 'zstd']
+
+
+def encode_json(array):
+    return json.dumps(array.tolist()).encode()
+
+
+def time_encoding(repeat, encode, *args):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        payload = encode(*args)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), len(payload)
+
+
+class Command(BaseCommand):
+    help = 'Compares serialization time and payload size of the raster data response formats.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('raster_data_id', type=int, help='RasterData to read')
+        parser.add_argument(
+            '--resolution',
+            type=float,
+            nargs='+',
+            default=[0.1, 0.5, 1.0],
+            help='Resolutions to read the raster at',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Number of times to serialize each payload',
+        )
+
+    def handle(self, **options):
+        try:
+            raster_data = RasterData.objects.get(id=options['raster_data_id'])
+        except RasterData.DoesNotExist:
+            raise CommandError('RasterData not found.')
+        self.stdout.write(str(raster_data))
+
+        for resolution in options['resolution']:
+            array = raster_data.read_image_array(resolution)
+            self.stdout.write(f'\tresolution={resolution} ({array.shape}, {array.dtype}):')
+            json_ms, json_size = time_encoding(options['repeat'], encode_json, array)
+            self.stdout.write(f'\t\tjson {json_ms:.1f} ms / {json_size} B')
+            for fmt in BINARY_FORMATS:
+                ms, size = time_encoding(options['repeat'], encode_array, array, fmt)
+                self.stdout.write(
+                    f'\t\t{fmt} {ms:.1f} ms / {size} B, '
+                    f'speedup {json_ms / max(ms, 1e-3):.1f}x, '
+                    f'size {size / max(json_size, 1):.1%} of json'
+                )
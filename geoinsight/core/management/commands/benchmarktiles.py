@@ -0,0 +1,133 @@
+import random
+import statistics
+import time
+
+from django.contrib.gis.db.models import Extent
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from geoinsight.core.models import VectorData, VectorFeature
+from geoinsight.core.tasks.tiles import get_tile_range, render_vector_tile
+
+# The tile query as it was before features stored a Web Mercator geometry;
+# every intersecting feature is reprojected on every request.
+LEGACY_VECTOR_TILE_SQL = """
+WITH
+tilenv as (
+    SELECT ST_TRANSFORM(ST_TileEnvelope(%(z)s, %(x)s, %(y)s), 3857) as te
+),
+tilenvbounds as (
+    SELECT
+        ST_XMin(te) as xmin,
+        ST_YMin(te) as ymin,
+        ST_XMax(te) as xmax,
+        ST_YMax(te) as ymax,
+        (ST_XMax(te) - ST_XMin(te)) / 4 as segsize
+    FROM tilenv
+),
+env as (
+    SELECT ST_Segmentize(
+        ST_MakeEnvelope(
+            xmin,
+            ymin,
+            xmax,
+            ymax,
+            3857
+        ),
+        segsize
+    ) as seg
+    FROM tilenvbounds
+),
+bounds as (
+    SELECT
+        seg as geom,
+        seg::box2d as b2d
+    FROM env
+),
+mvtgeom as (
+    SELECT
+        ST_AsMVTGeom(
+            ST_Transform(t.geometry, 3857),
+            bounds.b2d
+        ) AS geom,
+    t.properties as properties
+    FROM
+        core_vectorfeature t,
+        bounds
+    WHERE
+        t.vector_data_id = %(vector_data_id)s
+        AND ST_Intersects(
+            ST_Transform(t.geometry, 3857),
+            ST_Transform(bounds.geom, 3857)
+        )
+)
+SELECT ST_AsMVT(mvtgeom.*) FROM mvtgeom
+;
+"""
+
+
+def render_legacy_vector_tile(vector_data_id, z, x, y):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            LEGACY_VECTOR_TILE_SQL,
+            {'z': z, 'x': x, 'y': y, 'vector_data_id': vector_data_id},
+        )
+        row = cursor.fetchone()
+    return bytes(row[0]) if row[0] else b''
+
+
+def time_tile(render, *args):
+    start = time.perf_counter()
+    tile = render(*args)
+    return (time.perf_counter() - start) * 1000, len(tile)
+
+
+class Command(BaseCommand):
+    help = 'Compares uncached vector tile build times of the legacy and current tile queries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('vector_data_id', type=int, help='VectorData to build tiles for')
+        parser.add_argument(
+            '--zoom',
+            type=int,
+            nargs='+',
+            default=[4, 8, 12, 16],
+            help='Zoom levels to sample tiles from',
+        )
+        parser.add_argument(
+            '--samples',
+            type=int,
+            default=25,
+            help='Number of tiles to build per zoom level',
+        )
+
+    def handle(self, **options):
+        try:
+            vector_data = VectorData.objects.get(id=options['vector_data_id'])
+        except VectorData.DoesNotExist:
+            raise CommandError('VectorData not found.')
+        features = VectorFeature.objects.filter(vector_data=vector_data)
+        extent = features.aggregate(Extent('geometry')).get('geometry__extent')
+        if extent is None:
+            raise CommandError('VectorData has no features.')
+        self.stdout.write(f'{vector_data}: {features.count()} features')
+
+        sampler = random.Random(0)
+        for z in options['zoom']:
+            x_range, y_range = get_tile_range(extent, z)
+            tiles = [(x, y) for x in x_range for y in y_range]
+            tiles = sampler.sample(tiles, min(options['samples'], len(tiles)))
+
+            legacy, current = [], []
+            for x, y in tiles:
+                legacy.append(time_tile(render_legacy_vector_tile, vector_data.id, z, x, y))
+                current.append(time_tile(render_vector_tile, vector_data.id, z, x, y))
+
+            legacy_ms = statistics.median(t for t, _ in legacy)
+            current_ms = statistics.median(t for t, _ in current)
+            self.stdout.write(
+                f'\tz={z} ({len(tiles)} tiles): '
+                f'legacy {legacy_ms:.1f} ms / {statistics.mean(s for _, s in legacy):.0f} B, '
+                f'current {current_ms:.1f} ms / {statistics.mean(s for _, s in current):.0f} B, '
+                f'speedup {legacy_ms / max(current_ms, 1e-3):.1f}x'
+            )
@@ -0,0 +1,101 @@
+from itertools import islice
+import json
+import time
+
+from django.contrib.gis.geos import GEOSGeometry
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+
+from geoinsight.core.models import VectorData, VectorFeature
+from geoinsight.core.tasks.data import (
+    copy_vector_features,
+    get_feature_rows,
+    prepare_vector_features,
+)
+from geoinsight.core.tasks.geojson import iter_chunks
+from geoinsight.core.tasks.summary import summarize_features
+
+
+def bulk_create_features(vector_data, features):
+    # The ORM path, which parses each geometry into a GEOSGeometry
+    created = 0
+    for chunk in iter_chunks(features):
+        created += len(
+            VectorFeature.objects.bulk_create(
+                [
+                    VectorFeature(
+                        vector_data=vector_data,
+                        geometry=GEOSGeometry(json.dumps(feature['geometry'])),
+                        properties=feature.get('properties') or {},
+                    )
+                    for feature in chunk
+                    if feature.get('geometry')
+                ]
+            )
+        )
+    return created
+
+
+def copy_features(vector_data, features):
+    return copy_vector_features(vector_data, get_feature_rows(features))
+
+
+LOADERS = {'bulk_create': bulk_create_features, 'copy': copy_features}
+
+
+def time_load_path(load, vector_data, features) -> tuple[int, dict]:
+    # Features are inserted, summarized and given their tile geometries, as when they are
+    # created, but without replacing the existing features or the tile archive
+    last_id = VectorFeature.objects.filter(vector_data=vector_data).aggregate(Max('id'))['id__max']
+    times = {}
+    start = time.perf_counter()
+    count = load(vector_data, features)
+    times['insert'] = time.perf_counter() - start
+    start = time.perf_counter()
+    summarize_features(vector_data.id, last_id or 0)
+    times['summarize'] = time.perf_counter() - start
+    start = time.perf_counter()
+    prepare_vector_features(vector_data, missing_only=True)
+    times['prepare'] = time.perf_counter() - start
+    return count, times
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares the time to load the features of a VectorData with bulk_create and COPY, '
+        'including summarizing them and filling their tile geometries.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('vector_data_id', type=int, help='VectorData to read features from')
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Only insert this many features',
+        )
+
+    def handle(self, **options):
+        try:
+            vector_data = VectorData.objects.get(id=options['vector_data_id'])
+        except VectorData.DoesNotExist:
+            raise CommandError('VectorData not found.')
+        self.stdout.write(str(vector_data))
+
+        times = {}
+        for name, load in LOADERS.items():
+            features = islice(vector_data.iter_geojson_features(), options['limit'])
+            # Inserted features are rolled back, so the VectorData is left as it was
+            with transaction.atomic():
+                count, steps = time_load_path(load, vector_data, features)
+                transaction.set_rollback(True)
+            times[name] = sum(steps.values())
+            self.stdout.write(
+                f'\t{name}: {count} features in {times[name]:.2f} s, '
+                f'{count / max(times[name], 1e-6):.0f} features/s '
+                f'({", ".join(f"{step} {t:.2f} s" for step, t in steps.items())})'
+            )
+
+        speedup = times['bulk_create'] / max(times['copy'], 1e-6)
+        self.stdout.write(self.style.SUCCESS(f'COPY is {speedup:.1f}x faster than bulk_create.'))
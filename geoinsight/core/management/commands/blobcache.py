@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from geoinsight.core.blob_cache import (
+    clear_blob_cache,
+    evict_blobs,
+    get_blob_stats,
+    reset_blob_stats,
+)
+
+
+class Command(BaseCommand):
+    help = 'Reports usage of the local blob cache for stored files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Reset the hit and miss counters after reporting them.',
+        )
+        parser.add_argument(
+            '--evict',
+            action='store_true',
+            help='Evict least recently used blobs until the cache is within its size limit.',
+        )
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Remove all cached blobs.',
+        )
+
+    def handle(self, **options):
+        stats = get_blob_stats()
+        hit_rate = 'n/a' if stats['blob_hit_rate'] is None else f'{stats["blob_hit_rate"]:.1%}'
+        self.stdout.write(f'Blobs: {stats["blob_count"]} ({stats["blob_size"]} bytes)')
+        self.stdout.write(f'Hits: {stats["blob_hits"]}')
+        self.stdout.write(f'Misses: {stats["blob_misses"]}')
+        self.stdout.write(f'Hit rate: {hit_rate}')
+        self.stdout.write(f'Downloaded: {stats["blob_downloaded_bytes"]} bytes')
+        self.stdout.write(f'Evictions: {stats["blob_evictions"]}')
+
+        if options['clear']:
+            evicted = clear_blob_cache()
+            self.stdout.write(self.style.SUCCESS(f'Removed {evicted} blobs.'))
+        elif options['evict']:
+            evicted = evict_blobs()
+            self.stdout.write(self.style.SUCCESS(f'Evicted {evicted} blobs.'))
+        if options['reset']:
+            reset_blob_stats()
+            self.stdout.write(self.style.SUCCESS('Blob cache counters reset.'))
@@ -58,6 +58,9 @@ class DatasetItem(TypedDict):
     ]  # Relative path to python file used for conversion with function convert_dataset
     network_options: Optional[dict[str, Any]]
     region_options: Optional[dict[str, Any]]
+    seed_options: Optional[dict[str, Any]]
+    archive_options: Optional[dict[str, Any]]
+    mosaic_options: Optional[dict[str, Any]]
     action: Optional[Literal['redownload', 'replace']]
 
 
@@ -335,6 +338,9 @@ class Command(BaseCommand):
             network_options=options.get('network_options'),
             region_options=options.get('region_options'),
             asynchronous=False,
+            seed_options=options.get('seed_options'),
+            archive_options=options.get('archive_options'),
+            mosaic_options=options.get('mosaic_options'),
         )
 
     def ingest_datasets(
@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from geoinsight.core.tasks.dataset import (
+    CONVERSION_TIMEOUT,
+    fail_dataset_conversion,
+    reset_stale_conversions,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Clears the processing flag of datasets whose conversion has not finished in time, '
+        'such as when its tasks were lost with a worker.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dataset',
+            type=int,
+            nargs='+',
+            help='Reset these datasets, whatever the age of their conversion',
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=CONVERSION_TIMEOUT.total_seconds() / 3600,
+            help='Hours after which a conversion is reset',
+        )
+
+    def handle(self, **options):
+        if options['dataset']:
+            for dataset_id in options['dataset']:
+                fail_dataset_conversion(dataset_id, 'Conversion was reset.')
+                self.stdout.write(f'\tReset dataset {dataset_id}.')
+        else:
+            for dataset in reset_stale_conversions(timedelta(hours=options['timeout'])):
+                self.stdout.write(f'\tReset {dataset}.')
+        self.stdout.write(self.style.SUCCESS('Done.'))
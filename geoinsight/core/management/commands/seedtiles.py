@@ -0,0 +1,62 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from geoinsight.core.models import Dataset, TaskResult
+from geoinsight.core.tasks.tiles import seed_tiles
+
+
+class Command(BaseCommand):
+    help = 'Populates the tile cache with the tiles of vector and raster data over a zoom range.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dataset', type=int, nargs='+', help='Datasets to seed tiles for')
+        parser.add_argument(
+            '--vector_data', type=int, nargs='+', help='VectorData to seed tiles for'
+        )
+        parser.add_argument(
+            '--raster_data', type=int, nargs='+', help='RasterData to seed tiles for'
+        )
+        parser.add_argument('--min_zoom', type=int, default=0)
+        parser.add_argument('--max_zoom', type=int, default=12)
+        parser.add_argument(
+            '--raster_style',
+            type=json.loads,
+            help='JSON large_image style to render raster tiles with',
+        )
+        parser.add_argument(
+            '--asynchronous',
+            action='store_true',
+            help='Distribute tiles across celery workers instead of rendering them here.',
+        )
+
+    def handle(self, **options):
+        vector_data_ids = options['vector_data'] or []
+        raster_data_ids = options['raster_data'] or []
+        for dataset in Dataset.objects.filter(id__in=options['dataset'] or []):
+            vector_data_ids += list(dataset.vectors.values_list('id', flat=True))
+            raster_data_ids += list(dataset.rasters.values_list('id', flat=True))
+        if not vector_data_ids and not raster_data_ids:
+            raise CommandError('No vector or raster data to seed tiles for.')
+
+        kwargs = dict(
+            vector_data_ids=vector_data_ids,
+            raster_data_ids=raster_data_ids,
+            min_zoom=options['min_zoom'],
+            max_zoom=options['max_zoom'],
+            raster_style=options['raster_style'],
+        )
+        if options['asynchronous']:
+            result = TaskResult.objects.create(
+                name='Tile seeding',
+                task_type='seeding',
+                inputs=kwargs,
+                status='Initializing task...',
+            )
+            tiles = seed_tiles(**kwargs, result_id=result.id)
+            self.stdout.write(
+                self.style.SUCCESS(f'Queued {tiles} tiles for seeding (task result {result.id}).')
+            )
+        else:
+            tiles = seed_tiles(**kwargs, asynchronous=False)
+            self.stdout.write(self.style.SUCCESS(f'Seeded {tiles} tiles.'))
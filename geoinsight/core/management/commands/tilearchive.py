@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from geoinsight.core.models import VectorData
+from geoinsight.core.tasks.tile_archive import delete_tile_archive, write_tile_archive
+
+
+class Command(BaseCommand):
+    help = 'Renders the vector tiles of VectorData over a zoom range into MBTiles archives.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dataset', type=int, nargs='+', help='Datasets to archive tiles for')
+        parser.add_argument(
+            '--vector_data', type=int, nargs='+', help='VectorData to archive tiles for'
+        )
+        parser.add_argument('--min_zoom', type=int, default=0)
+        parser.add_argument('--max_zoom', type=int, default=12)
+        parser.add_argument(
+            '--delete',
+            action='store_true',
+            help='Remove the archives, so tiles are built from the database again.',
+        )
+
+    def handle(self, **options):
+        vectors = VectorData.objects.filter(id__in=options['vector_data'] or []) | (
+            VectorData.objects.filter(dataset__in=options['dataset'] or [])
+        )
+        if not vectors.exists():
+            raise CommandError('No vector data to archive tiles for.')
+
+        for vector_data in vectors.distinct():
+            if options['delete']:
+                delete_tile_archive(vector_data)
+                self.stdout.write(f'\tRemoved tile archive of {vector_data.name}.')
+            else:
+                self.stdout.write(f'\tArchiving tiles of {vector_data.name}...')
+                write_tile_archive(vector_data, options['min_zoom'], options['max_zoom'])
+        self.stdout.write(self.style.SUCCESS('Done.'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from geoinsight.core.tile_cache import get_stats, get_tile_cache, reset_stats
+
+
+class Command(BaseCommand):
+    help = 'Reports hit and miss counts for the tile cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Reset the hit and miss counters after reporting them.',
+        )
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Remove all cached tiles.',
+        )
+
+    def handle(self, **options):
+        stats = get_stats()
+        hit_rate = 'n/a' if stats['hit_rate'] is None else f'{stats["hit_rate"]:.1%}'
+        self.stdout.write(f'Hits: {stats["hits"]}')
+        self.stdout.write(f'Misses: {stats["misses"]}')
+        self.stdout.write(f'Hit rate: {hit_rate}')
+
+        if options['clear']:
+            get_tile_cache().clear()
+            self.stdout.write(self.style.SUCCESS('Tile cache cleared.'))
+        elif options['reset']:
+            reset_stats()
+            self.stdout.write(self.style.SUCCESS('Tile cache counters reset.'))
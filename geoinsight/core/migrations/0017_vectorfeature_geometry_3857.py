@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-17 09:12
+
+import django.contrib.gis.db.models.fields
+from django.contrib.postgres.indexes import GistIndex
+from django.contrib.postgres.operations import BtreeGistExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_dataset_owner_and_tags'),
+    ]
+
+    operations = [
+        # Required to combine the vector_data_id column with a geometry in one GiST index
+        BtreeGistExtension(),
+        migrations.AddField(
+            model_name='vectorfeature',
+            name='geometry_3857',
+            field=django.contrib.gis.db.models.fields.GeometryField(
+                null=True, spatial_index=False, srid=3857
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='vectorfeature',
+            index=GistIndex(
+                fields=['vector_data', 'geometry_3857'], name='vectorfeature_3857_gist'
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.8 on 2026-10-17 10:03
+
+from django.contrib.postgres.indexes import GinIndex
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_vectorfeature_geometry_3857'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='vectorfeature',
+            index=GinIndex(
+                fields=['properties'],
+                name='vectorfeature_properties_gin',
+                opclasses=['jsonb_path_ops'],
+            ),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.8 on 2026-10-17 11:20
+
+import django.contrib.gis.db.models.fields
+from django.contrib.postgres.indexes import GistIndex
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_vectorfeature_properties_gin'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vectorfeature',
+            name='geometry_z4',
+            field=django.contrib.gis.db.models.fields.GeometryField(
+                null=True, spatial_index=False, srid=3857
+            ),
+        ),
+        migrations.AddField(
+            model_name='vectorfeature',
+            name='geometry_z7',
+            field=django.contrib.gis.db.models.fields.GeometryField(
+                null=True, spatial_index=False, srid=3857
+            ),
+        ),
+        migrations.AddField(
+            model_name='vectorfeature',
+            name='geometry_z10',
+            field=django.contrib.gis.db.models.fields.GeometryField(
+                null=True, spatial_index=False, srid=3857
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='vectorfeature',
+            index=GistIndex(fields=['vector_data', 'geometry_z4'], name='vectorfeature_z4_gist'),
+        ),
+        migrations.AddIndex(
+            model_name='vectorfeature',
+            index=GistIndex(fields=['vector_data', 'geometry_z7'], name='vectorfeature_z7_gist'),
+        ),
+        migrations.AddIndex(
+            model_name='vectorfeature',
+            index=GistIndex(fields=['vector_data', 'geometry_z10'], name='vectorfeature_z10_gist'),
+        ),
+    ]
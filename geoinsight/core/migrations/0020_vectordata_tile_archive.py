@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-17 11:12
+
+from django.db import migrations
+import s3_file_field.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_vectorfeature_generalized_geometry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vectordata',
+            name='tile_archive',
+            field=s3_file_field.fields.S3FileField(null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-17 11:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_vectordata_tile_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rasterdata',
+            name='content_version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='vectordata',
+            name='content_version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-17 21:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_content_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileitem',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='rasterdata',
+            name='conversion',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='vectordata',
+            name='conversion',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -1,14 +1,17 @@
 import json
+import math
 from pathlib import Path
-import tempfile
 
 from django.contrib.gis.db import models as geomodels
-from django.core.files.base import ContentFile
+from django.contrib.postgres.indexes import GinIndex, GistIndex
+from django.core.files.base import ContentFile, File
 from django.db import models
 from django.dispatch import receiver
 import large_image
 from s3_file_field import S3FileField
 
+from geoinsight.core.blob_cache import get_blob_path
+
 from .dataset import Dataset
 from .file_item import FileItem
 
@@ -19,6 +22,10 @@ class RasterData(models.Model):
     source_file = models.ForeignKey(FileItem, null=True, on_delete=models.CASCADE)
     cloud_optimized_geotiff = S3FileField(null=True)
     metadata = models.JSONField(blank=True, null=True)
+    # Bumped whenever the content changes; identifies responses for HTTP caching
+    content_version = models.PositiveIntegerField(default=1)
+    # The conversion key of the source file and options which produced this data
+    conversion = models.JSONField(blank=True, null=True)
 
     def __str__(self):
         return f'{self.name} ({self.id})'
@@ -27,18 +34,57 @@ class RasterData(models.Model):
     def filter_queryset_by_projects(cls, queryset, projects):
         return queryset.filter(dataset__project__in=projects)
 
-    def get_image_data(self, resolution: float = 1.0):
-        with tempfile.TemporaryDirectory() as tmp:
-            raster_path = Path(tmp, 'raster')
-            with open(raster_path, 'wb') as raster_file:
-                raster_file.write(self.cloud_optimized_geotiff.read())
-            source = large_image.open(raster_path)
-            data, data_format = source.getRegion(format='numpy')
-            data = data[:, :, 0]
-            if resolution != 1.0:
-                step = int(1 / resolution)
-                data = data[::step][::step]
-            return data.tolist()
+    def bump_content_version(self):
+        from geoinsight.core.tile_cache import invalidate_tiles
+
+        # Changes the ETag of this data's tiles and invalidates any cached tiles
+        RasterData.objects.filter(id=self.id).update(
+            content_version=models.F('content_version') + 1
+        )
+        self.refresh_from_db(fields=['content_version'])
+        invalidate_tiles('raster', self.id)
+
+    def get_image_data(self, *args, **kwargs):
+        return self.read_image_array(*args, **kwargs).tolist()
+
+    def read_image_array(
+        self,
+        resolution: float = 1.0,
+        bbox: list[float] | None = None,
+        band: int = 0,
+        frame: int | None = None,
+    ):
+        """
+        Read one band of the raster, or of the window within bbox (in EPSG:4326), as an array.
+
+        The resolution scales the output size, so coarse reads come from the COG overviews.
+        """
+        if not 0 < resolution <= 1:
+            raise ValueError('resolution must be greater than 0 and at most 1.')
+        source = large_image.open(get_blob_path(self.cloud_optimized_geotiff))
+        region = dict()
+        width, height = source.sizeX, source.sizeY
+        if bbox is not None:
+            region = dict(
+                left=bbox[0], bottom=bbox[1], right=bbox[2], top=bbox[3], units='EPSG:4326'
+            )
+            pixel_region = source.convertRegionScale(region, targetUnits='base_pixels')
+            width, height = pixel_region['width'], pixel_region['height']
+            if not width or not height:
+                raise ValueError('bbox does not intersect the raster.')
+        kwargs = dict(format='numpy', region=region)
+        if resolution != 1.0:
+            # large_image reads from the smallest overview which satisfies the output size
+            kwargs['output'] = dict(
+                maxWidth=max(1, math.ceil(width * resolution)),
+                maxHeight=max(1, math.ceil(height * resolution)),
+            )
+        if frame is not None:
+            kwargs['frame'] = frame
+        data, data_format = source.getRegion(**kwargs)
+        if not 0 <= band < data.shape[2]:
+            raise ValueError(f'band must be between 0 and {data.shape[2] - 1}.')
+        return data[:, :, band]
 
 
 class VectorData(models.Model):
@@ -46,8 +92,15 @@ class VectorData(models.Model):
     dataset = models.ForeignKey(Dataset, related_name='vectors', on_delete=models.CASCADE)
     source_file = models.ForeignKey(FileItem, null=True, on_delete=models.CASCADE)
     geojson_data = S3FileField(null=True)
+    # MBTiles archive of prerendered vector tiles, served instead of querying features
+    tile_archive = S3FileField(null=True)
     summary = models.JSONField(blank=True, null=True)
     metadata = models.JSONField(blank=True, null=True)
+    # Bumped whenever the features change; identifies tiles for HTTP caching
+    content_version = models.PositiveIntegerField(default=1)
+    # The conversion key of the source file and options which produced this data,
+    # and the state of its processing into features and a tile archive
+    conversion = models.JSONField(blank=True, null=True)
 
     def __str__(self):
         return f'{self.name} ({self.id})'
@@ -56,7 +109,12 @@ class VectorData(models.Model):
     def filter_queryset_by_projects(cls, queryset, projects):
         return queryset.filter(dataset__project__in=projects)
 
-    def write_geojson_data(self, content: str | dict):
+    def write_geojson_data(self, content: str | dict | Path):
+        if isinstance(content, Path):
+            # Large files are uploaded from disk, rather than read into memory
+            with open(content, 'rb') as geojson_file:
+                self.geojson_data.save('vectordata.geojson', File(geojson_file))
+            return
         if isinstance(content, str):
             data = content
         elif isinstance(content, dict):
@@ -68,55 +126,55 @@ class VectorData(models.Model):
 
     def read_geojson_data(self) -> dict:
         """Read and load the data from geojson_data into a dict."""
-        return json.load(self.geojson_data.open())
+        with open(get_blob_path(self.geojson_data)) as geojson_file:
+            return json.load(geojson_file)
+
+    def iter_geojson_features(self):
+        """Yield the features of geojson_data one at a time, without loading the whole file."""
+        from geoinsight.core.tasks.geojson import iter_geojson_features
+
+        return iter_geojson_features(get_blob_path(self.geojson_data))
+
+    def bump_content_version(self):
+        from geoinsight.core.tile_cache import invalidate_tiles
+
+        # Changes the ETag of this data's tiles and invalidates any cached tiles
+        VectorData.objects.filter(id=self.id).update(
+            content_version=models.F('content_version') + 1
+        )
+        self.refresh_from_db(fields=['content_version'])
+        invalidate_tiles('vector', self.id)
+
+    def get_style_fields(self, style='default') -> list[str]:
+        """
+        Return the feature properties needed to display this data with a LayerStyle.
+
+        The style is a LayerStyle id, or 'default' for the default styles of the layers
+        showing this data. The properties used by layer frame filters are always included.
+        """
+        from .layer import LayerFrame
+        from .styles import LayerStyle
+
+        frames = LayerFrame.objects.filter(vector=self)
+        if style == 'default':
+            styles = LayerStyle.objects.filter(default_layer__frames__in=frames)
+        else:
+            styles = LayerStyle.objects.filter(id=int(style), layer__frames__in=frames)
+
+        fields = set()
+        for frame in frames:
+            fields.update(frame.source_filters or {})
+        for layer_style in styles.distinct():
+            fields.update(layer_style.get_property_names())
+        return sorted(fields)
 
     def get_summary(self, cache=True):
+        from geoinsight.core.tasks.summary import get_vector_summary
+
         if cache and self.summary:
             return self.summary
-        # Limit number of unique values to return for non-numeric fields
-        value_set_max_length = 1000
-        summary = dict(feature_types=[], properties={})
-        exclude_keys = ['node_id', 'edge_id', 'to_node_id', 'from_node_id']
-        # Create sets of all values for all properties (except excluded)
-        # and a list of the feature types that exist (point, line, polygon)
-        for feature in self.features.all():
-            feature_type = feature.geometry.geom_type
-            if feature_type not in summary['feature_types']:
-                summary['feature_types'].append(feature_type)
-            for k, v in feature.properties.items():
-                if k not in exclude_keys and v is not None and v != '':
-                    if k not in summary['properties']:
-                        summary['properties'][k] = dict(value_set=set(), count=0)
-                    new_val = v if isinstance(v, list) else [v]
-                    for item in new_val:
-                        summary['properties'][k]['value_set'].add(item)
-                        summary['properties'][k]['count'] += 1
-        # Once sets are complete, reevaluate each set and create a `sample_label` for each property
-        for k in summary['properties']:
-            types = set(type(v).__name__ for v in summary['properties'][k]['value_set'])
-            summary['properties'][k]['types'] = list(types)
-            # If a property has only numeric values, return the range instead of a set of values
-            if len(types.intersection({'int', 'float'})) == len(types):
-                value_range = [
-                    min(summary['properties'][k]['value_set']),
-                    max(summary['properties'][k]['value_set']),
-                ]
-                if value_range[0] < value_range[1]:
-                    del summary['properties'][k]['value_set']
-                    summary['properties'][k]['range'] = value_range
-                    summary['properties'][k][
-                        'sample_label'
-                    ] = f'[{value_range[0]}, {value_range[1]}]'
-            # Otherwise, limit the value set to the maximum length
-            if summary['properties'][k].get('range') is None:
-                summary['properties'][k]['value_set'] = list(summary['properties'][k]['value_set'])[
-                    :value_set_max_length
-                ]
-                summary['properties'][k]['sample_label'] = ', '.join(
-                    str(v) for v in summary['properties'][k]['value_set'][:3]
-                )
-                if len(summary['properties'][k]['value_set']) > 3:
-                    summary['properties'][k]['sample_label'] += '...'
+        # Properties are summarized in the database, rather than loading every feature
+        summary = get_vector_summary(self.id)
         self.summary = summary
         self.save()
         return summary
@@ -127,20 +185,62 @@ class VectorFeature(models.Model):
         VectorData, on_delete=models.CASCADE, related_name='features', null=True
     )
     geometry = geomodels.GeometryField()
+    # Web Mercator copy of geometry, used to build map tiles without reprojecting
+    geometry_3857 = geomodels.GeometryField(srid=3857, null=True, spatial_index=False)
+    # Simplified copies of geometry_3857 for tiles up to the given zoom level;
+    # null where the feature is too small to be visible at that zoom level
+    geometry_z4 = geomodels.GeometryField(srid=3857, null=True, spatial_index=False)
+    geometry_z7 = geomodels.GeometryField(srid=3857, null=True, spatial_index=False)
+    geometry_z10 = geomodels.GeometryField(srid=3857, null=True, spatial_index=False)
     properties = models.JSONField()
 
+    class Meta:
+        indexes = [
+            GistIndex(fields=['vector_data', 'geometry_3857'], name='vectorfeature_3857_gist'),
+            GistIndex(fields=['vector_data', 'geometry_z4'], name='vectorfeature_z4_gist'),
+            GistIndex(fields=['vector_data', 'geometry_z7'], name='vectorfeature_z7_gist'),
+            GistIndex(fields=['vector_data', 'geometry_z10'], name='vectorfeature_z10_gist'),
+            # Serves property containment (@>) filters on vector tiles
+            GinIndex(
+                fields=['properties'],
+                opclasses=['jsonb_path_ops'],
+                name='vectorfeature_properties_gin',
+            ),
+        ]
+
     @property
     def dataset(self):
         return self.vector_data.dataset
 
 
+@receiver(models.signals.pre_save, sender=RasterData)
+def bump_raster_content_version(sender, instance, **kwargs):
+    # A replaced COG changes the ETag and cache keys of the raster's tiles
+    if instance.pk is not None:
+        previous = (
+            RasterData.objects.filter(pk=instance.pk)
+            .values_list('cloud_optimized_geotiff', flat=True)
+            .first()
+        )
+        if previous and previous != instance.cloud_optimized_geotiff.name:
+            instance.bump_content_version()
+
+
 @receiver(models.signals.post_delete, sender=RasterData)
 def delete_raster_content(sender, instance, **kwargs):
+    from geoinsight.core.tile_cache import invalidate_tiles
+
     if instance.cloud_optimized_geotiff:
         instance.cloud_optimized_geotiff.delete(save=False)
+    invalidate_tiles('raster', instance.id)
 
 
 @receiver(models.signals.post_delete, sender=VectorData)
 def delete_vector_content(sender, instance, **kwargs):
+    from geoinsight.core.tile_cache import invalidate_tiles
+
     if instance.geojson_data:
         instance.geojson_data.delete(save=False)
+    if instance.tile_archive:
+        instance.tile_archive.delete(save=False)
+    invalidate_tiles('vector', instance.id)
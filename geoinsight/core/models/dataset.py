@@ -75,6 +75,9 @@ class Dataset(models.Model):
         network_options=None,
         region_options=None,
         asynchronous=True,
+        seed_options=None,
+        archive_options=None,
+        mosaic_options=None,
     ):
         if asynchronous:
             from geoinsight.core.models.task_result import TaskResult
@@ -87,15 +90,34 @@ class Dataset(models.Model):
                     layer_options=layer_options,
                     network_options=network_options,
                     region_options=region_options,
+                    seed_options=seed_options,
+                    archive_options=archive_options,
+                    mosaic_options=mosaic_options,
                 ),
                 status='Initializing task...',
             )
             convert_dataset.delay(
-                self.id, layer_options, network_options, region_options, result.id
+                self.id,
+                layer_options,
+                network_options,
+                region_options,
+                result.id,
+                seed_options,
+                archive_options,
+                mosaic_options,
+                asynchronous=True,
             )
             return result
         else:
-            convert_dataset(self.id, layer_options, network_options, region_options)
+            convert_dataset(
+                self.id,
+                layer_options,
+                network_options,
+                region_options,
+                seed_options=seed_options,
+                archive_options=archive_options,
+                mosaic_options=mosaic_options,
+            )
 
     def get_size(self):
         from geoinsight.core.models import FileItem
@@ -1,8 +1,12 @@
+import hashlib
+
 from django.db import models
 from django.dispatch import receiver
 from django_extensions.db.models import TimeStampedModel
 from s3_file_field import S3FileField
 
+from geoinsight.core.blob_cache import get_blob_path
+
 from .chart import Chart
 from .dataset import Dataset
 
@@ -18,6 +22,8 @@ class FileItem(TimeStampedModel):
     file_size = models.PositiveBigIntegerField(null=True)
     metadata = models.JSONField(blank=True, null=True)
     index = models.IntegerField(null=True)
+    # SHA-256 of the file content, set when the file is converted
+    content_hash = models.CharField(max_length=64, null=True, blank=True)
 
     def __str__(self):
         return f'{self.name} ({self.id})'
@@ -26,6 +32,24 @@ class FileItem(TimeStampedModel):
     def filter_queryset_by_projects(cls, queryset, projects):
         return queryset.filter(dataset__project__in=projects)
 
+    def update_content_hash(self) -> str:
+        digest = hashlib.sha256()
+        with open(get_blob_path(self.file), 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        self.content_hash = digest.hexdigest()
+        FileItem.objects.filter(id=self.id).update(content_hash=self.content_hash)
+        return self.content_hash
+
+
+@receiver(models.signals.pre_save, sender=FileItem)
+def reset_content_hash(sender, instance, **kwargs):
+    # A replaced file must be hashed again before its converted data can be reused
+    if instance.pk is not None and instance.content_hash:
+        previous = FileItem.objects.filter(pk=instance.pk).values_list('file', flat=True).first()
+        if previous != instance.file.name:
+            instance.content_hash = None
+
 
 @receiver(models.signals.post_delete, sender=FileItem)
 def delete_content(sender, instance, **kwargs):
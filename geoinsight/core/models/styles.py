@@ -149,6 +149,21 @@ class LayerStyle(models.Model):
             filter_config_ids.append(filter_config.id)
         FilterConfig.objects.filter(style=self).exclude(id__in=filter_config_ids).delete()
 
+    def get_property_names(self) -> set[str]:
+        # The feature properties read by the color, size and filter configs
+        names = set(
+            ColormapConfig.objects.filter(color_config__style=self).values_list(
+                'color_by', flat=True
+            )
+        )
+        names.update(
+            SizeRangeConfig.objects.filter(size_config__style=self).values_list(
+                'size_by', flat=True
+            )
+        )
+        names.update(FilterConfig.objects.filter(style=self).values_list('filter_by', flat=True))
+        return {name for name in names if name}
+
     def repr_style_configs(self):
         def serialize_fields(obj, fields):
             serialized = {}
@@ -14,7 +14,9 @@ class GuardianPermission(IsAuthenticated):
             raise NotImplementedError
 
         perms = ['follower', 'collaborator', 'owner']
-        if request.method not in SAFE_METHODS:
+        # Views may list actions which take their inputs in a request body, but only read data
+        read_only = getattr(view, 'action', None) in getattr(view, 'read_only_actions', [])
+        if request.method not in SAFE_METHODS and not read_only:
             perms = ['collaborator', 'owner']
         if request.method == 'DELETE':
             perms = ['owner']
@@ -1,84 +1,137 @@
 import json
 
 from django.contrib.gis.db.models import Extent
-from django.db import connection
-from django.http import HttpResponse
-from django_large_image.rest import LargeImageFileDetailMixin
-from rest_framework import mixins
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from django_large_image.rest import LargeImageFileDetailMixin, params
+from django_large_image.rest.renderers import image_renderers
+from large_image.exceptions import TileSourceError, TileSourceXYZRangeError
+from rest_framework import mixins, serializers
 from rest_framework.decorators import action
+from rest_framework.exceptions import APIException, ValidationError
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
-from geoinsight.core.models import RasterData, VectorData, VectorFeature
+from geoinsight.core.blob_cache import get_blob_path
+from geoinsight.core.models import Dataset, Network, RasterData, VectorData, VectorFeature
 from geoinsight.core.rest.access_control import GuardianFilter, GuardianPermission
 from geoinsight.core.rest.explorer import IPyLeafletTokenAuth
+from geoinsight.core.rest.renderers import array_renderers, get_array_headers
 from geoinsight.core.rest.serializers import RasterDataSerializer, VectorDataSerializer
+from geoinsight.core.tasks.raster import (
+    get_frame_indices,
+    get_raster_source,
+    get_time_series,
+    sample_raster,
+)
+from geoinsight.core.tasks.tiles import (
+    get_fields,
+    load_composite_vector_tile,
+    load_raster_tile,
+    load_vector_tile,
+    pop_cluster_options,
+)
+from geoinsight.core.tasks.zonal_stats import get_zonal_stats
+from geoinsight.core.tile_cache import get_style_hash
+
+# Responses for URLs which carry the current content version never change
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+
+def get_content_etag(data_type: str, *versions) -> str:
+    return quote_etag(f'{data_type}-{"-".join(str(v) for v in versions)}')
+
+
+def get_not_modified_response(
+    request, etag: str, version: str, immutable: bool = True
+) -> HttpResponse | None:
+    etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if etag in etags or '*' in etags:
+        return set_cache_headers(HttpResponseNotModified(), request, etag, version, immutable)
+    return None
+
 
-VECTOR_TILE_SQL = """
-WITH
-tilenv as (
-    SELECT ST_TRANSFORM(ST_TileEnvelope(%(z)s, %(x)s, %(y)s), %(srid)s) as te
-),
-tilenvbounds as (
-    SELECT
-        ST_XMin(te) as xmin,
-        ST_YMin(te) as ymin,
-        ST_XMax(te) as xmax,
-        ST_YMax(te) as ymax,
-        (ST_XMax(te) - ST_XMin(te)) / 4 as segsize
-    FROM tilenv
-),
-env as (
-    SELECT ST_Segmentize(
-        ST_MakeEnvelope(
-            xmin,
-            ymin,
-            xmax,
-            ymax,
-            %(srid)s
-        ),
-        segsize
-    ) as seg
-    FROM tilenvbounds
-),
-bounds as (
-    SELECT
-        seg as geom,
-        seg::box2d as b2d
-    FROM env
-),
-mvtgeom as (
-    SELECT
-        ST_AsMVTGeom(
-            ST_Transform(t.geometry, %(srid)s),
-            bounds.b2d
-        ) AS geom,
-    t.properties as properties
-    FROM
-        core_vectorfeature t,
-        bounds
-    WHERE
-        t.vector_data_id = %(vector_data_id)s
-        AND ST_Intersects(
-            ST_Transform(t.geometry, %(srid)s),
-            ST_Transform(bounds.geom, %(srid)s)
+def set_cache_headers(response, request, etag: str, version: str, immutable: bool = True):
+    # Clients may add the content version as the v parameter, making the URL immutable;
+    # otherwise responses are revalidated with the ETag. Data is access controlled, so
+    # responses are only cached privately. Responses which depend on more than the URL
+    # and the content version, such as tiles styled by a LayerStyle, are never immutable.
+    response['ETag'] = etag
+    if immutable and request.query_params.get('v') == version:
+        patch_cache_control(response, private=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def get_tile_layers(value: str | None) -> list[dict]:
+    # Layers are given as a JSON list of VectorData ids, or of objects with an id and
+    # optionally filters, fields or a style to select properties, and a layer name
+    try:
+        layers = json.loads(value or '')
+    except ValueError:
+        raise ValueError('layers must be a JSON list.')
+    if not isinstance(layers, list) or not layers:
+        raise ValueError('layers must be a non-empty JSON list.')
+
+    tile_layers = []
+    for layer in layers:
+        if not isinstance(layer, dict):
+            layer = dict(id=layer)
+        if not isinstance(layer.get('id'), int) or isinstance(layer['id'], bool):
+            raise ValueError(f'Invalid layer id: {layer.get("id")}')
+        filters = layer.get('filters') or {}
+        if not isinstance(filters, dict):
+            raise ValueError(f'Invalid filters for layer {layer["id"]}: {filters}')
+        tile_layers.append(
+            dict(
+                id=layer['id'],
+                name=str(layer.get('name', layer['id'])),
+                filters=filters,
+                fields=get_fields(layer.get('fields')),
+                style=layer.get('style'),
+            )
         )
-        REPLACE_WITH_FILTERS
-)
-SELECT ST_AsMVT(mvtgeom.*) FROM mvtgeom
-;
-"""
+    if len({layer['name'] for layer in tile_layers}) < len(tile_layers):
+        raise ValueError('Layer names must be unique.')
+    return tile_layers
+
+
+def get_coordinate_field():
+    return serializers.ListField(child=serializers.FloatField(), min_length=2, max_length=2)
+
 
+class RasterPointsSerializer(serializers.Serializer):
+    points = serializers.ListField(child=get_coordinate_field(), required=False)
+    network = serializers.IntegerField(required=False)
+    nodes = serializers.ListField(child=serializers.IntegerField(), required=False)
+    frames = serializers.ListField(
+        child=serializers.IntegerField(min_value=0), required=False, allow_empty=False
+    )
+    band = serializers.IntegerField(min_value=0, default=0)
+
+    def validate(self, data):
+        if not any(data.get(key) for key in ['points', 'lines', 'network']):
+            raise serializers.ValidationError('Provide locations or a network to sample.')
+        if 'nodes' in data and 'network' not in data:
+            raise serializers.ValidationError('nodes must be given with their network.')
+        return data
+
+
+class RasterSampleSerializer(RasterPointsSerializer):
+    lines = serializers.ListField(
+        child=serializers.ListField(child=get_coordinate_field(), min_length=2), required=False
+    )
 
-def get_filter_string(filters: dict | None = None):
-    if filters is None:
-        return ''
 
-    return_str = ''
-    for key, value in filters.items():
-        key_path = key.replace('.', ',')
-        return_str += f" AND t.properties #>> '{{{key_path}}}' = '{value}'"
-    return return_str
+class ZonalStatsQueryParamSerializer(serializers.Serializer):
+    regions = serializers.IntegerField()
+    frames = serializers.RegexField(r'^\d+(,\d+)*$', required=False)
+    band = serializers.IntegerField(min_value=0, default=0)
+    threshold = serializers.FloatField(required=False)
+    percentiles = serializers.RegexField(r'^\d+(\.\d+)?(,\d+(\.\d+)?)*$', required=False)
 
 
 class GenericDataViewSet(GenericViewSet, mixins.RetrieveModelMixin):
@@ -101,17 +154,191 @@ class RasterDataViewSet(GenericDataViewSet, LargeImageFileDetailMixin):
     queryset = RasterData.objects.select_related('dataset').all()
     serializer_class = RasterDataSerializer
     FILE_FIELD_NAME = 'cloud_optimized_geotiff'
+    read_only_actions = ['sample', 'time_series']
+
+    def get_path(self, request, pk=None):
+        # The large_image endpoints read through the shared blob cache
+        return str(get_blob_path(getattr(self.get_object(), self.FILE_FIELD_NAME)))
 
     @action(
         detail=True,
         methods=['get'],
         url_path=r'raster-data/(?P<resolution>[\d*\.?\d*]+)',
         url_name='raster_data',
+        renderer_classes=array_renderers,
     )
     def get_raster_data(self, request, resolution: str = '1', **kwargs):
+        # JSON lists by default; compact binary arrays are negotiated with the Accept header
+        # or the format parameter (raw, npy or zstd)
+        raster_data = self.get_object()
+        version = str(raster_data.content_version)
+        fmt = request.accepted_renderer.format
+        etag = get_content_etag('raster', raster_data.id, version, fmt)
+        not_modified = get_not_modified_response(request, etag, version)
+        if not_modified is not None:
+            return not_modified
+        try:
+            bbox = request.query_params.get('bbox')
+            if bbox is not None:
+                bbox = [float(v) for v in bbox.split(',')]
+                if len(bbox) != 4:
+                    raise ValueError('bbox must be given as xmin,ymin,xmax,ymax.')
+            frame = request.query_params.get('frame')
+            array = raster_data.read_image_array(
+                float(resolution),
+                bbox=bbox,
+                band=int(request.query_params.get('band', 0)),
+                frame=None if frame is None else int(frame),
+            )
+        except ValueError as e:
+            raise ValidationError(str(e))
+        except TileSourceError as e:
+            raise APIException(str(e))
+        if fmt == 'json':
+            response = HttpResponse(json.dumps(array.tolist()), status=200)
+        else:
+            response = Response(array, headers=get_array_headers(array))
+        patch_vary_headers(response, ['Accept'])
+        return set_cache_headers(response, request, etag, version)
+
+    def get_sample_points(self, request, data) -> tuple[list, list]:
+        # Network nodes are sampled at their locations, after any points given explicitly
+        points = list(data.get('points', []))
+        node_ids = []
+        if 'network' in data:
+            network = get_object_or_404(Network, id=data['network'])
+            self.check_object_permissions(request, network)
+            nodes = network.nodes.order_by('id')
+            if 'nodes' in data:
+                nodes = nodes.filter(id__in=data['nodes'])
+            for node_id, location in nodes.values_list('id', 'location'):
+                node_ids.append(node_id)
+                points.append([location.x, location.y])
+        return points, node_ids
+
+    @action(detail=True, methods=['post'])
+    def sample(self, request, **kwargs):
+        # Points and lines are given in EPSG:4326
+        raster_data = self.get_object()
+        serializer = RasterSampleSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        points, node_ids = self.get_sample_points(request, data)
+
+        try:
+            result = sample_raster(
+                raster_data,
+                points=points,
+                lines=data.get('lines'),
+                frames=data.get('frames'),
+                band=data['band'],
+            )
+        except ValueError as e:
+            raise ValidationError(str(e))
+        except TileSourceError as e:
+            raise APIException(str(e))
+        if 'network' in data:
+            point_count = len(points) - len(node_ids)
+            values = result.pop('points', [])
+            result['nodes'] = dict(zip(node_ids, values[point_count:]))
+            if point_count:
+                result['points'] = values[:point_count]
+        return Response(result, status=200)
+
+    @action(detail=True, methods=['post'], url_path='time-series', url_name='time_series')
+    def time_series(self, request, **kwargs):
+        # Returns every frame by default, e.g. for hydrographs of simulation output
+        raster_data = self.get_object()
+        serializer = RasterPointsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        points, node_ids = self.get_sample_points(request, data)
+        if not points and 'network' not in data:
+            raise ValidationError('No points to sample.')
+
+        try:
+            if points:
+                result = get_time_series(
+                    raster_data, points, frames=data.get('frames'), band=data['band']
+                )
+            else:
+                # The network has none of the requested nodes
+                frames = data.get('frames') or get_frame_indices(get_raster_source(raster_data))
+                result = dict(frames=frames, series=[])
+        except ValueError as e:
+            raise ValidationError(str(e))
+        except TileSourceError as e:
+            raise APIException(str(e))
+        if 'network' in data:
+            point_count = len(points) - len(node_ids)
+            result['nodes'] = dict(zip(node_ids, result['series'][point_count:]))
+            result['series'] = result['series'][:point_count]
+        return Response(result, status=200)
+
+    @action(detail=True, methods=['get'], url_path='zonal-stats', url_name='zonal_stats')
+    def zonal_stats(self, request, **kwargs):
+        # Summarizes the raster within each region of a dataset, for each requested frame
+        raster_data = self.get_object()
+        serializer = ZonalStatsQueryParamSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        query = serializer.validated_data
+        dataset = get_object_or_404(Dataset, id=query['regions'])
+        if not dataset.regions.exists():
+            raise ValidationError(f'Dataset {dataset.id} has no regions.')
+
+        try:
+            stats = get_zonal_stats(
+                raster_data,
+                dataset,
+                frames=(
+                    [int(f) for f in query['frames'].split(',')] if 'frames' in query else None
+                ),
+                band=query['band'],
+                threshold=query.get('threshold'),
+                percentiles=(
+                    [float(q) for q in query['percentiles'].split(',')]
+                    if 'percentiles' in query
+                    else None
+                ),
+            )
+        except ValueError as e:
+            raise ValidationError(str(e))
+        except TileSourceError as e:
+            raise APIException(str(e))
+        return Response(stats, status=200)
+
+    # Overrides the large_image tile endpoint to read through the tile cache
+    @action(
+        detail=True,
+        url_path=rf'tiles/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+).{params.FORMAT_URL_PATTERN}',
+        renderer_classes=image_renderers,
+    )
+    def tile(self, request, x: str, y: str, z: str, fmt: str = 'png', **kwargs):
         raster_data = self.get_object()
-        data = raster_data.get_image_data(float(resolution))
-        return HttpResponse(json.dumps(data), status=200)
+        version = str(raster_data.content_version)
+        etag = get_content_etag('raster', raster_data.id, version)
+        not_modified = get_not_modified_response(request, etag, version)
+        if not_modified is not None:
+            return not_modified
+        style = self.get_style(request)
+        try:
+            tile, content_type = load_raster_tile(
+                raster_data,
+                z,
+                x,
+                y,
+                fmt=fmt,
+                projection=request.query_params.get('projection'),
+                style=style,
+                frame=request.query_params.get('frame'),
+            )
+        except (TileSourceXYZRangeError, ValueError) as e:
+            raise ValidationError(e)
+        except TileSourceError as e:
+            raise APIException(str(e))
+        return set_cache_headers(
+            HttpResponse(tile, content_type=content_type), request, etag, version
+        )
 
 
 class VectorDataViewSet(GenericDataViewSet):
@@ -142,25 +369,103 @@ class VectorDataViewSet(GenericDataViewSet):
         url_name='tiles',
     )
     def get_vector_tile(self, request, id: str, x: str, y: str, z: str):
+        instance = self.get_object()
         filters = request.query_params.copy()
         filters.pop('token', None)
-        filters_string = get_filter_string(filters)
-        with connection.cursor() as cursor:
-            cursor.execute(
-                VECTOR_TILE_SQL.replace('REPLACE_WITH_FILTERS', filters_string),
-                {
-                    'z': z,
-                    'x': x,
-                    'y': y,
-                    'srid': 3857,
-                    'vector_data_id': id,
-                },
-            )
-            row = cursor.fetchone()
+        filters.pop('v', None)
+        cluster = pop_cluster_options(filters)
+        fields = filters.pop('fields', None)
+        style = filters.pop('style', None)
+        styled = fields is None and style is not None
+        try:
+            if fields is not None:
+                fields = get_fields(fields[-1])
+            elif style is not None:
+                fields = instance.get_style_fields(style[-1])
+        except ValueError as e:
+            return HttpResponse(str(e), status=400)
+
+        version = str(instance.content_version)
+        etag_parts = [instance.id, version]
+        if styled:
+            # The style selects the properties, so editing it must change the ETag
+            etag_parts.append(get_style_hash(dict(fields=fields)))
+        etag = get_content_etag('vector', *etag_parts)
+        not_modified = get_not_modified_response(request, etag, version, not styled)
+        if not_modified is not None:
+            return not_modified
+
+        try:
+            tile = load_vector_tile(instance.id, z, x, y, filters, cluster, fields)
+        except ValueError as e:
+            return HttpResponse(str(e), status=400)
+        response = HttpResponse(
+            tile,
+            content_type='application/octet-stream',
+            status=200 if tile else 204,
+        )
+        return set_cache_headers(response, request, etag, version, not styled)
+
+    @action(
+        detail=True,
+        methods=['get'],
+        url_path=r'features/(?P<feature_id>\d+)',
+        url_name='feature',
+    )
+    def get_feature(self, request, feature_id: str, **kwargs):
+        # Tiles may only carry some properties; the full set is fetched by feature id
+        instance = self.get_object()
+        feature = get_object_or_404(VectorFeature, vector_data=instance, id=feature_id)
+        return Response(feature.properties, status=200)
+
+    @action(
+        detail=False,
+        methods=['get'],
+        url_path=r'tiles/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)',
+        url_name='composite_tiles',
+    )
+    def get_composite_vector_tile(self, request, x: str, y: str, z: str):
+        try:
+            layers = get_tile_layers(request.query_params.get('layers'))
+        except ValueError as e:
+            return HttpResponse(str(e), status=400)
+
+        # Every layer must pass the checks that get_object applies to a single layer
+        queryset = self.filter_queryset(self.get_queryset())
+        vectors = {v.id: v for v in queryset.filter(id__in=[layer['id'] for layer in layers])}
+        for layer in layers:
+            if layer['id'] not in vectors:
+                raise Http404
+            self.check_object_permissions(request, vectors[layer['id']])
+
+        styled_fields = {}
+        try:
+            for layer in layers:
+                style = layer.pop('style')
+                if layer['fields'] is None and style is not None:
+                    layer['fields'] = vectors[layer['id']].get_style_fields(style)
+                    styled_fields[layer['name']] = layer['fields']
+        except ValueError as e:
+            return HttpResponse(str(e), status=400)
+
+        # The composite version lists the version of each layer, joined by dots
+        version = '.'.join(str(vectors[layer['id']].content_version) for layer in layers)
+        styled = bool(styled_fields)
+        etag_parts = [layer['id'] for layer in layers] + [version]
+        if styled:
+            etag_parts.append(get_style_hash(styled_fields))
+        etag = get_content_etag('composite', *etag_parts)
+        not_modified = get_not_modified_response(request, etag, version, not styled)
+        if not_modified is not None:
+            return not_modified
 
-        tile = row[0]
-        return HttpResponse(
+        try:
+            tile = load_composite_vector_tile(layers, z, x, y)
+        except ValueError as e:
+            return HttpResponse(str(e), status=400)
+        response = HttpResponse(
             tile,
             content_type='application/octet-stream',
             status=200 if tile else 204,
         )
+        return set_cache_headers(response, request, etag, version, not styled)
@@ -81,6 +81,9 @@ class DatasetViewSet(ModelViewSet):
             layer_options=request.data.get('layer_options'),
             network_options=request.data.get('network_options'),
             region_options=request.data.get('region_options'),
+            seed_options=request.data.get('seed_options'),
+            archive_options=request.data.get('archive_options'),
+            mosaic_options=request.data.get('mosaic_options'),
         )
 
         return Response(TaskResultSerializer(result).data, status=200)
@@ -0,0 +1,68 @@
+import io
+
+import numpy
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+import zstandard
+
+# Binary responses describe the array layout in these headers
+ARRAY_SHAPE_HEADER = 'X-Array-Shape'
+ARRAY_DTYPE_HEADER = 'X-Array-Dtype'
+ZSTD_LEVEL = 3
+
+
+def get_little_endian_array(array: numpy.ndarray) -> numpy.ndarray:
+    return numpy.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<'))
+
+
+def encode_array(array: numpy.ndarray, fmt: str) -> bytes:
+    array = get_little_endian_array(array)
+    if fmt == 'raw':
+        return array.tobytes()
+    if fmt == 'npy':
+        buffer = io.BytesIO()
+        numpy.save(buffer, array, allow_pickle=False)
+        return buffer.getvalue()
+    if fmt == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(array.tobytes())
+    raise ValueError(f'Unsupported array format: {fmt}')
+
+
+def get_array_headers(array: numpy.ndarray) -> dict:
+    return {
+        ARRAY_SHAPE_HEADER: ','.join(str(size) for size in array.shape),
+        ARRAY_DTYPE_HEADER: get_little_endian_array(array).dtype.str,
+    }
+
+
+class ArrayRenderer(BaseRenderer):
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, numpy.ndarray):
+            return encode_array(data, self.format)
+        # Errors are still reported as JSON
+        return JSONRenderer().render(data, renderer_context=renderer_context)
+
+
+class RawArrayRenderer(ArrayRenderer):
+    """Little-endian typed buffer, with its shape and dtype in the response headers."""
+
+    media_type = 'application/octet-stream'
+    format = 'raw'
+
+
+class NpyArrayRenderer(ArrayRenderer):
+    media_type = 'application/x-npy'
+    format = 'npy'
+
+
+class ZstdArrayRenderer(ArrayRenderer):
+    """Zstandard compressed raw buffer, with its shape and dtype in the response headers."""
+
+    media_type = 'application/zstd'
+    format = 'zstd'
+
+
+# JSON remains the default, for clients which do not ask for a binary format
+array_renderers = [JSONRenderer, RawArrayRenderer, NpyArrayRenderer, ZstdArrayRenderer]
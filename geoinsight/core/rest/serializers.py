@@ -123,6 +123,7 @@ class FileItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = FileItem
         fields = '__all__'
+        read_only_fields = ['content_hash']
 
 
 class ChartSerializer(serializers.ModelSerializer):
@@ -4,6 +4,7 @@ from .flood_network_failure import FloodNetworkFailure
 from .flood_simulation import FloodSimulation
 from .geoai_segmentation import GeoAISegmentation
 from .network_recovery import NetworkRecovery
+from .zonal_statistics import ZonalStatistics
 
 analysis_types: list[type[AnalysisType]] = [
     FloodSimulation,
@@ -11,6 +12,7 @@ analysis_types: list[type[AnalysisType]] = [
     NetworkRecovery,
     GeoAISegmentation,
     CreateRoadNetwork,
+    ZonalStatistics,
 ]
 
 __all__ = [analysis_type.__name__ for analysis_type in analysis_types]
@@ -141,7 +141,6 @@ def create_road_network(result_id):
 
         vector_data.write_geojson_data(geojson_from_network(dataset))
         create_vector_features(vector_data)
-        vector_data.get_summary()
 
         result.outputs = dict(roads=dataset.id)
     except Exception as e:
@@ -2,9 +2,10 @@ import math
 
 from celery import shared_task
 from django.conf import settings
-from django_large_image import tilesource, utilities
+from django_large_image import tilesource
 import numpy
 
+from geoinsight.core.blob_cache import get_blob_path
 from geoinsight.core.models import Layer, Network, TaskResult
 
 from .analysis_type import AnalysisType
@@ -140,7 +141,7 @@ def flood_network_failure(result_id):
 
             # Assume that all frames in flood_layer refer to frames of the same RasterData
             raster = flood_layer.frames.first().raster
-            raster_path = utilities.field_file_to_local_path(raster.cloud_optimized_geotiff)
+            raster_path = get_blob_path(raster.cloud_optimized_geotiff)
             source = tilesource.get_tilesource_from_path(raster_path)
             metadata = source.getMetadata()
 
@@ -1,13 +1,14 @@
 import datetime
-import os
+from pathlib import Path
+import tempfile
 
 from celery import shared_task
 from django.conf import settings
 from django.core.files.base import ContentFile
-from django_large_image import utilities
 import large_image
 from pyproj import CRS, Transformer
 
+from geoinsight.core.blob_cache import get_blob_path
 from geoinsight.core.models import Dataset, FileItem, RasterData, TaskResult
 
 from .analysis_type import AnalysisType
@@ -88,51 +89,57 @@ def geoai_segmentation(result_id):
             result.save()
 
             result.write_status('Reading aerial imagery...')
-            imagery_path = utilities.field_file_to_local_path(imagery.cloud_optimized_geotiff)
-            segmentation_path = imagery_path.parent / 'segmentation.tif'
-            mask_path = imagery_path.parent / f'{segmentation_prompt}_mask.tif'
-
-            result.write_status('Loading GeoAI CLIPSegmentation model...')
-            segmenter = geoai.CLIPSegmentation(tile_size=tile_size, overlap=tile_overlap)
-
-            result.write_status(f'Segmenting image with prompt "{segmentation_prompt}"...')
-            segmenter.segment_image(
-                imagery_path,
-                output_path=segmentation_path,
-                text_prompt=segmentation_prompt,
-                threshold=threshold,
-                smoothing_sigma=smoothing_sigma,
-            )
-
-            # Reformat data as binary mask
-            seg = large_image.open(segmentation_path)
-            sink = large_image.new()
-            region_size = 1000
-            for iy in range(int(seg.sizeY / region_size)):
-                for ix in range(int(seg.sizeX / region_size)):
-                    region = dict(
-                        top=iy * region_size,
-                        left=ix * region_size,
-                        bottom=(iy + 1) * region_size,
-                        right=(ix + 1) * region_size,
-                    )
-                    data, _ = seg.getRegion(region=region, format='numpy')
-                    mask = (data[:, :, 0] > 0).astype(int) * 255
-                    sink.addTile(mask, x=region['left'], y=region['top'])
-
-            # Apply georeferencing to raster output
-            projection = 'epsg:4326'
-            original = large_image.open(imagery_path)
-            source_bounds = original.getMetadata().get('sourceBounds')
-            crs_from = CRS(source_bounds.get('srs'))
-            crs_to = CRS(projection)
-            transformer = Transformer.from_crs(crs_from, crs_to)
-            p1 = transformer.transform(source_bounds['xmin'], source_bounds['ymax'])
-            p2 = transformer.transform(source_bounds['xmax'], source_bounds['ymin'])
-            gcps = [[p1[1], p1[0], 0, 0], [p2[1], p2[0], sink.sizeX, sink.sizeY]]
-            sink.projection = projection
-            sink.gcps = gcps
-            sink.write(mask_path)
+            imagery_path = get_blob_path(imagery.cloud_optimized_geotiff)
+            # Outputs are written next to each other, outside of the shared blob cache
+            with tempfile.TemporaryDirectory() as tmp:
+                output_dir = Path(tmp)
+                segmentation_path = output_dir / 'segmentation.tif'
+                mask_path = output_dir / f'{segmentation_prompt}_mask.tif'
+
+                result.write_status('Loading GeoAI CLIPSegmentation model...')
+                segmenter = geoai.CLIPSegmentation(tile_size=tile_size, overlap=tile_overlap)
+
+                result.write_status(f'Segmenting image with prompt "{segmentation_prompt}"...')
+                segmenter.segment_image(
+                    imagery_path,
+                    output_path=segmentation_path,
+                    text_prompt=segmentation_prompt,
+                    threshold=threshold,
+                    smoothing_sigma=smoothing_sigma,
+                )
+
+                # Reformat data as binary mask
+                seg = large_image.open(segmentation_path)
+                sink = large_image.new()
+                region_size = 1000
+                for iy in range(int(seg.sizeY / region_size)):
+                    for ix in range(int(seg.sizeX / region_size)):
+                        region = dict(
+                            top=iy * region_size,
+                            left=ix * region_size,
+                            bottom=(iy + 1) * region_size,
+                            right=(ix + 1) * region_size,
+                        )
+                        data, _ = seg.getRegion(region=region, format='numpy')
+                        mask = (data[:, :, 0] > 0).astype(int) * 255
+                        sink.addTile(mask, x=region['left'], y=region['top'])
+
+                # Apply georeferencing to raster output
+                projection = 'epsg:4326'
+                original = large_image.open(imagery_path)
+                source_bounds = original.getMetadata().get('sourceBounds')
+                crs_from = CRS(source_bounds.get('srs'))
+                crs_to = CRS(projection)
+                transformer = Transformer.from_crs(crs_from, crs_to)
+                p1 = transformer.transform(source_bounds['xmin'], source_bounds['ymax'])
+                p2 = transformer.transform(source_bounds['xmax'], source_bounds['ymin'])
+                gcps = [[p1[1], p1[0], 0, 0], [p2[1], p2[0], sink.sizeX, sink.sizeY]]
+                sink.projection = projection
+                sink.gcps = gcps
+                sink.write(mask_path)
+
+                with mask_path.open('rb') as f:
+                    mask_content = ContentFile(f.read())
 
             result.write_status('Saving results...')
             dataset_name = f'Segmentation of {segmentation_prompt}'
@@ -153,10 +160,9 @@ def geoai_segmentation(result_id):
                 name=mask_path.name,
                 dataset=dataset,
                 file_type='tif',
-                file_size=os.path.getsize(mask_path),
+                file_size=mask_content.size,
             )
-            with mask_path.open('rb') as f:
-                raster_file_item.file.save(mask_path, ContentFile(f.read()))
+            raster_file_item.file.save(mask_path.name, mask_content)
 
             dataset.spawn_conversion_task(asynchronous=False)
             result.outputs = dict(result=dataset.id)
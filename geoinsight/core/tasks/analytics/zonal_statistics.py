@@ -0,0 +1,131 @@
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+
+from geoinsight.core.models import Chart, Dataset, RasterData, TaskResult
+from geoinsight.core.tasks.zonal_stats import get_zonal_stats
+
+from .analysis_type import AnalysisType
+
+
+class ZonalStatistics(AnalysisType):
+    def __init__(self):
+        super().__init__()
+        self.name = 'Zonal Statistics'
+        self.description = (
+            'Select a raster and a dataset of regions to summarize raster values, '
+            'such as flood depth, within each region.'
+        )
+        self.db_value = 'zonal_statistics'
+        self.input_types = {
+            'raster': 'RasterData',
+            'regions': 'Dataset',
+            'threshold': 'number',
+        }
+        self.output_types = {'chart': 'Chart'}
+
+    @classmethod
+    def is_enabled(cls):
+        return settings.ENABLE_TASK_ZONAL_STATISTICS
+
+    def get_input_options(self):
+        return {
+            'raster': RasterData.objects.all(),
+            'regions': Dataset.objects.filter(regions__isnull=False).distinct(),
+            'threshold': [dict(min=0, max=10, step=0.05)],
+        }
+
+    def run_task(self, *, project, **inputs):
+        result = TaskResult.objects.create(
+            name='Zonal Statistics',
+            task_type=self.db_value,
+            inputs=inputs,
+            project=project,
+            status='Initializing task...',
+        )
+        zonal_statistics.delay(result.id)
+        return result
+
+
+@shared_task
+def zonal_statistics(result_id):
+    result = TaskResult.objects.get(id=result_id)
+    try:
+        # Verify inputs
+        raster = None
+        raster_id = result.inputs.get('raster')
+        if raster_id is None:
+            result.write_error('Raster not provided')
+        else:
+            try:
+                raster = RasterData.objects.get(id=raster_id)
+            except RasterData.DoesNotExist:
+                result.write_error('Raster not found')
+
+        dataset = None
+        dataset_id = result.inputs.get('regions')
+        if dataset_id is None:
+            result.write_error('Regions not provided')
+        else:
+            try:
+                dataset = Dataset.objects.get(id=dataset_id)
+            except Dataset.DoesNotExist:
+                result.write_error('Regions not found')
+
+        threshold = result.inputs.get('threshold')
+        if threshold is not None:
+            try:
+                threshold = float(threshold)
+            except ValueError:
+                result.write_error('Threshold not valid')
+
+        # Run task
+        if result.error is None:
+            # Update name
+            result.name = f'Zonal Statistics of {raster.name} in {dataset.name}'
+            result.save()
+
+            frames = [frame.get('Index') for frame in (raster.metadata or {}).get('frames', [])]
+            result.write_status(f'Summarizing {len(frames) or 1} frames...')
+            stats = get_zonal_stats(raster, dataset, frames=frames, threshold=threshold)
+
+            # Chart the mean and maximum value of each region in the first frame
+            zones = stats[0]['zones']
+            chart, _ = Chart.objects.get_or_create(
+                name=result.name,
+                description=f'Values of {raster.name} within each region of {dataset.name}',
+                project=result.project,
+            )
+            chart.metadata = dict(
+                source='Generated by Zonal Statistics Analysis Task',
+                created=timezone.now().strftime('%d/%m/%Y %H:%M'),
+                threshold=threshold,
+                statistics=stats,
+            )
+            chart.chart_data = dict(
+                labels=[zone['name'] for zone in zones],
+                datasets=[
+                    dict(
+                        data=[zone.get('mean') for zone in zones],
+                        label='Mean',
+                        borderColor='#0000ff',
+                        backgroundColor='#0000ff',
+                    ),
+                    dict(
+                        data=[zone.get('max') for zone in zones],
+                        label='Maximum',
+                        borderColor='#ff0000',
+                        backgroundColor='#ff0000',
+                    ),
+                ],
+            )
+            chart.chart_options = dict(
+                chart_title=f'{raster.name} by Region',
+                x_title='Region',
+                y_title='Value',
+            )
+            chart.save()
+            result.outputs = dict(chart=chart.id)
+    except Exception as e:
+        result.error = str(e)
+    result.complete()
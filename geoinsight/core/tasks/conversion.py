@@ -1,18 +1,24 @@
+import hashlib
 import json
 import logging
+import math
 from pathlib import Path
 import tempfile
 import zipfile
 
-from django.core.files.base import ContentFile
-from django_large_image import utilities
-import geopandas
+from django.conf import settings
+from django.core.files.base import File
 import numpy
 import rasterio
+from rasterio.windows import Window
 import shapefile
 
+from geoinsight.core.blob_cache import get_blob_path
 from geoinsight.core.models import RasterData, VectorData
 
+from .geojson import get_geojson_projection, write_feature_collection
+from .raster import get_raster_statistics
+
 RASTER_FILETYPES = ['tif', 'tiff', 'nc', 'jp2']
 IGNORE_FILETYPES = ['dbf', 'sbn', 'sbx', 'cpg', 'shp.xml', 'shx', 'vrt', 'hdf', 'lyr']
 
@@ -21,8 +27,71 @@ logging.getLogger('pyvips').setLevel(logging.ERROR)
 logging.getLogger('rasterio').setLevel(logging.ERROR)
 logging.getLogger('large-image-converter').setLevel(logging.ERROR)
 
+# Size of the output blocks of the rasterio fallback; rows are copied in bands of a multiple
+# of this height
+RASTERIO_BLOCK_SIZE = 512
+
+
+def get_conversion_key(file_item, *options) -> str | None:
+    """Identify a file's content, name and metadata, with the options its data depends on."""
+    if not file_item.content_hash:
+        return None
+    key = [file_item.content_hash, file_item.name, file_item.file_type, file_item.metadata]
+    return hashlib.sha256(json.dumps([*key, *options], sort_keys=True).encode()).hexdigest()
+
+
+def get_gdal_options():
+    threads = settings.CONVERSION_THREADS
+    return dict(
+        GDAL_NUM_THREADS=str(threads) if threads else 'ALL_CPUS',
+        GDAL_CACHEMAX=settings.CONVERSION_GDAL_CACHEMAX,
+    )
+
+
+def get_output_dtype(input_data):
+    # Keep the source dtype where GeoTIFF supports it, promoting bands which differ
+    dtype = numpy.result_type(*input_data.dtypes)
+    nodata = input_data.nodata
+    if not rasterio.dtypes.check_dtype(dtype) or (
+        nodata is not None and not rasterio.dtypes.in_dtype_range(nodata, dtype)
+    ):
+        dtype = numpy.float32
+    return numpy.dtype(dtype).name
+
+
+def copy_raster_blocks(input_data, output_path):
+    """Copy all bands of a raster to a tiled GeoTIFF, one block at a time."""
+    profile = dict(
+        driver='GTiff',
+        height=input_data.height,
+        width=input_data.width,
+        count=input_data.count,
+        dtype=get_output_dtype(input_data),
+        crs=input_data.crs,
+        transform=input_data.transform,
+        nodata=input_data.nodata,
+        tiled=True,
+        blockxsize=RASTERIO_BLOCK_SIZE,
+        blockysize=RASTERIO_BLOCK_SIZE,
+        BIGTIFF='IF_SAFER',
+        NUM_THREADS=get_gdal_options()['GDAL_NUM_THREADS'],
+    )
+    # rows are copied in full-width bands, so each input strip or tile is decoded once
+    # rather than once per output block column; bands span whole input blocks and whole
+    # output blocks, and memory use is bounded by one band of every raster band
+    input_block_height = input_data.block_shapes[0][0]
+    band_height = RASTERIO_BLOCK_SIZE * math.ceil(input_block_height / RASTERIO_BLOCK_SIZE)
+    with rasterio.open(output_path, 'w', **profile) as output_data:
+        for row in range(0, input_data.height, band_height):
+            window = Window(0, row, input_data.width, min(band_height, input_data.height - row))
+            block = input_data.read(window=window)
+            output_data.write(block.astype(profile['dtype'], copy=False), window=window)
+        for i, description in enumerate(input_data.descriptions, start=1):
+            if description:
+                output_data.set_band_description(i, description)
+
 
-def get_cog_path(file):
+def get_cog_path(file, output_dir=None):
     import large_image
     import large_image_converter
 
@@ -40,33 +109,97 @@ def get_cog_path(file):
     except large_image.exceptions.TileSourceError:
         pass
 
+    # intermediate and converted files are written beside the original unless told otherwise
+    if output_dir is None:
+        output_dir = file.parent
+
     if raster_path is None:
         # if original data cannot be interpreted by large_image, use rasterio
-        raster_path = file.parent / 'rasterio.tiff'
-        with open(file, 'rb') as f:
-            input_data = rasterio.open(f)
-            output_data = rasterio.open(
-                raster_path,
-                'w',
-                driver='GTiff',
-                height=input_data.height,
-                width=input_data.width,
-                count=1,
-                dtype=numpy.float32,
-                crs=input_data.crs,
-                transform=input_data.transform,
-            )
-            band = input_data.read(1)
-            output_data.write(band, 1)
-            output_data.close()
+        raster_path = output_dir / 'rasterio.tiff'
+        # open by path, so GDAL reads blocks on demand rather than the whole file
+        with rasterio.Env(**get_gdal_options()), rasterio.open(file) as input_data:
+            copy_raster_blocks(input_data, raster_path)
 
-    cog_path = file.parent / file.name.replace(file.suffix, 'tiff')
+    cog_path = output_dir / file.name.replace(file.suffix, 'tiff')
     # use large_image to convert new raster data to COG
-    large_image_converter.convert(str(raster_path), str(cog_path), overwrite=True)
+    large_image_converter.convert(
+        str(raster_path),
+        str(cog_path),
+        overwrite=True,
+        concurrency=settings.CONVERSION_THREADS or None,
+    )
+    return cog_path
+
+
+def build_mosaic(paths, output_dir):
+    """
+    Merge rasters into one COG, through a GDAL VRT over all of them.
+
+    Sources in another projection than the first are warped into it. The merged COG is
+    tiled with overviews, so a region read only touches the blocks that intersect it.
+    """
+    import large_image_converter
+    from osgeo import gdal, osr
+
+    sources = []
+    band_count, srs = None, None
+    for i, path in enumerate(paths):
+        source = gdal.Open(str(path))
+        if source is None:
+            raise ValueError(f'Unable to open {path.name} for the mosaic.')
+        source_srs = osr.SpatialReference(wkt=source.GetProjection())
+        if band_count is None:
+            band_count, srs = source.RasterCount, source_srs
+        elif source.RasterCount != band_count:
+            raise ValueError(
+                f'{path.name} has {source.RasterCount} bands, but the mosaic has {band_count}.'
+            )
+        if srs.IsSame(source_srs):
+            sources.append(str(path))
+        else:
+            # a warped VRT reprojects blocks on demand, rather than writing a copy
+            warped_path = output_dir / f'warped_{i}.vrt'
+            gdal.Warp(str(warped_path), source, format='VRT', dstSRS=srs.ExportToWkt())
+            sources.append(str(warped_path))
+        source = None
+
+    vrt_path = output_dir / 'mosaic.vrt'
+    mosaic = gdal.BuildVRT(str(vrt_path), sources)
+    if mosaic is None:
+        raise ValueError('Unable to build the mosaic.')
+    # closing the dataset writes the VRT to disk
+    mosaic = None
+
+    cog_path = output_dir / 'mosaic.tiff'
+    large_image_converter.convert(
+        str(vrt_path),
+        str(cog_path),
+        overwrite=True,
+        concurrency=settings.CONVERSION_THREADS or None,
+    )
     return cog_path
 
 
-def convert_files(*files, file_item=None, combine=False):
+def create_raster_data(cog_path, name, dataset, file_item=None, metadata=None):
+    import large_image
+
+    metadata = dict(metadata or {})
+    source = large_image.open(cog_path)
+    metadata.update(source.getMetadata())
+    metadata['statistics'] = get_raster_statistics(source)
+    raster_data = RasterData.objects.create(
+        name=name,
+        dataset=dataset,
+        source_file=file_item,
+        metadata=metadata,
+    )
+    # the COG is uploaded from disk, rather than read into memory
+    with open(cog_path, 'rb') as f:
+        raster_data.cloud_optimized_geotiff.save(cog_path.name, File(f))
+    return raster_data
+
+
+def convert_files(*files, file_item=None, combine=False, output_dir=None, mosaic_paths=None):
     source_projection = 'epsg:4326'
     geodata_set = []
     cog_set = []
@@ -82,62 +215,63 @@ def convert_files(*files, file_item=None, combine=False):
                 continue
         elif file.name.endswith('.shp'):
             reader = shapefile.Reader(file)
-            geodata_set.append(dict(name=file.name, features=reader.__geo_interface__['features']))
+            # the projection is set once the .prj file, which may come later, has been read
+            features = (record.__geo_interface__ for record in reader.iterShapeRecords())
+            geodata_set.append(dict(name=file.name, sources=[dict(features=features)]))
         elif any(file.name.endswith(suffix) for suffix in ['.json', '.geojson']):
-            with open(file, 'rb') as f:
-                data = json.load(f)
-                geodata_set.append(dict(name=file.name, features=data.get('features')))
-                source_projection = data.get('crs', {}).get('properties', {}).get('name')
+            # features are streamed from the file when the vector data is written
+            source = dict(path=file, projection=get_geojson_projection(file))
+            geodata_set.append(dict(name=file.name, sources=[source]))
         elif any(file.name.endswith(suffix) for suffix in RASTER_FILETYPES):
-            cog_path = get_cog_path(file)
-            if cog_path:
+            cog_path = get_cog_path(file, output_dir=output_dir)
+            if cog_path and mosaic_paths is not None:
+                # multiframe rasters are not converted, and have no single image to mosaic
+                if cog_path == file:
+                    raise ValueError(f'{file.name} has multiple frames and cannot be mosaicked.')
+                # rasters to be mosaicked are collected rather than stored one by one, under
+                # unique names, since files in different folders of a zip may share a name
+                mosaic_path = cog_path.with_name(f'{len(mosaic_paths)}_{cog_path.name}')
+                mosaic_paths.append(cog_path.replace(mosaic_path))
+            elif cog_path:
                 cog_set.append(dict(name=file.name, path=cog_path))
         elif not any(file.name.endswith(suffix) for suffix in IGNORE_FILETYPES):
             print('\t\tUnable to convert', file.name)
 
+    for geodata in geodata_set:
+        for source in geodata['sources']:
+            source.setdefault('projection', source_projection)
+
     if combine:
-        # combine only works for vector data currently, assumes consistent projection
-        all_features = []
+        # combine only works for vector data currently
+        all_sources = []
         for geodata in geodata_set:
-            all_features += geodata.get('features')
-        geodata_set = [dict(name=file_item.name, features=all_features)]
+            all_sources += geodata.get('sources')
+        geodata_set = [dict(name=file_item.name, sources=all_sources)]
 
     for geodata in geodata_set:
-        data, features = geodata.get('data'), geodata.get('features')
-        if data is None and len(features):
-            gdf = geopandas.GeoDataFrame.from_features(features)
-            if source_projection is not None:
-                gdf = gdf.set_crs(source_projection, allow_override=True)
-                gdf = gdf.to_crs(4326)
-            data = json.loads(gdf.to_json())
         vector_data = VectorData.objects.create(
             name=geodata.get('name'),
             dataset=file_item.dataset,
             source_file=file_item,
             metadata=metadata,
         )
-        vector_data.write_geojson_data(data)
+        # features are reprojected and written in chunks, rather than held in memory at once
+        with tempfile.TemporaryDirectory() as temp_dir:
+            geojson_path = Path(temp_dir, 'vectordata.geojson')
+            with open(geojson_path, 'wb') as f:
+                write_feature_collection(geodata.get('sources'), f)
+            vector_data.write_geojson_data(geojson_path)
         print('\t\t', str(vector_data), 'created for ' + geodata.get('name'))
 
     for cog in cog_set:
-        import large_image
-
-        cog_path = cog.get('path')
-        source = large_image.open(cog_path)
-        metadata.update(source.getMetadata())
-        raster_data = RasterData.objects.create(
-            name=cog.get('name'),
-            dataset=file_item.dataset,
-            source_file=file_item,
-            metadata=metadata,
+        raster_data = create_raster_data(
+            cog.get('path'), cog.get('name'), file_item.dataset, file_item, metadata
         )
-        with open(cog_path, 'rb') as f:
-            raster_data.cloud_optimized_geotiff.save(cog_path.name, ContentFile(f.read()))
         print('\t\t', str(raster_data), 'created for ' + cog.get('name'))
 
 
-def convert_file_item(file_item):
-    path = utilities.field_file_to_local_path(file_item.file)
+def convert_file_item(file_item, output_dir=None, mosaic_paths=None):
+    path = get_blob_path(file_item.file)
     if file_item.file_type == 'zip':
         # write contents to temporary directory for conversion
         with tempfile.TemporaryDirectory() as temp_dir:
@@ -152,6 +286,54 @@ def convert_file_item(file_item):
                 combine = False
                 if file_item.metadata:
                     combine = file_item.metadata.get('combine_contents', combine)
-                convert_files(*files, file_item=file_item, combine=combine)
+                convert_files(
+                    *files,
+                    file_item=file_item,
+                    combine=combine,
+                    output_dir=output_dir,
+                    mosaic_paths=mosaic_paths,
+                )
     else:
-        convert_files(path, file_item=file_item)
+        # keep converted outputs out of the shared blob cache
+        with tempfile.TemporaryDirectory() as temp_dir:
+            convert_files(
+                path,
+                file_item=file_item,
+                output_dir=output_dir or Path(temp_dir),
+                mosaic_paths=mosaic_paths,
+            )
+
+
+def convert_mosaic(dataset, file_items, mosaic_options, result=None):
+    """
+    Convert the vector files of a dataset as usual, and all of its rasters into one mosaic.
+
+    The mosaic is a single RasterData, named after mosaic_options['name'] or the dataset.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        mosaic_paths = []
+        for file_item in file_items:
+            if result is not None:
+                result.write_status(f'Converting file {file_item.name}...')
+            # each file item converts into its own directory, so file names cannot collide
+            output_dir = Path(temp_dir, str(file_item.id))
+            output_dir.mkdir()
+            convert_file_item(file_item, output_dir=output_dir, mosaic_paths=mosaic_paths)
+        if not mosaic_paths:
+            return None
+
+        if result is not None:
+            result.write_status(f'Building mosaic of {len(mosaic_paths)} rasters...')
+        cog_path = build_mosaic(mosaic_paths, Path(temp_dir))
+        name = mosaic_options.get('name') or dataset.name
+        raster_data = create_raster_data(
+            cog_path,
+            name,
+            dataset,
+            metadata=dict(
+                source_filenames=[file_item.name for file_item in file_items],
+                mosaic=dict(sources=[path.name for path in mosaic_paths]),
+            ),
+        )
+        print('\t\t', str(raster_data), f'created as a mosaic of {len(mosaic_paths)} rasters')
+        return raster_data
@@ -1,23 +1,138 @@
 import json
 
-from django.contrib.gis.geos import GEOSGeometry
+from django.db import connection, transaction
+from psycopg.types.json import Jsonb
+import shapely
 
 from geoinsight.core.models import VectorData, VectorFeature
 
+from .geojson import iter_chunks
+from .summary import (
+    SUMMARY_CHUNK_SIZE,
+    get_summary_output,
+    merge_summaries,
+    summarize_features,
+)
+from .tile_archive import delete_tile_archive
+from .tiles import GENERALIZATION_ZOOM_LEVELS, get_generalization_tolerance
 
-def create_vector_features(vector_data: VectorData):
-    features = vector_data.read_geojson_data()['features']
-    vector_features = []
-    for feature in features:
-        vector_features.append(
-            VectorFeature(
-                vector_data=vector_data,
-                geometry=GEOSGeometry(json.dumps(feature['geometry'])),
-                properties=feature['properties'],
-            )
+# Features are projected once, in a subquery, and every geometry column is written in one pass
+PREPARE_GEOMETRIES_SQL = """
+UPDATE core_vectorfeature t
+SET
+    geometry_3857 = p.geometry_3857,
+    REPLACE_WITH_COLUMNS
+FROM (
+    SELECT id, ST_Transform(geometry, 3857) as geometry_3857
+    FROM core_vectorfeature
+    WHERE vector_data_id = %(vector_data_id)s REPLACE_WITH_CONDITION
+) p
+WHERE t.id = p.id
+;
+"""
+
+GENERALIZED_COLUMN_SQL = """
+geometry_z{level} = CASE
+    WHEN ST_Dimension(p.geometry_3857) = 0 THEN p.geometry_3857
+    WHEN ST_Dimension(p.geometry_3857) = 1
+        AND ST_Length(p.geometry_3857) < %(tolerance_{level})s THEN NULL
+    WHEN ST_Dimension(p.geometry_3857) = 2
+        AND ST_Area(p.geometry_3857) < %(tolerance_{level})s ^ 2 THEN NULL
+    ELSE ST_SimplifyPreserveTopology(p.geometry_3857, %(tolerance_{level})s)
+END
+"""
+
+
+# Binary COPY reads a geometry column as EWKB, so geometries are written as plain bytes
+COPY_VECTOR_FEATURES_SQL = """
+COPY core_vectorfeature (vector_data_id, geometry, properties) FROM STDIN (FORMAT binary)
+"""
+
+
+def prepare_vector_features(vector_data: VectorData, missing_only: bool = False) -> int:
+    """
+    Fill the Web Mercator geometry and the simplified geometries used for low zoom tiles.
+
+    Lines and polygons which would be smaller than the tolerance of a zoom level are
+    left null at that level. With missing_only, only features without a Web Mercator
+    geometry are filled. Returns the number of features updated.
+    """
+    columns = ','.join(
+        GENERALIZED_COLUMN_SQL.format(level=level) for level in GENERALIZATION_ZOOM_LEVELS
+    )
+    sql = PREPARE_GEOMETRIES_SQL.replace('REPLACE_WITH_COLUMNS', columns).replace(
+        'REPLACE_WITH_CONDITION', 'AND geometry_3857 IS NULL' if missing_only else ''
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql,
+            {
+                'vector_data_id': vector_data.id,
+                **{
+                    f'tolerance_{level}': get_generalization_tolerance(level)
+                    for level in GENERALIZATION_ZOOM_LEVELS
+                },
+            },
         )
+        return cursor.rowcount
+
+
+def get_feature_rows(features, srid: int = 4326):
+    """Yield the EWKB geometry and properties of GeoJSON features, skipping empty geometries."""
+    for chunk in iter_chunks(feature for feature in features if feature.get('geometry')):
+        geometries = shapely.from_geojson([json.dumps(feature['geometry']) for feature in chunk])
+        geometries = shapely.set_srid(geometries, srid)
+        # The geometry column is two dimensional, so any Z coordinates are dropped
+        ewkb = shapely.to_wkb(geometries, output_dimension=2, include_srid=True)
+        for geometry, feature in zip(ewkb, chunk):
+            yield geometry, feature.get('properties') or {}
+
+
+def copy_vector_features(vector_data: VectorData, rows) -> int:
+    """
+    Insert VectorFeatures from (EWKB geometry, properties) rows with a binary COPY.
+
+    Rows are streamed to the database as they are produced, in one transaction,
+    so memory use does not grow with the number of features.
+    """
+    count = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        with cursor.copy(COPY_VECTOR_FEATURES_SQL) as copy:
+            copy.set_types(['int8', 'bytea', 'jsonb'])
+            for geometry, properties in rows:
+                copy.write_row((vector_data.id, geometry, Jsonb(properties)))
+                count += 1
+    return count
+
+
+def create_vector_features(vector_data: VectorData) -> int:
+    # Features are streamed from the stored GeoJSON
+    return load_vector_features(vector_data, get_feature_rows(vector_data.iter_geojson_features()))
+
+
+def load_vector_features(vector_data: VectorData, rows) -> int:
+    """
+    Replace the features of a VectorData with (EWKB geometry, properties) rows.
 
-    created = VectorFeature.objects.bulk_create(vector_features)
-    print('\t\t', f'{len(created)} vector features created.')
+    Rows are copied into the database a chunk at a time; each chunk is summarized as soon
+    as it is loaded, while its pages are still cached, and the partial summaries are merged
+    into the summary of the data. The tile geometries are then filled in one pass.
+    """
+    created = 0
+    summary = None
+    last_id = 0
+    with transaction.atomic():
+        # Features left by an earlier or failed run are replaced, rather than duplicated
+        VectorFeature.objects.filter(vector_data=vector_data).delete()
+        for chunk in iter_chunks(rows, SUMMARY_CHUNK_SIZE):
+            created += copy_vector_features(vector_data, chunk)
+            partial, last_id = summarize_features(vector_data.id, last_id)
+            summary = merge_summaries(summary, partial)
+    vector_data.summary = get_summary_output(summary)
+    vector_data.save(update_fields=['summary'])
+    prepare_vector_features(vector_data)
+    print('\t\t', f'{created} vector features created.')
+    vector_data.bump_content_version()
+    delete_tile_archive(vector_data)
 
     return created
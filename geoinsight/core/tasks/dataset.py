@@ -1,4 +1,12 @@
-from celery import shared_task
+from datetime import timedelta
+
+from celery import group, shared_task
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+# Conversions still processing after this long are assumed lost with a worker
+CONVERSION_TIMEOUT = timedelta(hours=6)
 
 
 def create_layers_and_frames(dataset, layer_options=None):
@@ -123,6 +131,282 @@ def create_layers_and_frames(dataset, layer_options=None):
                 )
 
 
+# Status of each stage of an asynchronous conversion, as its tasks finish
+CONVERSION_STAGE_STATUS = {
+    'files': 'Converted {done} of {total} files...',
+    'vectors': 'Processed {done} of {total} vector data...',
+}
+
+
+def start_conversion_stage(result_id, stage: str, total: int):
+    from geoinsight.core.models import TaskResult
+
+    with transaction.atomic():
+        result = TaskResult.objects.select_for_update().get(id=result_id)
+        progress = result.outputs or {}
+        progress[stage] = dict(total=total, done=0)
+        result.outputs = progress
+        result.write_status(CONVERSION_STAGE_STATUS[stage].format(done=0, total=total))
+
+
+def record_conversion_progress(result_id, stage: str, count: int = 1, error=None) -> bool:
+    """Count finished work of a conversion stage, returning True once the stage is done."""
+    from geoinsight.core.models import TaskResult
+
+    # Tasks of a stage finish concurrently on different workers, so progress
+    # is accumulated under a row lock on the shared TaskResult
+    with transaction.atomic():
+        result = TaskResult.objects.select_for_update().get(id=result_id)
+        progress = result.outputs
+        progress[stage]['done'] += count
+        result.outputs = progress
+        if error is not None:
+            result.write_error(error)
+        result.write_status(CONVERSION_STAGE_STATUS[stage].format(**progress[stage]))
+        return progress[stage]['done'] >= progress[stage]['total']
+
+
+def get_conversion_keys(file_item, options: dict) -> dict:
+    from .conversion import get_conversion_key
+
+    # Rasters only depend on the file, while vector data is also processed with these options
+    return dict(
+        vector=get_conversion_key(
+            file_item, options.get('network_options'), options.get('region_options')
+        ),
+        raster=get_conversion_key(file_item),
+    )
+
+
+def is_conversion_current(file_item, options: dict) -> bool:
+    """Return whether the data converted from a file can be reused with these options."""
+    from geoinsight.core.models import RasterData, VectorData
+
+    keys = get_conversion_keys(file_item, options)
+    converted = [
+        *[('vector', data) for data in VectorData.objects.filter(source_file=file_item)],
+        *[('raster', data) for data in RasterData.objects.filter(source_file=file_item)],
+    ]
+    return bool(converted) and all(
+        keys[data_type] is not None and (data.conversion or {}).get('key') == keys[data_type]
+        for data_type, data in converted
+    )
+
+
+def record_file_conversion(file_item, options: dict):
+    from geoinsight.core.models import RasterData, VectorData
+
+    # The file was just converted, so hashing it reads the local copy in the blob cache
+    file_item.update_content_hash()
+    keys = get_conversion_keys(file_item, options)
+    VectorData.objects.filter(source_file=file_item).update(conversion=dict(key=keys['vector']))
+    RasterData.objects.filter(source_file=file_item).update(conversion=dict(key=keys['raster']))
+
+
+def needs_processing(vector_data, options: dict) -> bool:
+    conversion = vector_data.conversion or {}
+    return not conversion.get('processed') or (
+        conversion.get('archive_options') != options.get('archive_options')
+    )
+
+
+def process_vector_data(vector_data, options: dict, result=None):
+    """Create the features of new vector data, and update its tile archive if its options differ."""
+    from .data import create_vector_features
+    from .networks import create_network
+    from .regions import create_source_regions
+    from .tile_archive import delete_tile_archive, write_tile_archive
+
+    if result is not None:
+        result.write_status(f'Processing vector data {vector_data.name}...')
+
+    conversion = vector_data.conversion or {}
+    network_options = options.get('network_options')
+    region_options = options.get('region_options')
+    archive_options = options.get('archive_options')
+    if not conversion.get('processed'):
+        # create_network and create_source_regions replace their own networks and regions,
+        # but rewrite geojson_data, so they are not run again on their output after a failure
+        if not conversion.get('prepared'):
+            if network_options:
+                create_network(vector_data, network_options)
+            elif region_options:
+                create_source_regions(vector_data, region_options)
+            conversion['prepared'] = True
+            vector_data.conversion = conversion
+            vector_data.save(update_fields=['conversion'])
+
+        # Create vector features after geojson_data may have
+        # been altered by create_network or create_source_regions;
+        # any features left by a failed run are replaced
+        create_vector_features(vector_data)
+        conversion['processed'] = True
+
+    if conversion.get('archive_options') != archive_options:
+        if archive_options:
+            if result is not None:
+                result.write_status(f'Archiving tiles of vector data {vector_data.name}...')
+            write_tile_archive(
+                vector_data,
+                min_zoom=archive_options.get('min_zoom', 0),
+                max_zoom=archive_options.get('max_zoom', 12),
+            )
+        else:
+            delete_tile_archive(vector_data)
+        conversion['archive_options'] = archive_options
+
+    vector_data.conversion = conversion
+    vector_data.save(update_fields=['conversion'])
+
+
+@shared_task
+def convert_dataset_file(dataset_id, file_item_id, options: dict, result_id=None):
+    """Convert one FileItem, or with no file_item_id, all files of the dataset into a mosaic."""
+    from geoinsight.core.models import Dataset, FileItem
+
+    from .conversion import convert_file_item, convert_mosaic
+
+    error = None
+    try:
+        if file_item_id is None:
+            dataset = Dataset.objects.get(id=dataset_id)
+            file_items = list(FileItem.objects.filter(dataset=dataset))
+            convert_mosaic(dataset, file_items, options.get('mosaic_options') or {})
+        else:
+            file_item = FileItem.objects.get(id=file_item_id)
+            convert_file_item(file_item)
+            record_file_conversion(file_item, options)
+    except Exception as e:
+        if result_id is None:
+            raise
+        if file_item_id is None:
+            error = f'Conversion of the mosaic of dataset {dataset_id} failed: {e}'
+        else:
+            error = f'Conversion of file {file_item_id} failed: {e}'
+
+    if result_id is not None and record_conversion_progress(result_id, 'files', error=error):
+        start_vector_data_stage(dataset_id, options, result_id)
+
+
+@shared_task
+def process_dataset_vector_data(dataset_id, vector_data_ids, options: dict, result_id=None):
+    from geoinsight.core.models import VectorData
+
+    error = None
+    try:
+        for vector_data in VectorData.objects.filter(id__in=vector_data_ids).order_by('id'):
+            process_vector_data(vector_data, options)
+    except Exception as e:
+        if result_id is None:
+            raise
+        error = f'Processing of vector data {vector_data_ids} failed: {e}'
+
+    if result_id is not None and record_conversion_progress(
+        result_id, 'vectors', count=len(vector_data_ids), error=error
+    ):
+        finish_dataset_conversion.delay(dataset_id, options, result_id)
+
+
+def start_vector_data_stage(dataset_id, options: dict, result_id):
+    from geoinsight.core.models import VectorData
+
+    vector_data_ids = [
+        vector_data.id
+        for vector_data in VectorData.objects.filter(dataset_id=dataset_id).order_by('id')
+        if needs_processing(vector_data, options)
+    ]
+    if not vector_data_ids:
+        finish_dataset_conversion.delay(dataset_id, options, result_id)
+        return
+
+    # Networks are numbered and regions replaced per dataset,
+    # so their vector data is processed in order by a single task
+    if options.get('network_options') or options.get('region_options'):
+        batches = [vector_data_ids]
+    else:
+        batches = [[vector_data_id] for vector_data_id in vector_data_ids]
+    start_conversion_stage(result_id, 'vectors', len(vector_data_ids))
+    group(
+        process_dataset_vector_data.si(dataset_id, batch, options, result_id) for batch in batches
+    ).apply_async()
+
+
+@shared_task
+def finish_dataset_conversion(dataset_id, options: dict, result_id=None):
+    from geoinsight.core.models import Dataset, RasterData, TaskResult, VectorData
+
+    from .tiles import seed_tiles
+
+    dataset = Dataset.objects.get(id=dataset_id)
+    create_layers_and_frames(dataset, options.get('layer_options'))
+
+    dataset.processing = False
+    dataset.save()
+
+    if result_id is not None:
+        result = TaskResult.objects.filter(id=result_id).first()
+        if result is not None:
+            result.complete()
+
+    seed_options = options.get('seed_options')
+    if seed_options:
+        seed_result = TaskResult.objects.create(
+            name=f'Tile seeding of Dataset {dataset.name}',
+            task_type='seeding',
+            inputs=dict(dataset_id=dataset.id, seed_options=seed_options),
+            status='Initializing task...',
+        )
+        seed_tiles.delay(
+            vector_data_ids=list(
+                VectorData.objects.filter(dataset=dataset).values_list('id', flat=True)
+            ),
+            raster_data_ids=list(
+                RasterData.objects.filter(dataset=dataset).values_list('id', flat=True)
+            ),
+            min_zoom=seed_options.get('min_zoom', 0),
+            max_zoom=seed_options.get('max_zoom', 12),
+            raster_style=seed_options.get('raster_style'),
+            result_id=seed_result.id,
+        )
+
+
+def fail_dataset_conversion(dataset_id, error: str, result_id=None):
+    """Clear the processing flag of a dataset whose conversion stopped, recording the error."""
+    from geoinsight.core.models import Dataset, TaskResult
+
+    Dataset.objects.filter(id=dataset_id).update(processing=False)
+    result = TaskResult.objects.filter(id=result_id).first() if result_id else None
+    if result is not None:
+        result.write_error(error)
+        result.write_status('Conversion failed.')
+
+
+def reset_stale_conversions(timeout: timedelta = CONVERSION_TIMEOUT) -> list:
+    """
+    Fail the conversions of datasets still processing after timeout, returning the datasets.
+
+    Conversion tasks lost with a worker never finish, so their datasets would otherwise
+    stay processing. Datasets converted without a TaskResult have no start time to
+    compare, so they are left to fail_dataset_conversion.
+    """
+    from geoinsight.core.models import Dataset, TaskResult
+
+    cutoff = timezone.now() - timeout
+    stale = []
+    for dataset in Dataset.objects.filter(processing=True).order_by('id'):
+        result = (
+            TaskResult.objects.filter(task_type='conversion', inputs__dataset_id=dataset.id)
+            .order_by('-created')
+            .first()
+        )
+        if result is not None and (result.completed is not None or result.created < cutoff):
+            fail_dataset_conversion(
+                dataset.id, f'Conversion did not finish within {timeout}.', result.id
+            )
+            stale.append(dataset)
+    return stale
+
+
 @shared_task
 def convert_dataset(
     dataset_id,
@@ -130,18 +414,50 @@ def convert_dataset(
     network_options=None,
     region_options=None,
     result_id=None,
+    seed_options=None,
+    archive_options=None,
+    mosaic_options=None,
+    asynchronous=False,
 ):
-    from geoinsight.core.models import Dataset, FileItem, RasterData, TaskResult, VectorData
+    """
+    Convert the files of a dataset into vector and raster data, then create its layers.
 
-    from .conversion import convert_file_item
-    from .data import create_vector_features
-    from .networks import create_network
-    from .regions import create_source_regions
+    Data converted from an unchanged file with the same options is kept, so only new or
+    changed files are converted again. When asynchronous, the files are converted in
+    parallel, then the vector data is processed in parallel, and layers are created last.
+    There is no result backend for a chord, so the last task of each stage starts the
+    next one, with progress kept in the TaskResult.
+    """
+    from geoinsight.core.models import Dataset
+
+    options = dict(
+        layer_options=layer_options,
+        network_options=network_options,
+        region_options=region_options,
+        seed_options=seed_options,
+        archive_options=archive_options,
+        mosaic_options=mosaic_options,
+    )
 
     dataset = Dataset.objects.get(id=dataset_id)
     dataset.processing = True
     dataset.save()
 
+    try:
+        start_dataset_conversion(dataset, options, result_id, asynchronous)
+    except Exception as e:
+        # The last stage clears the flag, so it is cleared here if the conversion stops before it
+        fail_dataset_conversion(
+            dataset_id, f'Conversion of dataset {dataset_id} failed: {e}', result_id
+        )
+        raise
+
+
+def start_dataset_conversion(dataset, options: dict, result_id=None, asynchronous=False):
+    from geoinsight.core.models import FileItem, RasterData, TaskResult, VectorData
+
+    mosaic_options = options.get('mosaic_options')
+    region_options = options.get('region_options')
     result = None
     if result_id:
         try:
@@ -149,33 +465,52 @@ def convert_dataset(
         except TaskResult.DoesNotExist:
             pass
 
-    VectorData.objects.filter(dataset=dataset).delete()
-    RasterData.objects.filter(dataset=dataset).delete()
+    file_items = list(FileItem.objects.filter(dataset=dataset).order_by('id'))
+    reused = [file_item for file_item in file_items if is_conversion_current(file_item, options)]
+    if mosaic_options is not None or (region_options and len(reused) < len(file_items)):
+        # A mosaic combines every file, and regions are replaced for the whole
+        # dataset, so either is converted again as a whole
+        reused = []
+    stale = [file_item for file_item in file_items if file_item not in reused]
 
-    for file_to_convert in FileItem.objects.filter(dataset=dataset):
-        if result is not None:
-            result.write_status(f'Converting file {file_to_convert.name}...')
-        convert_file_item(file_to_convert)
+    # Data without a source file, such as a mosaic, is always converted again
+    stale_data = Q(source_file__isnull=True) | Q(source_file__in=stale)
+    VectorData.objects.filter(dataset=dataset).filter(stale_data).delete()
+    RasterData.objects.filter(dataset=dataset).filter(stale_data).delete()
+    if reused:
+        print('\t\t', f'Reusing data converted from {len(reused)} unchanged files.')
+    if result is not None:
+        result.outputs = dict(reused=[file_item.name for file_item in reused])
+        result.save()
 
-    vectors = VectorData.objects.filter(dataset=dataset)
-    for vector_data in vectors.all():
-        if result is not None:
-            result.write_status(f'Processing vector data {vector_data.name}...')
+    if mosaic_options is not None:
+        # All rasters of the dataset are merged into a single RasterData
+        file_item_ids = [None]
+    else:
+        file_item_ids = [file_item.id for file_item in stale]
 
-        if network_options:
-            create_network(vector_data, network_options)
-        elif region_options:
-            create_source_regions(vector_data, region_options)
+    if asynchronous and result is not None:
+        if not file_item_ids:
+            start_vector_data_stage(dataset.id, options, result.id)
+            return
+        start_conversion_stage(result.id, 'files', len(file_item_ids))
+        group(
+            convert_dataset_file.si(dataset.id, file_item_id, options, result.id)
+            for file_item_id in file_item_ids
+        ).apply_async()
+        return
 
-        # Create vector features after geojson_data may have
-        # been altered by create_network or create_source_regions
-        create_vector_features(vector_data)
-        vector_data.get_summary()
+    for file_item_id in file_item_ids:
+        if result is not None:
+            if file_item_id is None:
+                result.write_status('Converting files into a mosaic...')
+            else:
+                file_item = next(f for f in stale if f.id == file_item_id)
+                result.write_status(f'Converting file {file_item.name}...')
+        convert_dataset_file(dataset.id, file_item_id, options)
 
-    create_layers_and_frames(dataset, layer_options)
+    for vector_data in VectorData.objects.filter(dataset=dataset).order_by('id'):
+        if needs_processing(vector_data, options):
+            process_vector_data(vector_data, options, result=result)
 
-    dataset.processing = False
-    dataset.save()
-
-    if result is not None:
-        result.complete()
+    finish_dataset_conversion(dataset.id, options, result_id=result_id)
@@ -0,0 +1,71 @@
+from itertools import islice
+import json
+
+import geopandas
+import ijson
+from shapely.geometry import mapping, shape
+
+# Features are parsed, reprojected and written this many at a time,
+# which bounds memory use regardless of the size of the file
+FEATURE_CHUNK_SIZE = 5000
+
+
+def iter_chunks(iterable, size: int = FEATURE_CHUNK_SIZE):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def iter_geojson_features(path):
+    """Yield the features of a GeoJSON FeatureCollection one at a time, without loading it all."""
+    with open(path, 'rb') as f:
+        yield from ijson.items(f, 'features.item', use_float=True)
+
+
+def get_geojson_projection(path) -> str | None:
+    # Writers put the legacy crs member before the features, so parsing stops at the
+    # features rather than reading the whole file; without one, EPSG:4326 is assumed
+    with open(path, 'rb') as f:
+        for prefix, event, value in ijson.parse(f):
+            if prefix == 'crs.properties.name' and event == 'string':
+                return value
+            if prefix == '' and event == 'map_key' and value == 'features':
+                return None
+    return None
+
+
+def reproject_features(features: list[dict], projection: str | None) -> list[dict]:
+    if projection is None or projection.lower() == 'epsg:4326' or not features:
+        return features
+    geometries = geopandas.GeoSeries(
+        [shape(feature['geometry']) if feature.get('geometry') else None for feature in features],
+        crs=projection,
+    ).to_crs(4326)
+    return [
+        dict(feature, geometry=mapping(geometry) if geometry is not None else None)
+        for feature, geometry in zip(features, geometries)
+    ]
+
+
+def write_feature_collection(sources: list[dict], output_file) -> int:
+    """
+    Write the features of each source to a binary file as one FeatureCollection in EPSG:4326.
+
+    A source has either the path of a GeoJSON file or an iterable of features, and the
+    projection of its coordinates. Returns the number of features written.
+    """
+    count = 0
+    output_file.write(b'{"type": "FeatureCollection", "features": [')
+    for source in sources:
+        features = source.get('features')
+        if features is None:
+            features = iter_geojson_features(source['path'])
+        for chunk in iter_chunks(features):
+            for feature in reproject_features(chunk, source.get('projection')):
+                if count:
+                    output_file.write(b',')
+                # Shapefile attributes may hold dates, which are written as strings
+                output_file.write(json.dumps(feature, default=str).encode())
+                count += 1
+    output_file.write(b']}')
+    return count
@@ -4,7 +4,10 @@ from django.contrib.gis.geos import LineString, Point
 import geopandas
 import shapely
 
-from geoinsight.core.models import Network, NetworkEdge, NetworkNode, VectorFeature
+from geoinsight.core.models import Network, NetworkEdge, NetworkNode
+
+from .data import copy_vector_features, prepare_vector_features
+from .tile_archive import delete_tile_archive
 
 
 def create_network(vector_data, network_options):
@@ -203,30 +206,21 @@ def geojson_from_network(dataset):
     return new_geodata.to_json()
 
 
+def get_network_feature_rows(network):
+    for node in network.nodes.iterator():
+        yield bytes(node.location.ewkb), dict(node_id=node.id, **node.metadata)
+    for edge in network.edges.iterator():
+        yield bytes(edge.line_geometry.ewkb), dict(
+            edge_id=edge.id,
+            from_node_id=edge.from_node_id,
+            to_node_id=edge.to_node_id,
+            **edge.metadata,
+        )
+
+
 def create_vector_features_from_network(network):
     vector_data = network.vector_data
-    VectorFeature.objects.bulk_create(
-        [
-            VectorFeature(
-                vector_data=vector_data,
-                geometry=node.location,
-                properties=dict(node_id=node.id, **node.metadata),
-            )
-            for node in network.nodes.all()
-        ]
-    )
-    VectorFeature.objects.bulk_create(
-        [
-            VectorFeature(
-                vector_data=vector_data,
-                geometry=edge.line_geometry,
-                properties=dict(
-                    edge_id=edge.id,
-                    from_node_id=edge.from_node.id,
-                    to_node_id=edge.to_node.id,
-                    **edge.metadata,
-                ),
-            )
-            for edge in network.edges.all()
-        ]
-    )
+    copy_vector_features(vector_data, get_network_feature_rows(network))
+    prepare_vector_features(vector_data)
+    vector_data.bump_content_version()
+    delete_tile_archive(vector_data)
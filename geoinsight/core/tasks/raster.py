@@ -0,0 +1,209 @@
+import math
+
+import large_image
+import numpy
+from pyproj import Transformer
+
+from geoinsight.core.blob_cache import get_blob_path
+
+# Upper bound on the number of locations sampled by one request
+MAX_SAMPLES = 100000
+# Statistics are computed from an overview no larger than this, rather than a full scan
+STATISTICS_SAMPLE_SIZE = 1024
+HISTOGRAM_BINS = 64
+QUANTILES = [1, 2, 5, 25, 50, 75, 95, 98, 99]
+
+
+def get_raster_source(raster_data):
+    return large_image.open(get_blob_path(raster_data.cloud_optimized_geotiff))
+
+
+def to_native_coordinates(source, xs, ys, srs='EPSG:4326'):
+    bounds = source.getMetadata()['sourceBounds']
+    transformer = Transformer.from_crs(srs, bounds['srs'], always_xy=True)
+    native_xs, native_ys = transformer.transform(xs, ys)
+    return numpy.asarray(native_xs, dtype=float), numpy.asarray(native_ys, dtype=float)
+
+
+def from_native_coordinates(source, native_xs, native_ys, srs='EPSG:4326'):
+    bounds = source.getMetadata()['sourceBounds']
+    transformer = Transformer.from_crs(bounds['srs'], srs, always_xy=True)
+    xs, ys = transformer.transform(native_xs, native_ys)
+    return numpy.asarray(xs, dtype=float), numpy.asarray(ys, dtype=float)
+
+
+def to_pixel_coordinates(source, native_xs, native_ys):
+    # COGs are north up, so pixels scale linearly with the native bounds
+    bounds = source.getMetadata()['sourceBounds']
+    px = (native_xs - bounds['xmin']) / (bounds['xmax'] - bounds['xmin']) * source.sizeX
+    py = (bounds['ymax'] - native_ys) / (bounds['ymax'] - bounds['ymin']) * source.sizeY
+    return numpy.floor(px).astype(int), numpy.floor(py).astype(int)
+
+
+def densify_line(source, coordinates):
+    """Return native coordinates along a line in EPSG:4326, spaced about one pixel apart."""
+    bounds = source.getMetadata()['sourceBounds']
+    step = (bounds['xmax'] - bounds['xmin']) / source.sizeX
+    xs, ys = to_native_coordinates(source, *zip(*coordinates))
+    line_xs, line_ys = [], []
+    for i in range(len(xs) - 1):
+        count = max(1, math.ceil(math.hypot(xs[i + 1] - xs[i], ys[i + 1] - ys[i]) / step))
+        line_xs.append(numpy.linspace(xs[i], xs[i + 1], count, endpoint=False))
+        line_ys.append(numpy.linspace(ys[i], ys[i + 1], count, endpoint=False))
+    line_xs.append(xs[-1:])
+    line_ys.append(ys[-1:])
+    return numpy.concatenate(line_xs), numpy.concatenate(line_ys)
+
+
+def sample_pixels(source, px, py, frames=None, band: int = 0) -> numpy.ndarray:
+    """
+    Return the values at the given pixels, with a row per frame and NaN outside the raster.
+
+    Pixels are grouped by the internal tiles of the COG. Each tile is read directly at full
+    resolution, once per frame, and all frames of a tile are gathered before the next one.
+    """
+    frames = frames or [0]
+    values = numpy.full((len(frames), len(px)), numpy.nan)
+    metadata = source.getMetadata()
+    tile_width, tile_height = metadata['tileWidth'], metadata['tileHeight']
+    columns = math.ceil(source.sizeX / tile_width)
+
+    inside = (px >= 0) & (px < source.sizeX) & (py >= 0) & (py < source.sizeY)
+    blocks = numpy.where(inside, (py // tile_height) * columns + px // tile_width, -1)
+    for block in numpy.unique(blocks[inside]):
+        indices = numpy.nonzero(blocks == block)[0]
+        tile_x, tile_y = int(block % columns), int(block // columns)
+        left, top = tile_x * tile_width, tile_y * tile_height
+        for i, frame in enumerate(frames):
+            data = source.getTile(
+                tile_x, tile_y, source.levels - 1, frame=frame, numpyAllowed='always'
+            )
+            if data.ndim == 2:
+                data = data[:, :, numpy.newaxis]
+            if not 0 <= band < data.shape[2]:
+                raise ValueError(f'band must be between 0 and {data.shape[2] - 1}.')
+            values[i, indices] = data[py[indices] - top, px[indices] - left, band]
+    return values
+
+
+def get_sample_values(values: numpy.ndarray) -> list[list[float | None]]:
+    # Transpose to a list of values per location, with None where no value was sampled
+    return [[None if math.isnan(v) else v for v in row] for row in values.T.tolist()]
+
+
+def sample_raster(raster_data, points=None, lines=None, frames=None, band: int = 0) -> dict:
+    """
+    Sample a raster at points and along lines, given as coordinates in EPSG:4326.
+
+    Each point gets a value per frame; each line gets a profile of samples about
+    one pixel apart, with their coordinates.
+    """
+    source = get_raster_source(raster_data)
+    native = []
+    if points:
+        native.append(to_native_coordinates(source, *zip(*points)))
+    for line in lines or []:
+        native.append(densify_line(source, line))
+    count = sum(len(xs) for xs, _ in native)
+    if count > MAX_SAMPLES:
+        raise ValueError(f'At most {MAX_SAMPLES} locations may be sampled at once.')
+
+    result = dict(frames=frames or [0])
+    if not native:
+        return result
+    native_xs = numpy.concatenate([xs for xs, _ in native])
+    native_ys = numpy.concatenate([ys for _, ys in native])
+    # All points and lines are sampled together, so shared tiles are only read once
+    px, py = to_pixel_coordinates(source, native_xs, native_ys)
+    values = get_sample_values(sample_pixels(source, px, py, frames, band))
+
+    offset = 0
+    if points:
+        result['points'] = values[: len(points)]
+        offset = len(points)
+    if lines:
+        result['lines'] = []
+        for xs, ys in native[1 if points else 0 :]:
+            lon, lat = from_native_coordinates(source, xs, ys)
+            result['lines'].append(
+                dict(
+                    coordinates=numpy.column_stack([lon, lat]).tolist(),
+                    values=values[offset : offset + len(xs)],
+                )
+            )
+            offset += len(xs)
+    return result
+
+
+def get_frame_indices(source) -> list[int]:
+    frames = source.getMetadata().get('frames', [])
+    return [frame.get('Index', i) for i, frame in enumerate(frames)] or [0]
+
+
+def get_time_series(raster_data, points, frames=None, band: int = 0) -> dict:
+    """Return the values at points in EPSG:4326 for every frame, or the given frames."""
+    if len(points) > MAX_SAMPLES:
+        raise ValueError(f'At most {MAX_SAMPLES} locations may be sampled at once.')
+    source = get_raster_source(raster_data)
+    frames = frames or get_frame_indices(source)
+    px, py = to_pixel_coordinates(source, *to_native_coordinates(source, *zip(*points)))
+    values = sample_pixels(source, px, py, frames, band)
+    return dict(frames=frames, series=get_sample_values(values))
+
+
+def get_band_statistics(values: numpy.ndarray, bins: int = HISTOGRAM_BINS) -> dict:
+    values = values.astype(numpy.float64)
+    if not len(values):
+        return dict(count=0)
+    counts, edges = numpy.histogram(values, bins=bins)
+    quantiles = numpy.percentile(values, QUANTILES)
+    return dict(
+        count=len(values),
+        min=float(values.min()),
+        max=float(values.max()),
+        mean=float(values.mean()),
+        stdev=float(values.std()),
+        histogram=dict(edges=edges.tolist(), counts=counts.tolist()),
+        quantiles={f'p{q}': float(v) for q, v in zip(QUANTILES, quantiles)},
+    )
+
+
+def get_raster_statistics(source, sample_size: int = STATISTICS_SAMPLE_SIZE) -> dict:
+    """
+    Summarize each band of each frame, from an overview of at most sample_size pixels a side.
+
+    The overall range of each band spans the 2nd to 98th percentiles of all frames, which
+    suits colormaps better than the extremes.
+    """
+    metadata = source.getMetadata()
+    band_metadata = metadata.get('bands') or {}
+    output = dict(maxWidth=sample_size, maxHeight=sample_size)
+    frames = []
+    bands = {}
+    for frame in get_frame_indices(source):
+        data, _ = source.getRegion(output=output, format='numpy', frame=frame)
+        if data.ndim == 2:
+            data = data[:, :, numpy.newaxis]
+        frame_bands = {}
+        for i in range(data.shape[2]):
+            band = i + 1
+            values = data[:, :, i].ravel()
+            valid = numpy.isfinite(values)
+            nodata = band_metadata.get(band, {}).get('nodata')
+            if nodata is not None:
+                valid &= values != nodata
+            stats = get_band_statistics(values[valid])
+            frame_bands[band] = stats
+            if not stats['count']:
+                continue
+            overall = bands.setdefault(
+                band, dict(min=stats['min'], max=stats['max'], range=[math.inf, -math.inf])
+            )
+            overall['min'] = min(overall['min'], stats['min'])
+            overall['max'] = max(overall['max'], stats['max'])
+            overall['range'] = [
+                min(overall['range'][0], stats['quantiles']['p2']),
+                max(overall['range'][1], stats['quantiles']['p98']),
+            ]
+        frames.append(dict(frame=frame, bands=frame_bands))
+    return dict(sample_size=sample_size, bands=bands, frames=frames)
@@ -0,0 +1,171 @@
+import json
+
+from django.db import connection
+
+# Limit number of unique values to return for non-numeric fields
+VALUE_SET_MAX_LENGTH = 1000
+# Properties which identify network features, rather than describe them
+EXCLUDE_KEYS = ['node_id', 'edge_id', 'to_node_id', 'from_node_id']
+NUMERIC_TYPES = {'int', 'float'}
+# Features are summarized this many at a time while they are loaded
+SUMMARY_CHUNK_SIZE = 50000
+
+# Feature types in the order they first appear, and the last feature summarized
+FEATURE_TYPES_SQL = """
+SELECT
+    replace(ST_GeometryType(t.geometry), 'ST_', '') as feature_type,
+    min(t.id) as first_id,
+    max(t.id) as last_id
+FROM core_vectorfeature t
+WHERE
+    t.vector_data_id = %(vector_data_id)s
+    AND t.id > %(after_id)s
+GROUP BY 1
+ORDER BY 2
+;
+"""
+
+# Lists are summarized item by item, and each value is typed like its Python equivalent;
+# empty lists give an item without a value, so their keys are still recorded.
+# Numbers are compared as numeric, which holds integers beyond 2^53 exactly
+PROPERTIES_SUMMARY_SQL = """
+WITH
+items as (
+    SELECT
+        p.key,
+        item.value,
+        CASE jsonb_typeof(item.value)
+            WHEN 'number' THEN
+                CASE WHEN item.value::text ~ '^-?[0-9]+$' THEN 'int' ELSE 'float' END
+            WHEN 'string' THEN 'str'
+            WHEN 'boolean' THEN 'bool'
+            WHEN 'null' THEN 'NoneType'
+            WHEN 'object' THEN 'dict'
+            WHEN 'array' THEN 'list'
+        END as type
+    FROM
+        core_vectorfeature t
+        CROSS JOIN LATERAL jsonb_each(t.properties) p
+        LEFT JOIN LATERAL jsonb_array_elements(
+            CASE
+                WHEN jsonb_typeof(p.value) = 'array' THEN p.value
+                ELSE jsonb_build_array(p.value)
+            END
+        ) item(value) ON true
+    WHERE
+        t.vector_data_id = %(vector_data_id)s
+        AND t.id > %(after_id)s
+        AND t.id <= %(until_id)s
+        AND p.key <> ALL(%(exclude_keys)s)
+        AND p.value NOT IN ('null'::jsonb, '""'::jsonb)
+),
+value_sets as (
+    SELECT ranked.key, jsonb_agg(ranked.value) as value_set
+    FROM (
+        SELECT d.key, d.value, row_number() OVER (PARTITION BY d.key ORDER BY d.value) as n
+        FROM (SELECT DISTINCT key, value FROM items WHERE value IS NOT NULL) d
+    ) ranked
+    WHERE ranked.n <= %(max_values)s
+    GROUP BY ranked.key
+)
+SELECT
+    items.key,
+    count(items.value),
+    coalesce(array_agg(DISTINCT items.type) FILTER (WHERE items.type IS NOT NULL), '{}'),
+    min((items.value #>> '{}')::numeric) FILTER (WHERE items.type IN ('int', 'float')),
+    max((items.value #>> '{}')::numeric) FILTER (WHERE items.type IN ('int', 'float')),
+    coalesce(value_sets.value_set, '[]'::jsonb)::text
+FROM
+    items
+    LEFT JOIN value_sets ON value_sets.key = items.key
+GROUP BY items.key, value_sets.value_set
+;
+"""
+
+
+def summarize_features(vector_data_id, after_id: int = 0) -> tuple[dict, int]:
+    """
+    Summarize the features of a VectorData with ids greater than after_id, in SQL.
+
+    Returns a partial summary, which can be merged with the summaries of other features,
+    and the id of the last feature summarized.
+    """
+    params = dict(
+        vector_data_id=vector_data_id,
+        after_id=after_id,
+        exclude_keys=EXCLUDE_KEYS,
+        max_values=VALUE_SET_MAX_LENGTH,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(FEATURE_TYPES_SQL, params)
+        type_rows = cursor.fetchall()
+        # Features added while summarizing are left for the next summary
+        params['until_id'] = max((row[2] for row in type_rows), default=after_id)
+        cursor.execute(PROPERTIES_SUMMARY_SQL, params)
+        property_rows = cursor.fetchall()
+
+    summary = dict(
+        feature_types=[row[0] for row in type_rows],
+        properties={
+            key: dict(
+                count=count,
+                types=sorted(types),
+                min=value_min,
+                max=value_max,
+                value_set=json.loads(value_set),
+            )
+            for key, count, types, value_min, value_max, value_set in property_rows
+        },
+    )
+    return summary, params['until_id']
+
+
+def merge_summaries(summary: dict | None, partial: dict) -> dict:
+    if summary is None:
+        return partial
+    for feature_type in partial['feature_types']:
+        if feature_type not in summary['feature_types']:
+            summary['feature_types'].append(feature_type)
+    for key, stats in partial['properties'].items():
+        merged = summary['properties'].get(key)
+        if merged is None:
+            summary['properties'][key] = stats
+            continue
+        merged['count'] += stats['count']
+        merged['types'] = sorted(set(merged['types']) | set(stats['types']))
+        for bound, pick in [('min', min), ('max', max)]:
+            values = [v for v in [merged[bound], stats[bound]] if v is not None]
+            merged[bound] = pick(values) if values else None
+        # Values may be lists or objects, so they are compared by their JSON
+        seen = {json.dumps(v, sort_keys=True) for v in merged['value_set']}
+        merged['value_set'] += [
+            v for v in stats['value_set'] if json.dumps(v, sort_keys=True) not in seen
+        ]
+        merged['value_set'] = merged['value_set'][:VALUE_SET_MAX_LENGTH]
+    return summary
+
+
+def get_summary_output(summary: dict | None) -> dict:
+    """Describe each property with a range if it is numeric, or a set of values otherwise."""
+    output = dict(feature_types=[], properties={})
+    if summary is None:
+        return output
+    output['feature_types'] = summary['feature_types']
+    for key, stats in summary['properties'].items():
+        prop = dict(count=stats['count'], types=stats['types'])
+        if stats['types'] and set(stats['types']) <= NUMERIC_TYPES and stats['min'] < stats['max']:
+            cast = float if 'float' in stats['types'] else int
+            value_range = [cast(stats['min']), cast(stats['max'])]
+            prop['range'] = value_range
+            prop['sample_label'] = f'[{value_range[0]}, {value_range[1]}]'
+        else:
+            prop['value_set'] = stats['value_set']
+            prop['sample_label'] = ', '.join(str(v) for v in stats['value_set'][:3])
+            if len(stats['value_set']) > 3:
+                prop['sample_label'] += '...'
+        output['properties'][key] = prop
+    return output
+
+
+def get_vector_summary(vector_data_id) -> dict:
+    return get_summary_output(summarize_features(vector_data_id)[0])
@@ -0,0 +1,159 @@
+from contextlib import closing
+import gzip
+import json
+import os
+from pathlib import Path
+import sqlite3
+import tempfile
+import uuid
+
+from django.core.files import File
+
+from geoinsight.core.blob_cache import get_blob_path
+from geoinsight.core.tile_cache import get_data_version, get_tile_cache
+
+from .tiles import get_seed_extent, get_tile_range, render_vector_tile
+
+# Local copies of tile archives, by archive name
+_archive_paths = {}
+
+# https://github.com/mapbox/mbtiles-spec/blob/master/1.3/spec.md
+MBTILES_SCHEMA_SQL = """
+CREATE TABLE metadata (name text, value text);
+CREATE TABLE tiles (zoom_level integer, tile_column integer, tile_row integer, tile_data blob);
+CREATE UNIQUE INDEX tile_index on tiles (zoom_level, tile_column, tile_row);
+"""
+
+
+def get_tile_row(z, y) -> int:
+    # MBTiles rows count up from the south, as in the TMS scheme
+    return 2 ** int(z) - 1 - int(y)
+
+
+def write_tile_archive(vector_data, min_zoom=0, max_zoom=12) -> int:
+    """Render the tiles of a VectorData over a zoom range into an MBTiles tile_archive."""
+    from geoinsight.core.models import VectorData
+
+    extent = get_seed_extent('vector', vector_data.id)
+    if extent is None:
+        return 0
+
+    tiles = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp, 'tiles.mbtiles')
+        with closing(sqlite3.connect(path)) as db:
+            db.executescript(MBTILES_SCHEMA_SQL)
+            metadata = dict(
+                name=vector_data.name,
+                format='pbf',
+                type='overlay',
+                minzoom=min_zoom,
+                maxzoom=max_zoom,
+                bounds=','.join(str(v) for v in extent),
+                json=json.dumps(dict(vector_layers=[dict(id='default', fields={})])),
+            )
+            db.executemany('INSERT INTO metadata VALUES (?, ?)', metadata.items())
+            for z in range(min_zoom, max_zoom + 1):
+                x_range, y_range = get_tile_range(extent, z)
+                for x in x_range:
+                    for y in y_range:
+                        tile = render_vector_tile(vector_data.id, z, x, y)
+                        # Empty tiles are left out, so a missing tile within the zoom range is empty
+                        if tile:
+                            db.execute(
+                                'INSERT INTO tiles VALUES (?, ?, ?, ?)',
+                                (z, x, get_tile_row(z, y), gzip.compress(tile)),
+                            )
+                            tiles += 1
+                db.commit()
+
+        delete_tile_archive(vector_data)
+        with open(path, 'rb') as archive:
+            # The name is unique, so local copies of a previous archive are never reused
+            vector_data.tile_archive.save(f'{uuid.uuid4().hex}.mbtiles', File(archive), save=False)
+        VectorData.objects.filter(id=vector_data.id).update(
+            tile_archive=vector_data.tile_archive.name
+        )
+    get_tile_cache().set(
+        get_archive_key(vector_data.id),
+        dict(name=vector_data.tile_archive.name, minzoom=min_zoom, maxzoom=max_zoom),
+    )
+    print('\t\t', f'{tiles} tiles archived for {vector_data.name}.')
+    return tiles
+
+
+def delete_tile_archive(vector_data):
+    # Only the archive column is saved, since callers may hold instances with stale fields
+    from geoinsight.core.models import VectorData
+
+    if vector_data.tile_archive:
+        vector_data.tile_archive.delete(save=False)
+        VectorData.objects.filter(id=vector_data.id).update(tile_archive=None)
+    get_tile_cache().delete(get_archive_key(vector_data.id))
+
+
+def get_archive_key(vector_data_id) -> str:
+    # Versioned like the tiles, so rebuilding the features also drops the cached archive
+    return f'archive:{vector_data_id}:{get_data_version("vector", vector_data_id)}'
+
+
+def get_archive_info(vector_data_id) -> dict:
+    """Return the name and zoom range of the tile_archive, or an empty dict if there is none."""
+    from geoinsight.core.models import VectorData
+
+    key = get_archive_key(vector_data_id)
+    info = get_tile_cache().get(key)
+    if info is not None:
+        return info
+
+    info = {}
+    vector_data = VectorData.objects.filter(id=vector_data_id).only('tile_archive').first()
+    if vector_data is not None and vector_data.tile_archive:
+        path = get_archive_path(vector_data.tile_archive)
+        with closing(sqlite3.connect(f'file:{path}?mode=ro', uri=True)) as db:
+            metadata = dict(db.execute("SELECT name, value FROM metadata WHERE name LIKE '%zoom'"))
+        info = dict(
+            name=vector_data.tile_archive.name,
+            minzoom=int(metadata['minzoom']),
+            maxzoom=int(metadata['maxzoom']),
+        )
+    # Data without an archive is cached too, so its tiles do not query for one
+    get_tile_cache().set(key, info)
+    return info
+
+
+def get_archive_path(field_file) -> Path:
+    # Archive names are unique, so the local copy of each is found without hashing its name
+    # and storage ETag; the read is still recorded in its modification time for eviction
+    path = _archive_paths.get(field_file.name)
+    if path is not None:
+        try:
+            os.utime(path)
+            return path
+        except FileNotFoundError:
+            # Evicted from the blob cache, so it is downloaded again
+            pass
+    path = _archive_paths[field_file.name] = get_blob_path(field_file)
+    return path
+
+
+def read_archived_tile(vector_data_id, z, x, y) -> bytes | None:
+    """
+    Return a tile from the tile_archive, or None if the archive does not cover its zoom.
+
+    The whole archive is downloaded into the blob cache on its first read, rather than read
+    with ranged requests, since SQLite reads each tile with several small random reads.
+    """
+    from geoinsight.core.models import VectorData
+
+    info = get_archive_info(vector_data_id)
+    if not info or not info['minzoom'] <= int(z) <= info['maxzoom']:
+        return None
+
+    path = get_archive_path(VectorData(id=vector_data_id, tile_archive=info['name']).tile_archive)
+    with closing(sqlite3.connect(f'file:{path}?mode=ro', uri=True)) as db:
+        row = db.execute(
+            'SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?',
+            (int(z), int(x), get_tile_row(z, y)),
+        ).fetchone()
+    return gzip.decompress(row[0]) if row else b''
@@ -0,0 +1,687 @@
+import json
+import math
+
+from celery import group, shared_task
+from django.contrib.gis.db.models import Extent
+from django.db import connection, transaction
+from django_large_image import tilesource
+from large_image.constants import TileOutputMimeTypes
+from large_image.exceptions import TileSourceXYZRangeError
+from pyproj import Transformer
+
+from geoinsight.core.blob_cache import get_blob_path
+from geoinsight.core.tile_cache import (
+    cache_tile,
+    get_cached_tile,
+    get_composite_vector_tile_key,
+    get_raster_tile_key,
+    get_vector_tile_key,
+)
+
+RANGE_LOOKUPS = {'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+
+# Latitude limit of the Web Mercator projection
+MAX_LATITUDE = 85.0511287798066
+# Width of the Web Mercator projection in meters, i.e. the width of the tile at zoom 0
+WEB_MERCATOR_WIDTH = 40075016.68557849
+
+# Zoom levels for which VectorFeature stores simplified geometry (geometry_z<level>);
+# a tile uses the simplified geometry of the lowest level that is at least its zoom
+GENERALIZATION_ZOOM_LEVELS = [4, 7, 10]
+
+# Points closer than this many pixels of a 256 pixel tile are grid clustered together
+CLUSTER_CELL_PIXELS = 32
+# Maximum number of k-means clusters in a tile
+CLUSTER_KMEANS_COUNT = 64
+CLUSTER_METHODS = ['grid', 'kmeans']
+# Query parameters of the tile endpoint that configure clustering rather than filter features
+CLUSTER_PARAMS = {
+    'cluster_zoom': 'zoom',
+    'cluster_method': 'method',
+    'cluster_property': 'property',
+}
+
+# Raster tiles are seeded as they are requested by the web client
+DEFAULT_RASTER_PROJECTION = 'epsg:3857'
+# Maximum number of tiles rendered by a single seeding task
+SEED_CHUNK_SIZE = 256
+
+VECTOR_TILE_SQL = """
+WITH
+bounds as (
+    SELECT
+        ST_TileEnvelope(%(z)s, %(x)s, %(y)s) as geom,
+        ST_TileEnvelope(%(z)s, %(x)s, %(y)s)::box2d as b2d
+),
+mvtgeom as (
+    SELECT
+        ST_AsMVTGeom(
+            t.REPLACE_WITH_GEOMETRY,
+            bounds.b2d
+        ) AS geom,
+    t.id as id,
+    REPLACE_WITH_PROPERTIES as properties
+    FROM
+        core_vectorfeature t,
+        bounds
+    WHERE
+        t.vector_data_id = %(vector_data_id)s
+        AND ST_Intersects(
+            t.REPLACE_WITH_GEOMETRY,
+            bounds.geom
+        )
+        REPLACE_WITH_FILTERS
+)
+SELECT ST_AsMVT(mvtgeom.*, 'default', 4096, 'geom', 'id') FROM mvtgeom
+;
+"""
+
+# Below the clustering zoom, points are replaced by one feature per cluster,
+# with the number of points and the sum and mean of a numeric property;
+# other geometries are emitted as usual
+CLUSTERED_VECTOR_TILE_SQL = """
+WITH
+bounds as (
+    SELECT
+        ST_TileEnvelope(%(z)s, %(x)s, %(y)s) as geom,
+        ST_TileEnvelope(%(z)s, %(x)s, %(y)s)::box2d as b2d
+),
+points as (
+    SELECT
+        t.geometry_3857 as geom,
+        CASE
+            WHEN jsonb_typeof(t.properties #> %(cluster_path)s::text[]) = 'number'
+            THEN (t.properties #>> %(cluster_path)s::text[])::double precision
+        END as value
+    FROM
+        core_vectorfeature t,
+        bounds
+    WHERE
+        t.vector_data_id = %(vector_data_id)s
+        AND ST_Intersects(
+            t.geometry_3857,
+            bounds.geom
+        )
+        AND ST_GeometryType(t.geometry_3857) = 'ST_Point'
+        REPLACE_WITH_FILTERS
+),
+clusters as (
+    REPLACE_WITH_CLUSTERS
+),
+mvtgeom as (
+    SELECT
+        -- box2d has no equality operator, so the envelope is not taken from bounds,
+        -- which would have to be grouped on
+        ST_AsMVTGeom(
+            ST_Centroid(ST_Collect(clusters.geom)),
+            ST_TileEnvelope(%(z)s, %(x)s, %(y)s)::box2d
+        ) AS geom,
+        NULL::bigint as id,
+        jsonb_strip_nulls(jsonb_build_object(
+            'cluster', true,
+            'point_count', count(*),
+            'sum', sum(clusters.value),
+            'mean', avg(clusters.value)
+        )) as properties
+    FROM clusters
+    GROUP BY clusters.cluster_id
+    UNION ALL
+    SELECT
+        ST_AsMVTGeom(
+            t.REPLACE_WITH_GEOMETRY,
+            bounds.b2d
+        ) AS geom,
+    t.id as id,
+    REPLACE_WITH_PROPERTIES as properties
+    FROM
+        core_vectorfeature t,
+        bounds
+    WHERE
+        t.vector_data_id = %(vector_data_id)s
+        AND ST_Intersects(
+            t.REPLACE_WITH_GEOMETRY,
+            bounds.geom
+        )
+        AND ST_GeometryType(t.geometry_3857) <> 'ST_Point'
+        REPLACE_WITH_FILTERS
+)
+SELECT ST_AsMVT(mvtgeom.*, 'default', 4096, 'geom', 'id') FROM mvtgeom
+;
+"""
+
+# Grid cells are offset by half a cell, so that cell edges fall on tile edges
+GRID_CLUSTERS_SQL = """
+    SELECT
+        geom,
+        value,
+        ST_SnapToGrid(
+            geom,
+            %(cluster_size)s / 2,
+            %(cluster_size)s / 2,
+            %(cluster_size)s,
+            %(cluster_size)s
+        ) as cluster_id
+    FROM points
+"""
+
+KMEANS_CLUSTERS_SQL = """
+    SELECT
+        geom,
+        value,
+        ST_ClusterKMeans(
+            geom,
+            LEAST(%(cluster_count)s, (SELECT count(*) FROM points)::integer)
+        ) OVER () as cluster_id
+    FROM points
+"""
+
+# Restricts properties to a list of top level keys
+PROPERTIES_PROJECTION_SQL = """(
+        SELECT coalesce(jsonb_object_agg(p.key, p.value), '{}'::jsonb)
+        FROM jsonb_each(t.properties) p
+        WHERE p.key = ANY(%(REPLACE_WITH_PARAM)s::text[])
+    )"""
+
+# Features of each layer of a composite tile, combined with UNION ALL
+COMPOSITE_LAYER_SQL = """
+    SELECT
+        %(layer_name_REPLACE_WITH_INDEX)s as layer,
+        ST_AsMVTGeom(
+            t.REPLACE_WITH_GEOMETRY,
+            bounds.b2d
+        ) AS geom,
+        t.id as id,
+        REPLACE_WITH_PROPERTIES as properties
+    FROM
+        core_vectorfeature t,
+        bounds
+    WHERE
+        t.vector_data_id = %(vector_data_id_REPLACE_WITH_INDEX)s
+        AND ST_Intersects(
+            t.REPLACE_WITH_GEOMETRY,
+            bounds.geom
+        )
+        REPLACE_WITH_FILTERS
+"""
+
+# Encodes every layer in one pass; concatenated MVT layers form a valid tile
+COMPOSITE_VECTOR_TILE_SQL = """
+WITH
+bounds as (
+    SELECT
+        ST_TileEnvelope(%(z)s, %(x)s, %(y)s) as geom,
+        ST_TileEnvelope(%(z)s, %(x)s, %(y)s)::box2d as b2d
+),
+mvtgeom as (
+    REPLACE_WITH_LAYERS
+),
+layers as (
+    SELECT ST_AsMVT(f, m.layer, 4096, 'geom', 'id') as tile
+    FROM
+        mvtgeom m,
+        LATERAL (SELECT m.id, m.geom, m.properties) f
+    GROUP BY m.layer
+)
+SELECT string_agg(tile, ''::bytea) FROM layers
+;
+"""
+
+
+def get_tile_range(extent, z: int):
+    """Return the x and y ranges of the tiles at zoom z covering a lon/lat extent."""
+    n = 2**z
+
+    def tile_index(lon, lat):
+        lat = max(min(lat, MAX_LATITUDE), -MAX_LATITUDE)
+        x = int((lon + 180) / 360 * n)
+        y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+        return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+    xmin, ymin, xmax, ymax = extent
+    x_start, y_start = tile_index(xmin, ymax)
+    x_end, y_end = tile_index(xmax, ymin)
+    return range(x_start, x_end + 1), range(y_start, y_end + 1)
+
+
+def get_geometry_column(z) -> str:
+    for level in GENERALIZATION_ZOOM_LEVELS:
+        if int(z) <= level:
+            return f'geometry_z{level}'
+    return 'geometry_3857'
+
+
+def get_generalization_tolerance(level: int) -> float:
+    # A quarter of a pixel of a 256 pixel tile at this zoom level
+    return WEB_MERCATOR_WIDTH / 2**level / 1024
+
+
+def get_filter_candidates(value) -> list:
+    # Query parameters are always strings, while stored properties may be
+    # numbers or booleans, so a value is matched against both representations
+    if isinstance(value, str):
+        candidates = [value]
+        try:
+            parsed = json.loads(value)
+        except ValueError:
+            parsed = None
+        if isinstance(parsed, (bool, int, float)) and math.isfinite(parsed):
+            candidates.append(parsed)
+        return candidates
+    return [value, json.dumps(value)]
+
+
+def get_filter_clause(filters: dict | None = None, param_prefix: str = 'filter'):
+    """
+    Build a SQL clause and its bound parameters for filtering features by their properties.
+
+    Filters follow queryset lookup syntax: `key=value` for equality, `key__in=a,b` for
+    membership and `key__gt`, `key__gte`, `key__lt`, `key__lte` for numeric ranges.
+    Nested properties are addressed with dots, e.g. `key.subkey=value`.
+    """
+    if not filters:
+        return '', {}
+
+    clauses, params = [], {}
+
+    def add_param(value):
+        name = f'{param_prefix}_{len(params)}'
+        params[name] = value
+        return f'%({name})s'
+
+    for key, value in filters.items():
+        lookup = 'exact'
+        key_name, _, suffix = key.rpartition('__')
+        if key_name and (suffix == 'in' or suffix in RANGE_LOOKUPS):
+            key, lookup = key_name, suffix
+        path = key.split('.')
+
+        if lookup in RANGE_LOOKUPS:
+            try:
+                number = float(value)
+            except (TypeError, ValueError):
+                raise ValueError(f'Invalid numeric value for filter {key}__{lookup}: {value}')
+            if not math.isfinite(number):
+                raise ValueError(f'Invalid numeric value for filter {key}__{lookup}: {value}')
+            # Comparisons with non-numeric values evaluate to false in a jsonpath predicate
+            json_path = '$' + ''.join(f'.{json.dumps(p)}' for p in path)
+            param = add_param(f'{json_path} {RANGE_LOOKUPS[lookup]} {number!r}')
+            clauses.append(f't.properties @@ {param}::jsonpath')
+            continue
+
+        values = [value]
+        if lookup == 'in':
+            values = value.split(',') if isinstance(value, str) else list(value)
+
+        # Containment queries can be served by the GIN index on properties
+        options = []
+        for v in values:
+            for candidate in get_filter_candidates(v):
+                contained = candidate
+                for p in reversed(path):
+                    contained = {p: contained}
+                param = add_param(json.dumps(contained))
+                options.append(f't.properties @> {param}::jsonb')
+        clauses.append(f'({" OR ".join(options)})' if options else 'FALSE')
+
+    return ''.join(f' AND {clause}' for clause in clauses), params
+
+
+def pop_cluster_options(params: dict) -> dict:
+    # Removes the clustering parameters from the tile request parameters
+    options = {}
+    for param, option in CLUSTER_PARAMS.items():
+        value = params.pop(param, None)
+        if isinstance(value, list):
+            value = value[-1] if value else None
+        if value is not None:
+            options[option] = value
+    return options
+
+
+def get_fields(value) -> list[str] | None:
+    # Fields are given as a comma separated string or a list; nested
+    # properties are addressed with dots, but whole top level keys are kept
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    return sorted({str(field).split('.')[0] for field in value if field})
+
+
+def get_properties_expression(fields: list[str] | None, param: str) -> str:
+    if fields is None:
+        return 't.properties'
+    return PROPERTIES_PROJECTION_SQL.replace('REPLACE_WITH_PARAM', param)
+
+
+def get_cluster_options(cluster: dict | None, z) -> dict | None:
+    """Validate clustering options, returning None if points are not clustered at zoom z."""
+    if not cluster or 'zoom' not in cluster:
+        return None
+    try:
+        cluster_zoom = int(cluster['zoom'])
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid cluster zoom: {cluster["zoom"]}')
+    method = cluster.get('method') or CLUSTER_METHODS[0]
+    if method not in CLUSTER_METHODS:
+        raise ValueError(f'Invalid cluster method: {method}. Try one of: {CLUSTER_METHODS}')
+    if int(z) >= cluster_zoom:
+        return None
+    return dict(zoom=cluster_zoom, method=method, property=cluster.get('property'))
+
+
+def render_vector_tile(
+    vector_data_id,
+    z,
+    x,
+    y,
+    filters: dict | None = None,
+    cluster: dict | None = None,
+    fields: list[str] | None = None,
+) -> bytes:
+    filter_clause, filter_params = get_filter_clause(filters)
+    params = {
+        'z': z,
+        'x': x,
+        'y': y,
+        'vector_data_id': vector_data_id,
+        'fields': fields,
+        **filter_params,
+    }
+    cluster = get_cluster_options(cluster, z)
+    if cluster is None:
+        query = VECTOR_TILE_SQL
+    else:
+        query = CLUSTERED_VECTOR_TILE_SQL.replace(
+            'REPLACE_WITH_CLUSTERS',
+            KMEANS_CLUSTERS_SQL if cluster['method'] == 'kmeans' else GRID_CLUSTERS_SQL,
+        )
+        params['cluster_path'] = (cluster['property'] or '').split('.')
+        params['cluster_size'] = WEB_MERCATOR_WIDTH / 2 ** int(z) * CLUSTER_CELL_PIXELS / 256
+        params['cluster_count'] = CLUSTER_KMEANS_COUNT
+    query = query.replace('REPLACE_WITH_GEOMETRY', get_geometry_column(z))
+    query = query.replace('REPLACE_WITH_PROPERTIES', get_properties_expression(fields, 'fields'))
+    query = query.replace('REPLACE_WITH_FILTERS', filter_clause)
+    with connection.cursor() as cursor:
+        cursor.execute(query, params)
+        row = cursor.fetchone()
+
+    return bytes(row[0]) if row[0] else b''
+
+
+def render_composite_vector_tile(layers: list[dict], z, x, y) -> bytes:
+    """Render one tile with a layer for each dict of name, id, filters and fields."""
+    geometry_column = get_geometry_column(z)
+    layer_queries, params = [], {'z': z, 'x': x, 'y': y}
+    for i, layer in enumerate(layers):
+        filter_clause, filter_params = get_filter_clause(
+            layer.get('filters'), param_prefix=f'layer_{i}_filter'
+        )
+        query = COMPOSITE_LAYER_SQL.replace('REPLACE_WITH_INDEX', str(i))
+        query = query.replace('REPLACE_WITH_GEOMETRY', geometry_column)
+        query = query.replace(
+            'REPLACE_WITH_PROPERTIES',
+            get_properties_expression(layer.get('fields'), f'fields_{i}'),
+        )
+        layer_queries.append(query.replace('REPLACE_WITH_FILTERS', filter_clause))
+        params[f'layer_name_{i}'] = layer['name']
+        params[f'vector_data_id_{i}'] = layer['id']
+        params[f'fields_{i}'] = layer.get('fields')
+        params.update(filter_params)
+
+    query = COMPOSITE_VECTOR_TILE_SQL.replace(
+        'REPLACE_WITH_LAYERS', '    UNION ALL'.join(layer_queries)
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(query, params)
+        row = cursor.fetchone()
+
+    return bytes(row[0]) if row[0] else b''
+
+
+def load_composite_vector_tile(layers: list[dict], z, x, y) -> bytes:
+    cache_key = get_composite_vector_tile_key(layers, z, x, y)
+    tile = get_cached_tile(cache_key)
+    if tile is None:
+        tile = render_composite_vector_tile(layers, z, x, y)
+        cache_tile(cache_key, tile)
+    return tile
+
+
+def load_vector_tile(
+    vector_data_id,
+    z,
+    x,
+    y,
+    filters: dict | None = None,
+    cluster: dict | None = None,
+    fields: list[str] | None = None,
+) -> bytes:
+    cluster = get_cluster_options(cluster, z)
+    options = {
+        key: value
+        for key, value in dict(cluster=cluster, fields=fields).items()
+        if value is not None
+    }
+    cache_key = get_vector_tile_key(vector_data_id, z, x, y, filters, options)
+    tile = get_cached_tile(cache_key)
+    if tile is None:
+        if not filters and not options:
+            from .tile_archive import read_archived_tile
+
+            # Archives hold the unfiltered tiles with all properties
+            tile = read_archived_tile(vector_data_id, z, x, y)
+        if tile is None:
+            tile = render_vector_tile(vector_data_id, z, x, y, filters, cluster, fields)
+        # Empty tiles are cached too, so they are not recomputed
+        cache_tile(cache_key, tile)
+    return tile
+
+
+def get_raster_tile_options(fmt='png', projection=None) -> dict:
+    options = dict(fmt=fmt.lower())
+    if projection:
+        options['projection'] = projection.lower()
+    return options
+
+
+def get_raster_tile_frame(style=None, frame=None) -> int | None:
+    if frame is None and style:
+        frame = style.get('frame')
+    return None if frame is None else int(frame)
+
+
+def get_raster_tile_band(style=None) -> str | None:
+    # A single band style names its band, a composite style lists the bands it combines
+    if not style:
+        return None
+    if style.get('band') is not None:
+        return str(style['band'])
+    bands = [str(band.get('band')) for band in style.get('bands') or []]
+    return ','.join(bands) or None
+
+
+def get_raster_tile_style(style=None, frame=None) -> dict | None:
+    # The frame is keyed on its own, so every frame of an animation shares one style hash
+    if style and 'frame' in style and str(style['frame']) == str(frame):
+        style = {key: value for key, value in style.items() if key != 'frame'}
+    return style or None
+
+
+def render_raster_tile(raster_data, z, x, y, fmt='png', projection=None, style=None, frame=None):
+    encoding = tilesource.format_to_encoding(fmt, pil_safe=True)
+    kwargs = dict(encoding=encoding)
+    if projection:
+        kwargs['projection'] = projection
+    if style:
+        kwargs['style'] = json.dumps(style)
+    path = get_blob_path(raster_data.cloud_optimized_geotiff)
+    source = tilesource.get_tilesource_from_path(path, **kwargs)
+    return source.getTile(int(x), int(y), int(z), frame=get_raster_tile_frame(style, frame))
+
+
+def load_raster_tile(raster_data, z, x, y, fmt='png', projection=None, style=None, frame=None):
+    """
+    Return the encoded tile and its mime type, rendering it only on a cache miss.
+
+    Rendered tiles are keyed on the raster's content version, frame, band and style, so a
+    styled frame is rendered once and then served from the cache, e.g. during animation.
+    """
+    frame = get_raster_tile_frame(style, frame)
+    cache_key = get_raster_tile_key(
+        raster_data.id,
+        raster_data.content_version,
+        z,
+        x,
+        y,
+        frame=frame,
+        band=get_raster_tile_band(style),
+        style=get_raster_tile_style(style, frame),
+        options=get_raster_tile_options(fmt, projection),
+    )
+    tile = get_cached_tile(cache_key)
+    if tile is None:
+        tile = render_raster_tile(raster_data, z, x, y, fmt, projection, style, frame)
+        cache_tile(cache_key, tile)
+    encoding = tilesource.format_to_encoding(fmt, pil_safe=True)
+    return tile, TileOutputMimeTypes[encoding]
+
+
+def get_seed_extent(data_type: str, data_id):
+    from geoinsight.core.models import RasterData, VectorFeature
+
+    if data_type == 'vector':
+        features = VectorFeature.objects.filter(vector_data_id=data_id)
+        return features.aggregate(Extent('geometry')).get('geometry__extent')
+
+    metadata = RasterData.objects.get(id=data_id).metadata or {}
+    bounds = metadata.get('bounds')
+    if not bounds:
+        return None
+    transformer = Transformer.from_crs(bounds['srs'], 'EPSG:4326', always_xy=True)
+    xs, ys = transformer.transform(
+        [bounds['xmin'], bounds['xmin'], bounds['xmax'], bounds['xmax']],
+        [bounds['ymin'], bounds['ymax'], bounds['ymin'], bounds['ymax']],
+    )
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def get_seed_chunks(extent, min_zoom: int, max_zoom: int, chunk_size: int = SEED_CHUNK_SIZE):
+    """Split the tiles covering an extent into rectangles of at most chunk_size tiles."""
+    chunks = []
+    for z in range(min_zoom, max_zoom + 1):
+        x_range, y_range = get_tile_range(extent, z)
+        rows = min(len(y_range), chunk_size)
+        columns = max(chunk_size // rows, 1)
+        for x in range(x_range.start, x_range.stop, columns):
+            for y in range(y_range.start, y_range.stop, rows):
+                chunks.append(
+                    (z, x, min(x + columns, x_range.stop), y, min(y + rows, y_range.stop))
+                )
+    return chunks
+
+
+def record_seed_progress(result_id, seeded: int):
+    from geoinsight.core.models import TaskResult
+
+    # Chunks finish concurrently on different workers, so progress
+    # is accumulated under a row lock on the shared TaskResult
+    with transaction.atomic():
+        result = TaskResult.objects.select_for_update().filter(id=result_id).first()
+        if result is None:
+            return
+        progress = result.outputs
+        progress['seeded'] += seeded
+        progress['chunks_done'] += 1
+        result.outputs = progress
+        if progress['chunks_done'] >= progress['chunks']:
+            result.complete()
+        else:
+            result.write_status(f'Seeded {progress["seeded"]} of {progress["tiles"]} tiles...')
+
+
+@shared_task
+def seed_tile_chunk(data_type, data_id, chunk, raster_style=None, result_id=None):
+    from geoinsight.core.models import RasterData
+
+    raster_data = None
+    if data_type == 'raster':
+        raster_data = RasterData.objects.get(id=data_id)
+
+    z, x_start, x_end, y_start, y_end = chunk
+    seeded = 0
+    for x in range(x_start, x_end):
+        for y in range(y_start, y_end):
+            if raster_data is None:
+                load_vector_tile(data_id, z, x, y)
+            else:
+                try:
+                    load_raster_tile(
+                        raster_data,
+                        z,
+                        x,
+                        y,
+                        projection=DEFAULT_RASTER_PROJECTION,
+                        style=raster_style,
+                    )
+                except TileSourceXYZRangeError:
+                    continue
+            seeded += 1
+
+    if result_id is not None:
+        record_seed_progress(result_id, seeded)
+    return seeded
+
+
+@shared_task
+def seed_tiles(
+    vector_data_ids=None,
+    raster_data_ids=None,
+    min_zoom=0,
+    max_zoom=12,
+    raster_style=None,
+    result_id=None,
+    asynchronous=True,
+):
+    """
+    Populate the tile cache with the tiles covering each VectorData or RasterData.
+
+    Tiles are rendered in chunks, which are distributed across workers when asynchronous.
+    Raster tiles are rendered in Web Mercator, with raster_style if one is given.
+    """
+    from geoinsight.core.models import TaskResult
+
+    chunks = []
+    targets = [('vector', i) for i in vector_data_ids or []]
+    targets += [('raster', i) for i in raster_data_ids or []]
+    for data_type, data_id in targets:
+        extent = get_seed_extent(data_type, data_id)
+        if extent is not None:
+            chunks += [
+                (data_type, data_id, chunk) for chunk in get_seed_chunks(extent, min_zoom, max_zoom)
+            ]
+    tiles = sum(
+        (x_end - x_start) * (y_end - y_start)
+        for _, _, (_, x_start, x_end, y_start, y_end) in chunks
+    )
+
+    result = None
+    if result_id:
+        result = TaskResult.objects.filter(id=result_id).first()
+    if result is not None:
+        result.outputs = dict(tiles=tiles, chunks=len(chunks), seeded=0, chunks_done=0)
+        if not chunks:
+            result.complete()
+            return 0
+        result.write_status(f'Seeding {tiles} tiles...')
+
+    signatures = [
+        seed_tile_chunk.si(data_type, data_id, chunk, raster_style, result_id=result_id)
+        for data_type, data_id, chunk in chunks
+    ]
+    if asynchronous:
+        # There is no result backend, so chunks report their own
+        # progress and the last one to finish completes the result
+        group(signatures).apply_async()
+        return tiles
+    return sum(signature() for signature in signatures)
@@ -0,0 +1,244 @@
+from collections import defaultdict
+import math
+
+from django.db.models import Count, Max
+import geopandas
+import numpy
+from pyproj import CRS, Proj, Transformer
+from rasterio import features
+from rasterio.transform import from_bounds
+import shapely
+
+from geoinsight.core.tile_cache import get_tile_cache, get_zonal_stats_key
+
+from .raster import get_raster_source
+
+DEFAULT_PERCENTILES = [10, 50, 90]
+# Frames are read from a coarser overview when the zones cover more pixels than this
+MAX_ZONAL_PIXELS = 50_000_000
+EARTH_RADIUS_METERS = 6371008.8
+
+
+def get_zone_window(source, zone_bounds) -> dict | None:
+    """Return the pixel window of the raster covered by the zones, or None if they are disjoint."""
+    bounds = source.getMetadata()['sourceBounds']
+    pixel_width = (bounds['xmax'] - bounds['xmin']) / source.sizeX
+    pixel_height = (bounds['ymax'] - bounds['ymin']) / source.sizeY
+    left = max(0, math.floor((zone_bounds[0] - bounds['xmin']) / pixel_width))
+    right = min(source.sizeX, math.ceil((zone_bounds[2] - bounds['xmin']) / pixel_width))
+    top = max(0, math.floor((bounds['ymax'] - zone_bounds[3]) / pixel_height))
+    bottom = min(source.sizeY, math.ceil((bounds['ymax'] - zone_bounds[1]) / pixel_height))
+    if left >= right or top >= bottom:
+        return None
+    return dict(
+        left=left,
+        top=top,
+        width=right - left,
+        height=bottom - top,
+        units='base_pixels',
+        # The native extent of the window
+        xmin=bounds['xmin'] + left * pixel_width,
+        xmax=bounds['xmin'] + right * pixel_width,
+        ymin=bounds['ymax'] - bottom * pixel_height,
+        ymax=bounds['ymax'] - top * pixel_height,
+    )
+
+
+def get_row_areas(crs: CRS, window: dict, shape) -> numpy.ndarray:
+    """Return the area in square meters of a pixel in each row of the window."""
+    height, width = shape
+    if crs.is_geographic:
+        edges = numpy.radians(numpy.linspace(window['ymax'], window['ymin'], height + 1))
+        pixel_lon = math.radians((window['xmax'] - window['xmin']) / width)
+        return EARTH_RADIUS_METERS**2 * pixel_lon * numpy.abs(numpy.diff(numpy.sin(edges)))
+
+    unit = crs.axis_info[0].unit_conversion_factor if crs.axis_info else 1
+    pixel_area = (window['xmax'] - window['xmin']) / width * (window['ymax'] - window['ymin'])
+    map_areas = numpy.full(height, pixel_area / height * unit**2)
+    # Projections distort area, e.g. by sec²(latitude) in Web Mercator, so each row is
+    # divided by the areal scale factor at its center
+    pixel_height = (window['ymax'] - window['ymin']) / height
+    ys = window['ymax'] - (numpy.arange(height) + 0.5) * pixel_height
+    xs = numpy.full(height, (window['xmin'] + window['xmax']) / 2)
+    transformer = Transformer.from_crs(crs, crs.geodetic_crs, always_xy=True)
+    lons, lats = transformer.transform(xs, ys)
+    scales = Proj(crs).get_factors(lons, lats).areal_scale
+    scales = numpy.where(numpy.isfinite(scales) & (scales > 0), scales, 1.0)
+    return map_areas / scales
+
+
+def get_zone_layers(zones) -> list[list[int]]:
+    """
+    Group the indices of zones into layers in which no two zones overlap.
+
+    Each pixel of a rasterized layer has a single label, so overlapping zones are
+    rasterized in separate layers. Regions which only share borders need one layer.
+    """
+    geometries = numpy.asarray(zones.values)
+    left, right = zones.sindex.query(geometries, predicate='intersects')
+    pairs = left < right
+    left, right = left[pairs], right[pairs]
+    overlapping = ~shapely.touches(geometries[left], geometries[right])
+    neighbors = defaultdict(set)
+    for i, j in zip(left[overlapping], right[overlapping]):
+        neighbors[i].add(j)
+        neighbors[j].add(i)
+
+    layers = []
+    for i in range(len(geometries)):
+        for layer in layers:
+            if not neighbors[i] & layer:
+                layer.add(i)
+                break
+        else:
+            layers.append({i})
+    return [sorted(layer) for layer in layers]
+
+
+def rasterize_zones(geometries, window: dict, shape, indices=None) -> numpy.ndarray:
+    # Zones are labelled from 1 in the order of their geometries; 0 is outside of all zones
+    geometries = list(geometries)
+    if indices is None:
+        indices = range(len(geometries))
+    transform = from_bounds(
+        window['xmin'], window['ymin'], window['xmax'], window['ymax'], shape[1], shape[0]
+    )
+    return features.rasterize(
+        ((geometries[i], i + 1) for i in indices),
+        out_shape=shape,
+        transform=transform,
+        fill=0,
+        dtype='int32',
+    )
+
+
+def reduce_zones(
+    labels, data, zone_count: int, row_areas, threshold=None, percentiles=None, nodata=None
+) -> list[dict]:
+    """Aggregate the values of each zone with sorts and bincounts, rather than a loop per zone."""
+    percentiles = DEFAULT_PERCENTILES if percentiles is None else percentiles
+    valid = (labels > 0) & numpy.isfinite(data)
+    if nodata is not None:
+        valid &= data != nodata
+    zones = labels[valid]
+    values = data[valid].astype(numpy.float64)
+    areas = numpy.broadcast_to(row_areas[:, None], data.shape)[valid]
+
+    length = zone_count + 1
+    count = numpy.bincount(zones, minlength=length)
+    total = numpy.bincount(zones, weights=values, minlength=length)
+    area = numpy.bincount(zones, weights=areas, minlength=length)
+    if threshold is not None:
+        area_above = numpy.bincount(zones, weights=areas * (values > threshold), minlength=length)
+
+    # Sorting by zone, then value, puts each zone's values in one ascending run
+    sorted_values = values[numpy.lexsort((values, zones))]
+    starts = numpy.concatenate([[0], numpy.cumsum(count)[:-1]])
+    last = numpy.maximum(count - 1, 0)
+
+    def get_percentile(q):
+        position = starts + q / 100 * last
+        # Empty zones may start past the last value; their percentiles are not reported
+        lower = numpy.minimum(numpy.floor(position).astype(int), len(sorted_values) - 1)
+        upper = numpy.minimum(numpy.ceil(position).astype(int), len(sorted_values) - 1)
+        return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (
+            position - lower
+        )
+
+    results = []
+    zone_percentiles = {f'p{q:g}': get_percentile(q) for q in percentiles} if len(values) else {}
+    for zone in range(1, length):
+        if not count[zone]:
+            results.append(dict(count=0))
+            continue
+        stats = dict(
+            count=int(count[zone]),
+            area=float(area[zone]),
+            min=float(sorted_values[starts[zone]]),
+            max=float(sorted_values[starts[zone] + last[zone]]),
+            mean=float(total[zone] / count[zone]),
+            percentiles={key: float(value[zone]) for key, value in zone_percentiles.items()},
+        )
+        if threshold is not None:
+            stats['area_above_threshold'] = float(area_above[zone])
+        results.append(stats)
+    return results
+
+
+def get_zonal_stats(
+    raster_data, dataset, frames=None, band: int = 0, threshold=None, percentiles=None
+) -> list[dict]:
+    """
+    Summarize raster values within each region of a dataset, for each frame.
+
+    Zones are rasterized once onto the raster's grid and reused for every frame; regions
+    which overlap are rasterized separately, so each counts every pixel it covers.
+    Results are cached per raster, region dataset and frame.
+    """
+    frames = frames or [0]
+    percentiles = DEFAULT_PERCENTILES if percentiles is None else sorted(percentiles)
+    if any(not 0 <= q <= 100 for q in percentiles):
+        raise ValueError('Percentiles must be between 0 and 100.')
+    options = dict(band=band, threshold=threshold, percentiles=percentiles)
+    # Regions are never edited in place, so their count and latest id identify their contents
+    regions_version = dataset.regions.aggregate(count=Count('id'), latest=Max('id'))
+
+    results = {}
+    cache_keys = {}
+    for frame in frames:
+        cache_keys[frame] = get_zonal_stats_key(
+            raster_data.id, dataset.id, frame, dict(options, regions=regions_version)
+        )
+        cached = get_tile_cache().get(cache_keys[frame])
+        if cached is not None:
+            results[frame] = cached
+    missing = [frame for frame in frames if frame not in results]
+
+    if missing:
+        regions = list(dataset.regions.order_by('id').only('id', 'name', 'boundary'))
+        source = get_raster_source(raster_data)
+        metadata = source.getMetadata()
+        srs = metadata['sourceBounds']['srs']
+        nodata = metadata.get('bands', {}).get(band + 1, {}).get('nodata')
+        zones = geopandas.GeoSeries.from_wkb(
+            [bytes(region.boundary.wkb) for region in regions],
+            crs=regions[0].boundary.srid if regions else 4326,
+        ).to_crs(srs)
+        window = get_zone_window(source, zones.total_bounds) if regions else None
+        layers = get_zone_layers(zones) if window is not None else []
+
+        labels = None
+        for frame in missing:
+            zone_stats = [dict(count=0) for _ in regions]
+            if window is not None:
+                # Large windows are read from an overview, scaled to MAX_ZONAL_PIXELS
+                scale = max(1.0, math.sqrt(window['width'] * window['height'] / MAX_ZONAL_PIXELS))
+                output = dict(
+                    maxWidth=math.ceil(window['width'] / scale),
+                    maxHeight=math.ceil(window['height'] / scale),
+                )
+                pixel_region = {
+                    key: window[key] for key in ['left', 'top', 'width', 'height', 'units']
+                }
+                data, _ = source.getRegion(
+                    region=pixel_region, output=output, format='numpy', frame=frame
+                )
+                if not 0 <= band < data.shape[2]:
+                    raise ValueError(f'band must be between 0 and {data.shape[2] - 1}.')
+                data = data[:, :, band]
+                if labels is None or labels[0].shape != data.shape:
+                    labels = [rasterize_zones(zones, window, data.shape, layer) for layer in layers]
+                    row_areas = get_row_areas(CRS(srs), window, data.shape)
+                for layer, layer_labels in zip(layers, labels):
+                    layer_stats = reduce_zones(
+                        layer_labels, data, len(regions), row_areas, threshold, percentiles, nodata
+                    )
+                    for i in layer:
+                        zone_stats[i] = layer_stats[i]
+            results[frame] = [
+                dict(region=region.id, name=region.name, **stats)
+                for region, stats in zip(regions, zone_stats)
+            ]
+            get_tile_cache().set(cache_keys[frame], results[frame])
+
+    return [dict(frame=frame, zones=results[frame]) for frame in frames]
@@ -33,6 +33,7 @@ def test_rest_list_analysis_types(authenticated_api_client, project):
         'flood_network_failure',
         'network_recovery',
         'create_road_network',
+        'zonal_statistics',
     ],
 )
 @pytest.mark.django_db
@@ -0,0 +1,45 @@
+from pathlib import Path
+
+import pytest
+
+from geoinsight.core.blob_cache import (
+    evict_blobs,
+    get_blob_path,
+    get_blob_stats,
+    reset_blob_stats,
+)
+
+
+@pytest.mark.django_db
+def test_blob_cache(settings, tmp_path, vector_data):
+    settings.BLOB_CACHE_DIR = str(tmp_path)
+    reset_blob_stats()
+
+    data = vector_data.read_geojson_data()
+    assert len(data['features']) == 3
+    stats = get_blob_stats()
+    assert stats['blob_misses'] == 1
+    assert stats['blob_downloaded_bytes'] == vector_data.geojson_data.size
+
+    # Later reads use the local copy, which keeps the original file name
+    path = get_blob_path(vector_data.geojson_data)
+    assert path.parent.parent == tmp_path
+    assert path.name == Path(vector_data.geojson_data.name).name
+    assert vector_data.read_geojson_data() == data
+    stats = get_blob_stats()
+    assert stats['blob_hits'] == 2
+    assert stats['blob_count'] == 1
+
+    # Recently used blobs are kept until they have aged
+    assert evict_blobs(max_size=0) == 0
+    assert evict_blobs(max_size=0, min_age=0) == 1
+    assert not path.exists()
+    assert not list(tmp_path.glob('*.lock'))
+    assert get_blob_stats()['blob_evictions'] == 1
+
+    # Directories of downloads in progress are not evicted
+    partial_dir = tmp_path / 'partial'
+    partial_dir.mkdir()
+    (partial_dir / 'data.geojson.0.partial').write_bytes(b'{')
+    assert evict_blobs(max_size=0, min_age=0) == 0
+    assert partial_dir.exists()
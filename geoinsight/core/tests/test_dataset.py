@@ -1,7 +1,16 @@
+from datetime import timedelta
+
 from django.core.files.base import File
+from django.utils import timezone
 import pytest
 
+from geoinsight.core.models import TaskResult, VectorData
 from geoinsight.core.models.project import Dataset
+from geoinsight.core.tasks.dataset import (
+    record_conversion_progress,
+    reset_stale_conversions,
+    start_conversion_stage,
+)
 
 
 @pytest.mark.django_db
@@ -102,6 +111,9 @@ def test_rest_convert_dataset(
             layer_options=[dict(name='Multiframe Vector Test', frame_property='frame')],
             network_options=None,
             region_options=None,
+            seed_options=None,
+            archive_options=None,
+            mosaic_options=None,
         ),
         status='Initializing task...',
         outputs=None,
@@ -131,6 +143,78 @@ def test_rest_convert_dataset(
     assert len(serialized_frames) == 39
 
 
+@pytest.mark.django_db
+def test_incremental_conversion(file_item_factory, multiframe_vector_file):
+    with open(multiframe_vector_file['path'], 'rb') as f:
+        file_item = file_item_factory(
+            file=File(f),
+            name=multiframe_vector_file['name'],
+            file_type=multiframe_vector_file['file_type'],
+        )
+    dataset = file_item.dataset
+    layer_options = [dict(name='Multiframe Vector Test', frame_property='frame')]
+    dataset.spawn_conversion_task(layer_options=layer_options, asynchronous=False)
+    file_item.refresh_from_db()
+    assert len(file_item.content_hash) == 64
+    vector_data = VectorData.objects.get(dataset=dataset)
+    assert vector_data.conversion['processed']
+
+    # Only the layers change, so the converted data is kept
+    dataset.spawn_conversion_task(layer_options=None, asynchronous=False)
+    assert VectorData.objects.get(dataset=dataset).id == vector_data.id
+
+    # Data whose processing failed part way is processed again, without duplicating features
+    feature_count = vector_data.features.count()
+    VectorData.objects.filter(id=vector_data.id).update(
+        conversion=dict(vector_data.conversion, processed=False)
+    )
+    dataset.spawn_conversion_task(layer_options=None, asynchronous=False)
+    vector_data.refresh_from_db()
+    assert vector_data.conversion['processed']
+    assert vector_data.features.count() == feature_count
+
+    # A change to the file's metadata converts it again
+    file_item.metadata = dict(source='changed')
+    file_item.save()
+    dataset.spawn_conversion_task(layer_options=layer_options, asynchronous=False)
+    assert VectorData.objects.get(dataset=dataset).id != vector_data.id
+
+
+@pytest.mark.django_db
+def test_conversion_progress():
+    result = TaskResult.objects.create(name='Conversion', task_type='conversion')
+    start_conversion_stage(result.id, 'files', 2)
+    assert not record_conversion_progress(result.id, 'files')
+    assert record_conversion_progress(result.id, 'files', error='Conversion failed')
+
+    result.refresh_from_db()
+    assert result.outputs == dict(files=dict(total=2, done=2))
+    assert result.status == 'Converted 2 of 2 files...'
+    assert result.error == 'Conversion failed'
+
+
+@pytest.mark.django_db
+def test_reset_stale_conversions(dataset_factory):
+    running, lost = dataset_factory(processing=True), dataset_factory(processing=True)
+    results = {
+        dataset.id: TaskResult.objects.create(
+            name='Conversion', task_type='conversion', inputs=dict(dataset_id=dataset.id)
+        )
+        for dataset in [running, lost]
+    }
+    TaskResult.objects.filter(id=results[lost.id].id).update(
+        created=timezone.now() - timedelta(days=1)
+    )
+
+    assert reset_stale_conversions(timedelta(hours=1)) == [lost]
+    running.refresh_from_db()
+    lost.refresh_from_db()
+    assert running.processing
+    assert not lost.processing
+    results[lost.id].refresh_from_db()
+    assert results[lost.id].error == 'Conversion did not finish within 1:00:00.'
+
+
 @pytest.mark.django_db
 def test_dataset_set_owner(dataset, user):
     owner = dataset.owner()
@@ -0,0 +1,185 @@
+import io
+import json
+
+from django.core.management import call_command
+import pytest
+import shapely
+
+from geoinsight.core.models import VectorFeature
+from geoinsight.core.tasks.data import (
+    copy_vector_features,
+    create_vector_features,
+    get_feature_rows,
+    prepare_vector_features,
+)
+from geoinsight.core.tasks.geojson import (
+    get_geojson_projection,
+    iter_chunks,
+    iter_geojson_features,
+    write_feature_collection,
+)
+from geoinsight.core.tasks.summary import (
+    get_summary_output,
+    get_vector_summary,
+    merge_summaries,
+    summarize_features,
+)
+
+
+def test_iter_chunks():
+    assert list(iter_chunks(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(iter_chunks([], 2)) == []
+
+
+def test_write_feature_collection(tmp_path):
+    path = tmp_path / 'mercator.geojson'
+    path.write_text(
+        json.dumps(
+            dict(
+                type='FeatureCollection',
+                crs=dict(type='name', properties=dict(name='EPSG:3857')),
+                features=[
+                    dict(
+                        type='Feature',
+                        geometry=dict(type='Point', coordinates=[111319.49, 0]),
+                        properties=dict(name='a', value=1.5),
+                    )
+                ],
+            )
+        )
+    )
+    assert get_geojson_projection(path) == 'EPSG:3857'
+
+    output = io.BytesIO()
+    count = write_feature_collection(
+        [
+            dict(path=path, projection=get_geojson_projection(path)),
+            dict(features=[dict(type='Feature', geometry=None, properties={})]),
+        ],
+        output,
+    )
+    assert count == 2
+    data = json.loads(output.getvalue())
+    assert data['features'][0]['properties'] == dict(name='a', value=1.5)
+    assert data['features'][0]['geometry']['coordinates'] == pytest.approx([1, 0], abs=1e-6)
+    assert data['features'][1]['geometry'] is None
+
+    output_path = tmp_path / 'output.geojson'
+    output_path.write_bytes(output.getvalue())
+    assert list(iter_geojson_features(output_path)) == data['features']
+
+
+def test_get_feature_rows():
+    features = [
+        dict(geometry=dict(type='Point', coordinates=[1, 2, 3]), properties=dict(a=1)),
+        dict(geometry=None, properties=dict(a=2)),
+        dict(geometry=dict(type='LineString', coordinates=[[0, 0], [1, 1]]), properties=None),
+    ]
+    rows = list(get_feature_rows(features))
+    assert [properties for _, properties in rows] == [dict(a=1), {}]
+    point = shapely.from_wkb(rows[0][0])
+    assert shapely.get_srid(point) == 4326
+    assert not point.has_z
+
+
+@pytest.mark.django_db
+def test_create_vector_features(vector_data):
+    count = len(list(vector_data.iter_geojson_features()))
+    assert create_vector_features(vector_data) == count
+    assert VectorFeature.objects.filter(vector_data=vector_data).count() == count
+    assert not VectorFeature.objects.filter(vector_data=vector_data, geometry_3857=None).exists()
+    # Points are kept at every zoom level
+    features = VectorFeature.objects.filter(vector_data=vector_data)
+    assert all(f.geometry_z4 for f in features if f.geometry.geom_type == 'Point')
+    assert prepare_vector_features(vector_data, missing_only=True) == 0
+    # The summary is built while the features are loaded
+    assert vector_data.summary == get_vector_summary(vector_data.id)
+
+
+def test_merge_summaries():
+    first = dict(
+        feature_types=['Point'],
+        properties=dict(
+            height=dict(count=2, types=['int'], min=1.0, max=1.0, value_set=[1]),
+            kind=dict(count=1, types=['str'], min=None, max=None, value_set=['a']),
+        ),
+    )
+    second = dict(
+        feature_types=['LineString', 'Point'],
+        properties=dict(
+            height=dict(count=1, types=['float'], min=2.5, max=2.5, value_set=[2.5]),
+            kind=dict(count=3, types=['str'], min=None, max=None, value_set=['a', 'b', 'c', 'd']),
+        ),
+    )
+    output = get_summary_output(merge_summaries(first, second))
+    assert output['feature_types'] == ['Point', 'LineString']
+    assert output['properties']['height'] == dict(
+        count=3, types=['float', 'int'], range=[1.0, 2.5], sample_label='[1.0, 2.5]'
+    )
+    assert output['properties']['kind'] == dict(
+        count=4, types=['str'], value_set=['a', 'b', 'c', 'd'], sample_label='a, b, c...'
+    )
+    assert get_summary_output(None) == dict(feature_types=[], properties={})
+
+
+@pytest.mark.django_db
+def test_summarize_features(vector_data):
+    point = dict(type='Point', coordinates=[0, 0])
+    features = [
+        dict(geometry=point, properties=dict(height=1, tags=['a', 'b'], node_id=1)),
+        dict(geometry=point, properties=dict(height=3, tags='c', empty='', missing=None)),
+        dict(
+            geometry=dict(type='LineString', coordinates=[[0, 0], [1, 1]]),
+            properties=dict(height=2, tags=['a'], flag=True),
+        ),
+    ]
+    copy_vector_features(vector_data, get_feature_rows(features[:2]))
+    summary, last_id = summarize_features(vector_data.id)
+    copy_vector_features(vector_data, get_feature_rows(features[2:]))
+    partial, _ = summarize_features(vector_data.id, last_id)
+    assert partial['feature_types'] == ['LineString']
+
+    output = get_vector_summary(vector_data.id)
+    assert get_summary_output(merge_summaries(summary, partial)) == output
+    assert output['feature_types'] == ['Point', 'LineString']
+    assert set(output['properties']) == {'height', 'tags', 'flag'}
+    assert output['properties']['height'] == dict(
+        count=3, types=['int'], range=[1, 3], sample_label='[1, 3]'
+    )
+    assert output['properties']['tags']['count'] == 4
+    assert output['properties']['tags']['value_set'] == ['a', 'b', 'c']
+    assert output['properties']['flag']['types'] == ['bool']
+
+
+@pytest.mark.django_db
+def test_summarize_features_exact_values(vector_data):
+    point = dict(type='Point', coordinates=[0, 0])
+    features = [
+        dict(geometry=point, properties=dict(big=2**53 + 1, aliases=[])),
+        dict(geometry=point, properties=dict(big=2**60, aliases=[])),
+    ]
+    copy_vector_features(vector_data, get_feature_rows(features))
+    output = get_vector_summary(vector_data.id)
+    # Integers beyond the precision of a double keep their exact values
+    assert output['properties']['big']['range'] == [2**53 + 1, 2**60]
+    # Keys with only empty lists are recorded, without values
+    assert output['properties']['aliases'] == dict(count=0, types=[], value_set=[], sample_label='')
+
+
+@pytest.mark.django_db
+def test_backfill_geometry(vector_data):
+    create_vector_features(vector_data)
+    features = VectorFeature.objects.filter(vector_data=vector_data)
+    features.update(geometry_3857=None, geometry_z4=None, geometry_z7=None, geometry_z10=None)
+    version = vector_data.content_version
+
+    call_command('backfillgeometry', stdout=io.StringIO())
+    assert not features.filter(geometry_3857=None).exists()
+    vector_data.refresh_from_db()
+    assert vector_data.content_version == version + 1
+
+    # Data whose features are all projected is left alone, even where too small for z10
+    features.update(geometry_z10=None)
+    call_command('backfillgeometry', stdout=io.StringIO())
+    vector_data.refresh_from_db()
+    assert vector_data.content_version == version + 1
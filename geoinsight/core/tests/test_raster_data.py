@@ -0,0 +1,301 @@
+import io
+import math
+from pathlib import Path
+
+from django.contrib.gis.geos import Point
+from django.core.files.base import ContentFile
+import geopandas
+import numpy
+from pyproj import CRS, Transformer
+import pytest
+import rasterio
+from rasterio.windows import Window
+from shapely.geometry import box
+import zstandard
+
+from geoinsight.core.rest.renderers import encode_array
+from geoinsight.core.tasks.conversion import build_mosaic, copy_raster_blocks
+from geoinsight.core.tasks.raster import (
+    from_native_coordinates,
+    get_band_statistics,
+    get_raster_source,
+    get_raster_statistics,
+    sample_pixels,
+    to_native_coordinates,
+    to_pixel_coordinates,
+)
+from geoinsight.core.tasks.tiles import get_raster_tile_band, get_raster_tile_style
+from geoinsight.core.tasks.zonal_stats import get_row_areas, get_zone_layers, reduce_zones
+from geoinsight.core.tile_cache import get_stats, reset_stats
+
+
+@pytest.mark.django_db
+def test_get_image_data(raster_data):
+    full = raster_data.get_image_data()
+    coarse = raster_data.get_image_data(0.5)
+    assert 0 < len(coarse) <= math.ceil(len(full) / 2)
+    assert 0 < len(coarse[0]) <= math.ceil(len(full[0]) / 2)
+
+    with pytest.raises(ValueError):
+        raster_data.get_image_data(0)
+    with pytest.raises(ValueError):
+        raster_data.get_image_data(band=100)
+
+
+@pytest.mark.django_db
+def test_rest_raster_data(authenticated_api_client, project, user, raster_data):
+    project.set_collaborators([user])
+    project.datasets.set([raster_data.dataset])
+    url = f'/api/v1/rasters/{raster_data.id}/raster-data/0.1/'
+
+    resp = authenticated_api_client.get(url)
+    assert resp.status_code == 200
+    assert resp.json() == raster_data.get_image_data(0.1)
+
+    assert authenticated_api_client.get(url, {'bbox': '1,2,3'}).status_code == 400
+    assert authenticated_api_client.get(url, {'band': 'x'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_rest_raster_data_binary(authenticated_api_client, project, user, raster_data):
+    project.set_collaborators([user])
+    project.datasets.set([raster_data.dataset])
+    url = f'/api/v1/rasters/{raster_data.id}/raster-data/0.1/'
+    array = raster_data.read_image_array(0.1)
+
+    resp = authenticated_api_client.get(url, HTTP_ACCEPT='application/octet-stream')
+    assert resp.status_code == 200
+    assert resp['X-Array-Shape'] == ','.join(str(size) for size in array.shape)
+    data = numpy.frombuffer(resp.content, dtype=resp['X-Array-Dtype'])
+    assert numpy.array_equal(data.reshape(array.shape), array)
+
+    resp = authenticated_api_client.get(url, {'format': 'npy'})
+    assert resp['Content-Type'] == 'application/x-npy'
+    assert numpy.array_equal(numpy.load(io.BytesIO(resp.content)), array)
+
+    resp = authenticated_api_client.get(url, {'format': 'zstd'})
+    data = zstandard.ZstdDecompressor().decompress(resp.content)
+    assert data == encode_array(array, 'raw')
+    # Each representation has its own ETag
+    assert resp['ETag'] != authenticated_api_client.get(url)['ETag']
+
+
+def get_center_value(raster_data):
+    # Returns the center of the raster in EPSG:4326 and the value of the pixel there
+    source = get_raster_source(raster_data)
+    bounds = source.getMetadata()['sourceBounds']
+    xs, ys = from_native_coordinates(
+        source, [(bounds['xmin'] + bounds['xmax']) / 2], [(bounds['ymin'] + bounds['ymax']) / 2]
+    )
+    px, py = to_pixel_coordinates(source, *to_native_coordinates(source, xs, ys))
+    return [xs[0], ys[0]], float(raster_data.read_image_array()[py[0], px[0]])
+
+
+@pytest.mark.django_db
+def test_rest_raster_sample(
+    authenticated_api_client, project, user, raster_data, network_node_factory
+):
+    project.set_collaborators([user])
+    project.datasets.set([raster_data.dataset])
+    url = f'/api/v1/rasters/{raster_data.id}/sample/'
+
+    center, expected = get_center_value(raster_data)
+
+    resp = authenticated_api_client.post(url, {'points': [center]}, format='json')
+    assert resp.status_code == 200
+    assert resp.json()['points'] == [[pytest.approx(expected)]]
+
+    line = [center, [center[0] + 0.001, center[1]]]
+    resp = authenticated_api_client.post(url, {'lines': [line]}, format='json')
+    profile = resp.json()['lines'][0]
+    assert len(profile['coordinates']) == len(profile['values']) >= 2
+    assert profile['values'][0] == [pytest.approx(expected)]
+
+    node = network_node_factory(
+        network__vector_data__dataset=raster_data.dataset, location=Point(*center)
+    )
+    resp = authenticated_api_client.post(url, {'network': node.network.id}, format='json')
+    assert resp.json()['nodes'] == {str(node.id): [pytest.approx(expected)]}
+    # Networks without any of the requested nodes are reported as empty
+    data = {'network': node.network.id, 'nodes': [node.id + 1], 'points': [center]}
+    resp = authenticated_api_client.post(url, data, format='json')
+    assert resp.json()['nodes'] == {}
+    assert resp.json()['points'] == [[pytest.approx(expected)]]
+
+    assert authenticated_api_client.post(url, {}, format='json').status_code == 400
+    resp = authenticated_api_client.post(url, {'points': [center], 'band': 100}, format='json')
+    assert resp.status_code == 400
+
+
+@pytest.mark.django_db
+def test_sample_pixels_outside(raster_data):
+    source = get_raster_source(raster_data)
+    values = sample_pixels(source, numpy.array([-1, source.sizeX]), numpy.array([0, 0]))
+    assert numpy.isnan(values).all()
+
+
+@pytest.mark.django_db
+def test_get_raster_statistics(raster_data):
+    statistics = get_raster_statistics(get_raster_source(raster_data))
+    assert statistics['frames']
+    for band, overall in statistics['bands'].items():
+        stats = statistics['frames'][0]['bands'][band]
+        assert stats['count'] > 0
+        assert sum(stats['histogram']['counts']) == stats['count']
+        assert overall['min'] <= overall['range'][0] <= overall['range'][1] <= overall['max']
+
+
+def test_get_band_statistics():
+    stats = get_band_statistics(numpy.arange(101), bins=10)
+    assert stats['count'] == 101
+    assert stats['min'] == 0 and stats['max'] == 100
+    assert stats['mean'] == 50
+    assert stats['quantiles']['p25'] == 25
+    assert len(stats['histogram']['edges']) == 11
+    assert get_band_statistics(numpy.array([])) == dict(count=0)
+
+
+def test_copy_raster_blocks(tmp_path):
+    # Sources which large_image cannot open are usually organized in strips
+    striped_path = tmp_path / 'striped.tiff'
+    with rasterio.open(Path(__file__).parent / 'data' / 'sample_cog.tif') as sample:
+        profile = dict(sample.profile, tiled=False, blockysize=3)
+        profile.pop('blockxsize', None)
+        with rasterio.open(striped_path, 'w', **profile) as striped:
+            striped.write(sample.read())
+
+    output_path = tmp_path / 'output.tiff'
+    with rasterio.open(striped_path) as input_data:
+        assert input_data.block_shapes[0] == (3, input_data.width)
+        copy_raster_blocks(input_data, output_path)
+        with rasterio.open(output_path) as output_data:
+            assert output_data.count == input_data.count
+            assert output_data.dtypes == input_data.dtypes
+            assert output_data.nodata == input_data.nodata
+            assert output_data.crs == input_data.crs
+            assert (output_data.read() == input_data.read()).all()
+
+
+@pytest.mark.django_db
+def test_rest_raster_tile_cache(authenticated_api_client, project, user, raster_data):
+    project.set_collaborators([user])
+    project.datasets.set([raster_data.dataset])
+    url = f'/api/v1/rasters/{raster_data.id}/tiles/0/0/0.png/'
+    style = '{"band": 1, "palette": "viridis", "frame": 0}'
+    reset_stats()
+
+    assert authenticated_api_client.get(url, {'style': style}).status_code == 200
+    assert get_stats()['misses'] == 1
+    # The same styled frame, given as a separate parameter, is served from the cache
+    reordered = '{"palette": "viridis", "band": 1}'
+    assert authenticated_api_client.get(url, {'style': reordered, 'frame': 0}).status_code == 200
+    assert get_stats()['hits'] == 1
+    # Another style is rendered again
+    assert authenticated_api_client.get(url, {'style': '{"band": 1}'}).status_code == 200
+    assert get_stats()['misses'] == 2
+
+    # Replacing the COG bumps the content version, which changes the cache keys
+    with raster_data.cloud_optimized_geotiff.open('rb') as f:
+        raster_data.cloud_optimized_geotiff.save('replaced.tif', ContentFile(f.read()))
+    assert raster_data.content_version == 2
+    assert authenticated_api_client.get(url, {'style': style}).status_code == 200
+    assert get_stats()['misses'] == 3
+    assert authenticated_api_client.get(url, {'frame': 'x'}).status_code == 400
+
+
+def test_get_raster_tile_key_parts():
+    assert get_raster_tile_band(dict(band=2)) == '2'
+    assert get_raster_tile_band(dict(bands=[dict(band=1), dict(band=3)])) == '1,3'
+    assert get_raster_tile_band(None) is None
+    assert get_raster_tile_style(dict(band=1, frame=2), 2) == dict(band=1)
+    assert get_raster_tile_style(dict(band=1, frame=2), 3) == dict(band=1, frame=2)
+    assert get_raster_tile_style(dict(frame=0), 0) is None
+
+
+def test_build_mosaic(tmp_path):
+    # Split the sample raster into two halves, then mosaic them back together
+    paths = []
+    with rasterio.open(Path(__file__).parent / 'data' / 'sample_cog.tif') as input_data:
+        half = input_data.width // 2
+        windows = [
+            Window(0, 0, half, input_data.height),
+            Window(half, 0, input_data.width - half, input_data.height),
+        ]
+        for i, window in enumerate(windows):
+            profile = dict(
+                input_data.profile,
+                width=window.width,
+                height=window.height,
+                transform=input_data.window_transform(window),
+            )
+            paths.append(tmp_path / f'half_{i}.tif')
+            with rasterio.open(paths[-1], 'w', **profile) as output_data:
+                output_data.write(input_data.read(window=window))
+
+        with rasterio.open(build_mosaic(paths, tmp_path)) as mosaic:
+            assert (mosaic.width, mosaic.height) == (input_data.width, input_data.height)
+            assert mosaic.count == input_data.count
+            assert (mosaic.read() == input_data.read()).all()
+
+
+def test_get_row_areas():
+    # A pixel of 1 km² in Web Mercator covers about cos²(latitude) km² at Boston
+    x, y = Transformer.from_crs(4326, 3857, always_xy=True).transform(-71.06, 42.36)
+    window = dict(xmin=x - 500, xmax=x + 500, ymin=y - 500, ymax=y + 500)
+    areas = get_row_areas(CRS(3857), window, (1, 1))
+    assert areas[0] == pytest.approx(1e6 * math.cos(math.radians(42.36)) ** 2, rel=0.01)
+
+    # Areas in geographic and projected coordinates agree
+    window = dict(xmin=-71.07, xmax=-71.05, ymin=42.35, ymax=42.37)
+    geographic = get_row_areas(CRS(4326), window, (1, 1))
+    bounds = Transformer.from_crs(4326, 3857, always_xy=True).transform_bounds(
+        *[window[key] for key in ['xmin', 'ymin', 'xmax', 'ymax']]
+    )
+    window = dict(zip(['xmin', 'ymin', 'xmax', 'ymax'], bounds))
+    assert get_row_areas(CRS(3857), window, (1, 1))[0] == pytest.approx(geographic[0], rel=0.01)
+
+
+def test_get_zone_layers():
+    # Zones which only share a border are rasterized together, but overlapping ones are not
+    zones = geopandas.GeoSeries([box(0, 0, 1, 1), box(1, 0, 2, 1), box(0.5, 0, 1.5, 1)])
+    assert get_zone_layers(zones) == [[0, 1], [2]]
+
+
+def test_reduce_zones():
+    labels = numpy.array([[1, 1, 2], [1, 0, 2], [3, 3, 2]])
+    data = numpy.array([[1.0, 2.0, 5.0], [3.0, 9.0, numpy.nan], [-1.0, -1.0, 7.0]])
+    stats = reduce_zones(
+        labels, data, 4, numpy.full(3, 10.0), threshold=2.5, percentiles=[50], nodata=-1.0
+    )
+    assert stats[0] == dict(
+        count=3,
+        area=30.0,
+        min=1.0,
+        max=3.0,
+        mean=2.0,
+        percentiles={'p50': 2.0},
+        area_above_threshold=10.0,
+    )
+    # NaN and nodata values are excluded
+    assert stats[1]['count'] == 2
+    assert stats[1]['percentiles'] == {'p50': 6.0}
+    assert stats[2] == dict(count=0)
+    assert stats[3] == dict(count=0)
+
+
+@pytest.mark.django_db
+def test_rest_raster_time_series(authenticated_api_client, project, user, raster_data):
+    project.set_collaborators([user])
+    project.datasets.set([raster_data.dataset])
+    url = f'/api/v1/rasters/{raster_data.id}/time-series/'
+    center, expected = get_center_value(raster_data)
+
+    resp = authenticated_api_client.post(url, {'points': [center, center]}, format='json')
+    assert resp.status_code == 200
+    # Every frame of the raster is returned by default
+    assert resp.json() == {
+        'frames': [0],
+        'series': [[pytest.approx(expected)], [pytest.approx(expected)]],
+    }
+    resp = authenticated_api_client.post(url, {'lines': [[center, center]]}, format='json')
+    assert resp.status_code == 400
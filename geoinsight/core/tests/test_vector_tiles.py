@@ -0,0 +1,309 @@
+import json
+import os
+
+import pytest
+
+from geoinsight.core.models import FilterConfig, TaskResult
+from geoinsight.core.tasks.data import create_vector_features
+from geoinsight.core.tasks.tile_archive import read_archived_tile, write_tile_archive
+from geoinsight.core.tasks.tiles import (
+    get_cluster_options,
+    get_fields,
+    get_filter_clause,
+    get_geometry_column,
+    get_seed_chunks,
+    get_tile_range,
+    seed_tiles,
+)
+from geoinsight.core.tile_cache import LRUFileBasedCache, get_stats, reset_stats
+
+
+@pytest.mark.django_db
+def test_rest_vector_tile_cache(authenticated_api_client, project, user, vector_data):
+    project.set_collaborators([user])
+    project.datasets.set([vector_data.dataset])
+    create_vector_features(vector_data)
+    reset_stats()
+    url = f'/api/v1/vectors/{vector_data.id}/tiles/0/0/0/'
+
+    resp = authenticated_api_client.get(url)
+    assert resp.status_code == 200
+    tile = resp.content
+    assert get_stats()['misses'] == 1
+
+    resp = authenticated_api_client.get(url)
+    assert resp.status_code == 200
+    assert resp.content == tile
+    assert get_stats()['hits'] == 1
+
+    # Filters are part of the cache key
+    resp = authenticated_api_client.get(url, {'prop0': 'value0'})
+    assert get_stats()['misses'] == 2
+
+    # Rebuilding features invalidates cached tiles
+    create_vector_features(vector_data)
+    resp = authenticated_api_client.get(url)
+    assert resp.status_code == 200
+    assert get_stats()['misses'] == 3
+
+
+def test_lru_file_based_cache(tmp_path):
+    cache = LRUFileBasedCache(
+        str(tmp_path), {'OPTIONS': {'MAX_SIZE': 25000, 'CULL_INTERVAL': 3600}}
+    )
+    for i, key in enumerate(['a', 'b', 'c']):
+        cache.set(key, os.urandom(10000))
+        os.utime(cache._key_to_file(key), (i, i))
+    # Writes within the cull interval do not cull, so the cache may briefly exceed its size
+    assert all(cache.has_key(key) for key in ['a', 'b', 'c'])
+
+    cache.get('a')
+    assert cache.cull_to_size() == 1
+    assert not cache.has_key('b')
+    assert cache.has_key('a') and cache.has_key('c')
+
+
+def test_get_tile_range():
+    x_range, y_range = get_tile_range((-180, -90, 180, 90), 2)
+    assert list(x_range) == [0, 1, 2, 3]
+    assert list(y_range) == [0, 1, 2, 3]
+
+    # Boston
+    x_range, y_range = get_tile_range((-71.06, 42.36, -71.06, 42.36), 10)
+    assert list(x_range) == [309]
+    assert list(y_range) == [378]
+
+
+@pytest.mark.django_db
+def test_rest_vector_tile_filters(authenticated_api_client, project, user, vector_data):
+    project.set_collaborators([user])
+    project.datasets.set([vector_data.dataset])
+    create_vector_features(vector_data)
+    url = f'/api/v1/vectors/{vector_data.id}/tiles/0/0/0/'
+
+    assert authenticated_api_client.get(url, {'prop0': 'value0'}).status_code == 200
+    assert authenticated_api_client.get(url, {'prop0__in': 'other,value0'}).status_code == 200
+    assert authenticated_api_client.get(url, {'prop0': 'other'}).status_code == 204
+    assert authenticated_api_client.get(url, {'prop1__gte': 'abc'}).status_code == 400
+
+
+def test_get_filter_clause():
+    clause, params = get_filter_clause({'frame': '3', 'a.b__in': 'x,y', 'depth__lt': '0.5'})
+    assert '%(filter_0)s' in clause
+    assert params == {
+        'filter_0': '{"frame": "3"}',
+        'filter_1': '{"frame": 3}',
+        'filter_2': '{"a": {"b": "x"}}',
+        'filter_3': '{"a": {"b": "y"}}',
+        'filter_4': '$."depth" < 0.5',
+    }
+
+
+def test_get_geometry_column():
+    assert get_geometry_column(0) == 'geometry_z4'
+    assert get_geometry_column('7') == 'geometry_z7'
+    assert get_geometry_column(8) == 'geometry_z10'
+    assert get_geometry_column(11) == 'geometry_3857'
+
+
+def test_get_seed_chunks():
+    chunks = get_seed_chunks((-180, -90, 180, 90), 0, 4, chunk_size=16)
+    assert chunks[:3] == [(0, 0, 1, 0, 1), (1, 0, 2, 0, 2), (2, 0, 4, 0, 4)]
+    # 8x8 tiles at zoom 3 and 16x16 tiles at zoom 4, split into chunks of 16 tiles
+    assert len(chunks) == 3 + 4 + 16
+    assert sum((c[2] - c[1]) * (c[4] - c[3]) for c in chunks) == 1 + 4 + 16 + 64 + 256
+
+
+@pytest.mark.django_db
+def test_seed_tiles(authenticated_api_client, project, user, vector_data):
+    project.set_collaborators([user])
+    project.datasets.set([vector_data.dataset])
+    create_vector_features(vector_data)
+    result = TaskResult.objects.create(name='Tile seeding', task_type='seeding')
+    tiles = seed_tiles(vector_data_ids=[vector_data.id], max_zoom=2, result_id=result.id)
+    assert tiles > 0
+
+    result.refresh_from_db()
+    assert result.completed is not None
+    assert result.outputs['seeded'] == tiles
+
+    # Seeded tiles are served from the cache
+    reset_stats()
+    resp = authenticated_api_client.get(f'/api/v1/vectors/{vector_data.id}/tiles/0/0/0/')
+    assert resp.status_code == 200
+    assert get_stats() == {'hits': 1, 'misses': 0, 'hit_rate': 1.0}
+
+
+@pytest.mark.django_db
+def test_rest_composite_vector_tile(
+    authenticated_api_client, project, user, vector_data, vector_data_factory
+):
+    project.set_collaborators([user])
+    project.datasets.set([vector_data.dataset])
+    create_vector_features(vector_data)
+    url = '/api/v1/vectors/tiles/0/0/0/'
+
+    layers = [
+        {'id': vector_data.id, 'name': 'all'},
+        {'id': vector_data.id, 'name': 'filtered', 'filters': {'prop0': 'value0'}},
+    ]
+    resp = authenticated_api_client.get(url, {'layers': json.dumps(layers)})
+    assert resp.status_code == 200
+    assert b'all' in resp.content
+    assert b'filtered' in resp.content
+
+    # Every layer is subject to the same permission checks as the single layer endpoint
+    other = vector_data_factory()
+    create_vector_features(other)
+    layers = json.dumps([vector_data.id, other.id])
+    assert authenticated_api_client.get(url, {'layers': layers}).status_code == 404
+
+    assert authenticated_api_client.get(url, {'layers': '{}'}).status_code == 400
+    layers = json.dumps([vector_data.id, vector_data.id])
+    assert authenticated_api_client.get(url, {'layers': layers}).status_code == 400
+
+
+def test_get_cluster_options():
+    assert get_cluster_options(None, 2) is None
+    assert get_cluster_options({'zoom': '8'}, 8) is None
+    assert get_cluster_options({'zoom': '8', 'property': 'load'}, 7) == {
+        'zoom': 8,
+        'method': 'grid',
+        'property': 'load',
+    }
+    with pytest.raises(ValueError):
+        get_cluster_options({'zoom': '8', 'method': 'other'}, 7)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('method', ['grid', 'kmeans'])
+def test_rest_clustered_vector_tile(authenticated_api_client, project, user, vector_data, method):
+    project.set_collaborators([user])
+    project.datasets.set([vector_data.dataset])
+    create_vector_features(vector_data)
+    url = f'/api/v1/vectors/{vector_data.id}/tiles/0/0/0/'
+
+    resp = authenticated_api_client.get(
+        url, {'cluster_zoom': 4, 'cluster_method': method, 'cluster_property': 'prop1'}
+    )
+    assert resp.status_code == 200
+    assert b'point_count' in resp.content
+    # Clustering parameters are not applied as property filters
+    assert b'value0' in resp.content
+
+    assert authenticated_api_client.get(url, {'cluster_zoom': 'x'}).status_code == 400
+
+
+def test_get_fields():
+    assert get_fields(None) is None
+    assert get_fields('') == []
+    assert get_fields('b,a.x,a.y') == ['a', 'b']
+
+
+@pytest.mark.django_db
+def test_rest_vector_tile_fields(authenticated_api_client, project, user, vector_data):
+    project.set_collaborators([user])
+    project.datasets.set([vector_data.dataset])
+    create_vector_features(vector_data)
+    url = f'/api/v1/vectors/{vector_data.id}/tiles/0/0/0/'
+
+    resp = authenticated_api_client.get(url)
+    assert b'prop1' in resp.content
+    resp = authenticated_api_client.get(url, {'fields': 'prop0'})
+    assert resp.status_code == 200
+    assert b'prop0' in resp.content
+    assert b'prop1' not in resp.content
+
+    # The full properties of a feature are available by its id
+    feature = vector_data.features.filter(properties__has_key='prop1').first()
+    resp = authenticated_api_client.get(f'/api/v1/vectors/{vector_data.id}/features/{feature.id}/')
+    assert resp.status_code == 200
+    assert resp.json() == feature.properties
+
+
+@pytest.mark.django_db
+def test_rest_vector_tile_style_fields(
+    authenticated_api_client, project, user, vector_data, layer_frame_factory, layer_style_factory
+):
+    project.set_collaborators([user])
+    project.datasets.set([vector_data.dataset])
+    create_vector_features(vector_data)
+    frame = layer_frame_factory(vector=vector_data, raster=None)
+    style = layer_style_factory(layer=frame.layer, project=project)
+    FilterConfig.objects.create(style=style, filter_by='prop0')
+    frame.layer.default_style = style
+    frame.layer.save()
+    url = f'/api/v1/vectors/{vector_data.id}/tiles/0/0/0/'
+
+    # The web client requests the properties of the selected style, like the default style
+    for params in [{'style': 'default'}, {'fields': ','.join(vector_data.get_style_fields())}]:
+        resp = authenticated_api_client.get(url, params)
+        assert resp.status_code == 200
+        assert b'prop0' in resp.content
+        assert b'prop1' not in resp.content
+
+
+@pytest.mark.django_db
+def test_tile_archive(
+    authenticated_api_client, project, user, vector_data, django_assert_num_queries
+):
+    project.set_collaborators([user])
+    project.datasets.set([vector_data.dataset])
+    create_vector_features(vector_data)
+    url = f'/api/v1/vectors/{vector_data.id}/tiles/0/0/0/'
+    tile = authenticated_api_client.get(url).content
+
+    assert write_tile_archive(vector_data, max_zoom=2) > 0
+    vector_data.refresh_from_db()
+    assert vector_data.tile_archive
+    # The archive's name and zoom range are cached, so reading tiles does not query for them
+    with django_assert_num_queries(0):
+        assert read_archived_tile(vector_data.id, 0, 0, 0) == tile
+    # Zoom levels outside of the archive are built from the database
+    assert read_archived_tile(vector_data.id, 3, 0, 0) is None
+
+    # Rebuilding features removes the stale archive
+    create_vector_features(vector_data)
+    vector_data.refresh_from_db()
+    assert not vector_data.tile_archive
+
+
+@pytest.mark.django_db
+def test_rest_vector_tile_etag(authenticated_api_client, project, user, vector_data):
+    project.set_collaborators([user])
+    project.datasets.set([vector_data.dataset])
+    create_vector_features(vector_data)
+    url = f'/api/v1/vectors/{vector_data.id}/tiles/0/0/0/'
+
+    resp = authenticated_api_client.get(url)
+    etag = resp['ETag']
+    assert 'no-cache' in resp['Cache-Control']
+    resp = authenticated_api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == 304
+
+    # URLs with the current content version may be cached indefinitely
+    resp = authenticated_api_client.get(url, {'v': vector_data.content_version})
+    assert resp.status_code == 200
+    assert 'immutable' in resp['Cache-Control']
+
+    # Rebuilding features bumps the content version
+    create_vector_features(vector_data)
+    resp = authenticated_api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == 200
+    assert resp['ETag'] != etag
+
+    # Styles select properties outside the URL, so styled tiles are always revalidated
+    resp = authenticated_api_client.get(url, {'style': 'default', 'v': vector_data.content_version})
+    assert resp['ETag'] != authenticated_api_client.get(url)['ETag']
+    assert 'no-cache' in resp['Cache-Control']
+
+
+@pytest.mark.django_db
+def test_rest_vector_tile_permissions(authenticated_api_client, vector_data):
+    create_vector_features(vector_data)
+    # Tiles of data outside the user's projects are not found, whatever the ETag
+    url = f'/api/v1/vectors/{vector_data.id}/tiles/0/0/0/'
+    resp = authenticated_api_client.get(url, HTTP_IF_NONE_MATCH='*')
+    assert resp.status_code == 404
+    resp = authenticated_api_client.get('/api/v1/vectors/0/tiles/0/0/0/')
+    assert resp.status_code == 404
@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+
+TILE_CACHE_ALIAS = 'tiles'
+# Counters are kept apart from the tiles, in a cache with atomic increments
+STATS_CACHE_ALIAS = 'stats'
+STAT_KEYS = ['hits', 'misses']
+
+
+# Defaults for the size bound of LRUFileBasedCache and how often it is enforced
+DEFAULT_MAX_SIZE = 1024**3
+DEFAULT_CULL_INTERVAL = 60
+# When each cache directory was last culled by this process
+_last_culls = {}
+
+
+class LRUFileBasedCache(FileBasedCache):
+    """
+    A file-based cache bounded by the total size of its files, in the MAX_SIZE option,
+    which evicts the least recently read entries first.
+
+    Listing the cache directory takes time linear in the number of entries, so rather
+    than on every write, each process culls at most once every CULL_INTERVAL seconds.
+    """
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        options = params.get('OPTIONS', {})
+        self._max_size = int(options.get('MAX_SIZE', DEFAULT_MAX_SIZE))
+        self._cull_interval = float(options.get('CULL_INTERVAL', DEFAULT_CULL_INTERVAL))
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, default=default, version=version)
+        if value is not default:
+            # Record the read in the file modification time, used for eviction
+            try:
+                os.utime(self._key_to_file(key, version))
+            except FileNotFoundError:
+                pass
+        return value
+
+    def _cull(self):
+        # Called before every write by set and add
+        now = time.monotonic()
+        last_cull = _last_culls.get(self._dir)
+        if last_cull is not None and now - last_cull < self._cull_interval:
+            return
+        _last_culls[self._dir] = now
+        self.cull_to_size()
+
+    def cull_to_size(self, max_size: int | None = None) -> int:
+        """Delete the least recently read entries if the cache is larger than max_size bytes."""
+        if max_size is None:
+            max_size = self._max_size
+        entries = []
+        for fname in self._list_cache_files():
+            try:
+                stat = os.stat(fname)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, fname))
+        total_size = sum(size for _, size, _ in entries)
+        if total_size <= max_size:
+            return 0
+
+        # Cull a fraction below the limit, so the next write does not need another cull
+        target_size = max_size - max_size // self._cull_frequency if self._cull_frequency else 0
+        culled = 0
+        for _, size, fname in sorted(entries):
+            if total_size <= target_size:
+                break
+            if self._delete(fname):
+                total_size -= size
+                culled += 1
+        return culled
+
+
+def get_tile_cache():
+    return caches[TILE_CACHE_ALIAS]
+
+
+def get_stats_cache():
+    return caches[STATS_CACHE_ALIAS]
+
+
+def normalize_filters(filters: dict | None = None) -> str:
+    if not filters:
+        return ''
+    normalized = json.dumps({str(k): str(v) for k, v in filters.items()}, sort_keys=True)
+    return hashlib.md5(normalized.encode(), usedforsecurity=False).hexdigest()
+
+
+def get_data_version(data_type: str, data_id) -> str:
+    # If the version token has been evicted, a new one is issued,
+    # which orphans any tiles that were cached under the old token
+    cache = get_tile_cache()
+    key = f'version:{data_type}:{data_id}'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_tiles(data_type: str, data_id):
+    get_tile_cache().set(f'version:{data_type}:{data_id}', uuid.uuid4().hex, timeout=None)
+
+
+def get_vector_tile_key(
+    vector_data_id, z, x, y, filters: dict | None = None, options: dict | None = None
+) -> str:
+    version = get_data_version('vector', vector_data_id)
+    key = f'vector:{vector_data_id}:{version}:{z}/{x}/{y}:{normalize_filters(filters)}'
+    if options:
+        key += f':{normalize_filters(options)}'
+    return key
+
+
+def get_composite_vector_tile_key(layers: list[dict], z, x, y) -> str:
+    # The key covers the version of every layer, so it changes when any of them is rebuilt
+    layer_keys = [
+        [
+            layer['name'],
+            layer['id'],
+            get_data_version('vector', layer['id']),
+            normalize_filters(layer.get('filters')),
+            layer.get('fields'),
+        ]
+        for layer in layers
+    ]
+    layers_hash = hashlib.md5(json.dumps(layer_keys).encode(), usedforsecurity=False).hexdigest()
+    return f'composite:{layers_hash}:{z}/{x}/{y}'
+
+
+def get_style_hash(style: dict | None = None) -> str:
+    # Canonical JSON, so equivalent styles share a hash whatever their key order
+    if not style:
+        return ''
+    normalized = json.dumps(style, sort_keys=True, separators=(',', ':'))
+    return hashlib.md5(normalized.encode(), usedforsecurity=False).hexdigest()
+
+
+def get_raster_tile_key(
+    raster_data_id,
+    content_version,
+    z,
+    x,
+    y,
+    frame=None,
+    band=None,
+    style: dict | None = None,
+    options: dict | None = None,
+) -> str:
+    version = get_data_version('raster', raster_data_id)
+    key = f'raster:{raster_data_id}:{version}:{content_version}'
+    key += f':{"" if frame is None else frame}:{"" if band is None else band}'
+    return f'{key}:{get_style_hash(style)}:{z}/{x}/{y}:{normalize_filters(options)}'
+
+
+def get_zonal_stats_key(raster_data_id, dataset_id, frame, options: dict | None = None) -> str:
+    version = get_data_version('raster', raster_data_id)
+    return f'zonal:{raster_data_id}:{version}:{dataset_id}:{frame}:{normalize_filters(options)}'
+
+
+def increment_stat(stat: str, amount: int = 1):
+    # Counters are shared by all web and celery processes
+    cache = get_stats_cache()
+    key = f'stats:{stat}'
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        # The counter was evicted between add and incr
+        pass
+
+
+def get_stat(stat: str) -> int:
+    return get_stats_cache().get(f'stats:{stat}', 0)
+
+
+def get_cached_tile(key: str) -> bytes | None:
+    tile = get_tile_cache().get(key)
+    increment_stat('misses' if tile is None else 'hits')
+    return tile
+
+
+def cache_tile(key: str, tile: bytes):
+    get_tile_cache().set(key, tile)
+
+
+def get_stats() -> dict:
+    stats = {stat: get_stat(stat) for stat in STAT_KEYS}
+    total = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / total if total else None
+    return stats
+
+
+def reset_stats():
+    get_stats_cache().delete_many([f'stats:{stat}' for stat in STAT_KEYS])
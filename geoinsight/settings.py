@@ -3,6 +3,7 @@ from __future__ import annotations
 import os
 from pathlib import Path
 import ssl
+import tempfile
 
 from composed_configuration import (
     ComposedConfiguration,
@@ -57,6 +58,59 @@ class GeoInsightMixin(ConfigMixin):
         }
     }
 
+    # Generated map tiles are cached on local disk by default, bounded by the total size of
+    # the cached files; set DJANGO_TILE_CACHE_BACKEND=redis to share the tile cache between
+    # hosts. The Redis server also holds the celery and channels data, which must not be
+    # evicted, so Redis tiles are only removed by their TTL, DJANGO_TILE_CACHE_TIMEOUT seconds,
+    # and memory grows with the tiles requested within that time. DJANGO_TILE_CACHE_REDIS_URL
+    # may instead point at a dedicated Redis server, with maxmemory and an allkeys-lru
+    # maxmemory-policy to bound it by size.
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'tiles': (
+            {
+                'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                # Use /2 for tiles, as /0 is used by celery and /1 by channels
+                'LOCATION': os.environ.get(
+                    'DJANGO_TILE_CACHE_REDIS_URL', f'{os.environ["REDIS_URL"]}/2'
+                ),
+                'TIMEOUT': int(os.environ.get('DJANGO_TILE_CACHE_TIMEOUT', 60 * 60 * 24 * 7)),
+            }
+            if os.environ.get('DJANGO_TILE_CACHE_BACKEND') == 'redis'
+            else {
+                'BACKEND': 'geoinsight.core.tile_cache.LRUFileBasedCache',
+                'LOCATION': os.environ.get(
+                    'DJANGO_TILE_CACHE_DIR', str(Path(tempfile.gettempdir(), 'geoinsight_tiles'))
+                ),
+                'TIMEOUT': None,
+                'OPTIONS': {
+                    'MAX_SIZE': int(os.environ.get('DJANGO_TILE_CACHE_MAX_SIZE', 1024**3)),
+                    'CULL_INTERVAL': 60,
+                    'CULL_FREQUENCY': 10,
+                },
+            }
+        ),
+        # Tile and blob cache hit counters, incremented atomically on every read
+        'stats': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            # Use /3 for counters, as /0 is used by celery, /1 by channels and /2 by tiles
+            'LOCATION': f'{os.environ["REDIS_URL"]}/3',
+            'TIMEOUT': None,
+        },
+    }
+
+    # Local copies of stored files (e.g. COGs and GeoJSON), shared by the web and celery
+    # processes on a host and evicted least recently used first once over the size limit
+    BLOB_CACHE_DIR = values.Value(str(Path(tempfile.gettempdir(), 'geoinsight_blobs')))
+    BLOB_CACHE_MAX_SIZE = values.IntegerValue(10 * 1024**3)
+
+    # Threads used by GDAL when converting rasters, where 0 uses every CPU,
+    # and the size in megabytes of GDAL's block cache during conversion
+    CONVERSION_THREADS = values.IntegerValue(0)
+    CONVERSION_GDAL_CACHEMAX = values.IntegerValue(512)
+
     # https://github.com/girder/large_image_wheels#geodjango
     GDAL_LIBRARY_PATH = osgeo.GDAL_LIBRARY_PATH
     GEOS_LIBRARY_PATH = osgeo.GEOS_LIBRARY_PATH
@@ -66,6 +120,7 @@ class GeoInsightMixin(ConfigMixin):
     ENABLE_TASK_NETWORK_RECOVERY = values.BooleanValue(True)
     ENABLE_TASK_GEOAI_SEGMENTATION = values.BooleanValue(True)
     ENABLE_TASK_CREATE_ROAD_NETWORK = values.BooleanValue(True)
+    ENABLE_TASK_ZONAL_STATISTICS = values.BooleanValue(True)
 
     @staticmethod
     def mutate_configuration(configuration: ComposedConfiguration) -> None:
@@ -102,6 +157,23 @@ class TestingConfiguration(GeoInsightMixin, TestingBaseConfiguration):
     CELERY_TASK_EAGER_PROPAGATES = True
     CELERY_TASK_ALWAYS_EAGER = True
 
+    # Keep cached tiles in memory, so they don't outlive the test database
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'tiles': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'tiles',
+            'TIMEOUT': None,
+        },
+        'stats': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'stats',
+            'TIMEOUT': None,
+        },
+    }
+
 
 class ProductionConfiguration(GeoInsightMixin, ProductionBaseConfiguration):
     pass
@@ -13,8 +13,8 @@ from geoinsight.core.models import (
     NetworkNode,
     Region,
     VectorData,
-    VectorFeature,
 )
+from geoinsight.core.tasks.data import get_feature_rows, load_vector_features
 from geoinsight.core.tasks.networks import create_vector_features_from_network
 
 from .interpret_network import interpret_group
@@ -61,17 +61,8 @@ def create_vector_features(dataset, service_name=None, **kwargs):
     VectorData.objects.filter(dataset=dataset).delete()
     vector_data = VectorData.objects.create(dataset=dataset, name=dataset.name)
     feature_sets = fetch_vector_features(service_name=service_name)
-    vector_features = []
-    for _, feature_set in feature_sets.items():
-        for feature in feature_set:
-            vector_features.append(
-                VectorFeature(
-                    vector_data=vector_data,
-                    geometry=GEOSGeometry(json.dumps(feature['geometry'])),
-                    properties=feature['properties'],
-                )
-            )
-    VectorFeature.objects.bulk_create(vector_features)
+    features = (feature for feature_set in feature_sets.values() for feature in feature_set)
+    load_vector_features(vector_data, get_feature_rows(features))
 
 
 def download_all_deduped_vector_features(**kwargs):
@@ -51,9 +51,11 @@ setup(
         'djangorestframework==3.15.2',
         'django-large-image==0.10.2',
         'drf-yasg==1.21.11',
+        'filelock==3.16.1',  # for the blob cache
         # gdal 3.10 is the newest supported by Django:
         # https://docs.djangoproject.com/en/5.2/ref/contrib/gis/install/geolibs/
         'gdal==3.10.*',
+        'ijson==3.3.0',  # for streaming GeoJSON conversion
         'large-image[gdal]==1.33.3',
         'large-image-converter==1.33.3',
         'matplotlib==3.9.2',  # for raster colormaps
@@ -66,6 +68,7 @@ setup(
         'rasterio==1.3.10',
         'urllib3==1.26.15',
         'webcolors==24.6.0',
+        'zstandard==0.23.0',  # for compressed raster data responses
         # Production only
         'django-composed-configuration[prod]==0.25.0',
         'django-s3-file-field[s3]==1.0.1',
@@ -175,6 +175,13 @@ export async function getVectorSummary(vectorId: number): Promise<VectorSummary>
   return (await apiClient.get(`vectors/${vectorId}/summary/`)).data;
 }
 
+export async function getVectorFeatureProperties(
+  vectorId: number,
+  featureId: number,
+): Promise<Record<string, any>> {
+  return (await apiClient.get(`vectors/${vectorId}/features/${featureId}/`)).data;
+}
+
 export async function getRasterDataValues(rasterId: number): Promise<RasterDataValues> {
   const resolution = 0.1;
   const data = (
@@ -16,12 +16,16 @@ import {
   Map, MapLayerMouseEvent,
   Popup, Source,
   LayerSpecification, VectorSourceSpecification,
+  VectorTileSource,
 } from "maplibre-gl";
 import { getRasterDataValues } from '@/api/rest';
 import { baseURL } from '@/api/auth';
 import proj4 from 'proj4';
 import { useStyleStore, useLayerStore } from '.';
 
+// Properties which identify network features, used to style networks
+const NETWORK_PROPERTIES = ['node_id', 'edge_id', 'from_node_id', 'to_node_id'];
+
 function getLayerIsVisible(layer: MapLibreLayerWithMetadata) {
   // Since visibility must be 'visible' for a feature click to even be registered,
   // we know that if it's not multiFrame, then it is indeed visible
@@ -414,11 +418,44 @@ export const useMapStore = defineStore('map', () => {
     rasterTooltipDataCache.value[raster.id] = data;
   }
 
+  function getVectorTileURL(vector: VectorData, sourceId: string): string {
+    // Tiles only carry the properties read by the selected style, the frame filters
+    // and networks; the tooltip fetches the full properties of a clicked feature
+    const { layerId, layerCopyId, frameId } = parseSourceString(sourceId);
+    const fields = new Set(NETWORK_PROPERTIES);
+    const styleSpec = styleStore.selectedLayerStyles[`${layerId}.${layerCopyId}`]?.style_spec;
+    styleSpec?.colors.forEach((c) => {
+      if (c.colormap?.color_by) fields.add(c.colormap.color_by);
+    });
+    styleSpec?.sizes.forEach((s) => {
+      if (s.size_range?.size_by) fields.add(s.size_range.size_by);
+    });
+    styleSpec?.filters.forEach((f) => fields.add(f.filter_by));
+    const { frame } = layerStore.getDBObjectsForSourceID(sourceId);
+    if (frame?.id === frameId && frame.source_filters) {
+      Object.keys(frame.source_filters).forEach((k) => fields.add(k));
+    }
+    const query = new URLSearchParams({
+      v: `${vector.content_version}`,
+      fields: [...fields].sort().join(','),
+    });
+    return `${baseURL}vectors/${vector.id}/tiles/{z}/{x}/{y}/?${query}`;
+  }
+
+  function updateVectorTileURL(sourceId: string) {
+    // Reloads the tiles of a source when its style reads different properties
+    const source = getMap().getSource(sourceId) as VectorTileSource | undefined;
+    const { vector } = layerStore.getDBObjectsForSourceID(sourceId);
+    if (!source || !vector) return;
+    const url = getVectorTileURL(vector, sourceId);
+    if (source.tiles?.[0] !== url) source.setTiles([url]);
+  }
+
   function createVectorTileSource(vector: VectorData, sourceId: string, multiFrame: boolean): Source | undefined {
     const map = getMap();
     map.addSource(sourceId, {
       type: "vector",
-      tiles: [`${baseURL}vectors/${vector.id}/tiles/{z}/{x}/{y}/`],
+      tiles: [getVectorTileURL(vector, sourceId)],
     });
     const source = map.getSource(sourceId);
     if (source) {
@@ -430,7 +467,10 @@ export const useMapStore = defineStore('map', () => {
   function createRasterTileSource(raster: RasterData, sourceId: string, multiFrame: boolean): Source | undefined {
     const map = getMap();
 
-    const queryParams: { projection: string, style?: string } = { projection: 'epsg:3857' }
+    const queryParams: { projection: string, style?: string, v: string } = {
+      projection: 'epsg:3857',
+      v: `${raster.content_version}`,
+    }
     const { layerId, layerCopyId } = parseSourceString(sourceId);
     const styleSpec = styleStore.selectedLayerStyles[`${layerId}.${layerCopyId}`].style_spec;
     let filters: StyleFilter[] = []
@@ -518,6 +558,7 @@ export const useMapStore = defineStore('map', () => {
     createVectorFeatureMapLayers,
     createRasterFeatureMapLayers,
     createVectorTileSource,
+    updateVectorTileURL,
     createRasterTileSource,
     addLayerFrameToMap,
     cacheRasterData,
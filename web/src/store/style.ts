@@ -308,9 +308,13 @@ export const useStyleStore = defineStore('style', () => {
         let range: [number, number] | undefined;
         let absMin: number | undefined, absMax: number | undefined;
         if (raster) {
-            Object.values(raster.metadata.bands).forEach(({ min, max }) => {
-                if (!absMin || min < absMin) absMin = min;
-                if (!absMax || max < absMax) absMax = max;
+            // Prefer the range computed at conversion, which leaves out outliers
+            const ranges = raster.metadata.statistics
+                ? Object.values(raster.metadata.statistics.bands).map(({ range }) => range)
+                : Object.values(raster.metadata.bands).map(({ min, max }) => [min, max])
+            ranges.forEach(([min, max]) => {
+                if (absMin === undefined || min < absMin) absMin = min;
+                if (absMax === undefined || max > absMax) absMax = max;
             })
         }
         if (absMin !== undefined && absMax !== undefined) {
@@ -360,6 +364,9 @@ export const useStyleStore = defineStore('style', () => {
                             currentFrame.vector,
                         );
                     }
+                    if (currentFrame.vector) {
+                        mapStore.updateVectorTileURL(map.getLayer(mapLayerId)!.source);
+                    }
                 } else {
                     map.setLayoutProperty(mapLayerId, 'visibility', 'none');
                 }
@@ -438,7 +445,9 @@ export const useStyleStore = defineStore('style', () => {
             const sourceURL = mapStore.rasterSourceTileURLs[mapLayer.source]
             if (source && sourceURL) {
                 const oldQuery = new URLSearchParams(sourceURL.split('?')[1])
-                const newQueryParams: { projection: string, style?: string } = { projection: 'epsg:3857' }
+                const newQueryParams: { projection: string, v?: string, style?: string } = { projection: 'epsg:3857' }
+                const version = oldQuery.get('v')
+                if (version) newQueryParams.v = version
                 if (rasterTilesQuery) newQueryParams.style = JSON.stringify(rasterTilesQuery)
                 const newQuery = new URLSearchParams(newQueryParams)
                 if (newQuery.toString() !== oldQuery.toString()) {
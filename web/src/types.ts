@@ -131,7 +131,7 @@ export interface VectorData {
   file_size: number;
   summary?: VectorSummary,
   metadata?: Record<string, any>;
-
+  content_version: number;
 }
 
 export interface RasterData {
@@ -142,6 +142,7 @@ export interface RasterData {
   source_file: null | number;
   file_size: number;
   metadata: RasterMetadata;
+  content_version: number;
 }
 
 export interface RasterMetadata {
@@ -191,6 +192,24 @@ export interface RasterMetadata {
   tileHeight: number;
   source_filenames: string[];
   uploaded: string;
+  statistics?: RasterStatistics;
+}
+
+export interface RasterBandStatistics {
+  count: number;
+  min?: number;
+  max?: number;
+  mean?: number;
+  stdev?: number;
+  histogram?: {edges: number[]; counts: number[]};
+  quantiles?: Record<string, number>;
+}
+
+export interface RasterStatistics {
+  sample_size: number;
+  // Extremes of each band over all frames, and a range suited to colormaps
+  bands: Record<number, {min: number; max: number; range: [number, number]}>;
+  frames: {frame: number; bands: Record<number, RasterBandStatistics>}[];
 }
 
 export interface RasterDataValues {